@@ -0,0 +1,89 @@
+"""
+Import-time report for the Klaus entry point.
+
+Runs `python -X importtime -c "import main"` from src/klaus in a fresh interpreter and prints
+the slowest modules and packages. Exits with 1 when the import goes over `--budget-ms` or pulls
+in one of the `--forbid` modules, so it can gate CI:
+
+    python scripts/import_report.py --budget-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from typing import Dict, List, NamedTuple
+
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "klaus")
+# Loaded on first use only; a cold start (e.g. /check-message) must not import them
+DEFAULT_FORBIDDEN = ["chromadb", "google.genai", "googleapiclient", "dateparser", "rapidfuzz"]
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def measure(module: str = "main", cwd: str = SOURCE_DIR) -> List[ImportTime]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        stripped = name.lstrip()
+        times.append(ImportTime(stripped, int(self_us), int(cumulative_us), (len(name) - len(stripped) - 1) // 2))
+    return times
+
+
+def by_package(times: List[ImportTime]) -> Dict[str, int]:
+    packages: Dict[str, int] = {}
+    for entry in times:
+        package = entry.module.split(".")[0]
+        packages[package] = packages.get(package, 0) + entry.self_us
+    return packages
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Report (and budget) the import time of a Klaus module.")
+    parser.add_argument("--module", default="main", help="module to import from src/klaus (default: main)")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "0")), help="fail above this total (0 disables)")
+    parser.add_argument("--forbid", nargs="*", default=DEFAULT_FORBIDDEN, help="modules that must not be imported")
+    parser.add_argument("--top", type=int, default=15, help="rows per table (default: 15)")
+    args = parser.parse_args(argv)
+
+    times = measure(args.module)
+    total_us = next((t.cumulative_us for t in reversed(times) if t.module == args.module), sum(t.self_us for t in times))
+
+    if args.top:
+        print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for entry in sorted(times, key=lambda t: t.cumulative_us, reverse=True)[:args.top]:
+            print(f"{entry.cumulative_us / 1000:>14.1f} {entry.self_us / 1000:>9.1f}  {'  ' * entry.depth}{entry.module}")
+        print(f"\n{'self ms':>14}  package")
+        for package, self_us in sorted(by_package(times).items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"{self_us / 1000:>14.1f}  {package}")
+    print(f"\nimport {args.module}: {total_us / 1000:.1f}ms, {len(times)} modules")
+
+    failures = []
+    imported = {t.module for t in times}
+    for forbidden in args.forbid:
+        if any(name == forbidden or name.startswith(forbidden + ".") for name in imported):
+            failures.append(f"{forbidden} is imported at startup")
+    if args.budget_ms and total_us / 1000 > args.budget_ms:
+        failures.append(f"{total_us / 1000:.1f}ms is over the {args.budget_ms:.0f}ms budget")
+    for failure in failures:
+        print(f"❌ [ERROR] {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
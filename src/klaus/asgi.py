@@ -0,0 +1,170 @@
+import asyncio
+import os
+import pytz
+import logging
+
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pydantic import ValidationError
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from auth.auth_handler import authenticate_request_async, handle_google_auth_async
+from data.client import close_async_firestore_clients
+from externals import transport
+from handlers.ai_assistant import interpret_user_message
+from handlers.general import handle_get_message
+from handlers.router import route_intent_async, stream_intent_async, sse_event
+from schemas import ChatRequest
+
+
+# Async counterpart of main.py with the same routes and payloads:
+#   uvicorn asgi:app --port 8080   (from src/klaus)
+# Firestore, Gemini, Habitica and the OAuth endpoints are awaited on the event loop, so a worker keeps
+# serving other requests while one waits on the network. Clients that only have a blocking API
+# (Chroma, Google Calendar, the Firestore list transactions) run in worker threads.
+
+# Constants
+TIMEZONE = pytz.timezone(os.getenv("TIMEZONE", "America/Sao_Paulo"))
+
+# Logging configuration
+_ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
+logging.basicConfig(level=logging.DEBUG if _ENVIRONMENT == "dev" else logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def _read_chat_request(request: Request):
+    # ChatRequest from the JSON body, or the 400 response to send back
+    try:
+        json_data = await request.json()
+    except ValueError:
+        json_data = None
+    try:
+        body = ChatRequest(**(json_data if isinstance(json_data, dict) else {}))
+    except ValidationError as err:
+        logger.error(f"❌ [ERROR] Bad request: {err}")
+        return None, PlainTextResponse(f"Bad Request: {err}", 400)
+    if not body.text:
+        return None, PlainTextResponse("Bad Request: No text provided", 400)
+    return body, None
+
+
+async def webhook(request: Request) -> Response:
+    logger.debug(f"▶️ {datetime.now(TIMEZONE).strftime('%H:%M:%S')} - webhook() -> {request.url.path}")
+
+    response_code, user = await authenticate_request_async(request.headers.get("Authorization", ""))
+    if not user or response_code != 200:
+        return PlainTextResponse("Unauthorized user", response_code)
+
+    body, error = await _read_chat_request(request)
+    if error:
+        return error
+
+    try:
+        message = interpret_user_message(body.text)
+        response = await route_intent_async(user, body.text, message)
+        return JSONResponse({
+            "response": response,
+            "intent": message.get("type"),
+            "date": datetime.now(TIMEZONE).isoformat()
+        })
+    except Exception as e:
+        logger.error(f"❌ [ERROR] General exception: {e}")
+        return PlainTextResponse(f"Error: {e}", 500)
+
+
+async def stream(request: Request) -> Response:
+    logger.debug(f"▶️ {datetime.now(TIMEZONE).strftime('%H:%M:%S')} - stream() -> {request.url.path}")
+
+    response_code, user = await authenticate_request_async(request.headers.get("Authorization", ""))
+    if not user or response_code != 200:
+        return PlainTextResponse("Unauthorized user", response_code)
+
+    body, error = await _read_chat_request(request)
+    if error:
+        return error
+    user_message = body.text
+
+    async def events():
+        intent = None
+        try:
+            message = interpret_user_message(user_message)
+            intent = message.get("type")
+            chunks = stream_intent_async(user, user_message, message)
+            if chunks is None:
+                response = await route_intent_async(user, user_message, message)
+            else:
+                parts = []
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    yield sse_event("delta", {"text": chunk})
+                response = "".join(parts)
+            yield sse_event("done", {"response": response, "intent": intent, "date": datetime.now(TIMEZONE).isoformat()})
+        except Exception as e:
+            logger.error(f"❌ [ERROR] General exception while streaming: {e}")
+            yield sse_event("error", {"error": str(e), "intent": intent})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+async def check_message(request: Request) -> Response:
+    response_code, user = await authenticate_request_async(request.headers.get("Authorization", ""))
+    if not user or response_code != 200 or not getattr(user, "chat_id", None):
+        return PlainTextResponse("Unauthorized user", 401)
+
+    message = await asyncio.to_thread(handle_get_message, user.chat_id)
+    if message:
+        logger.debug(f"▶️ {datetime.now(TIMEZONE).strftime('%H:%M:%S')} - Found pending message: ({message['id']}) {message['text']})")
+        return JSONResponse({
+            "response": message["text"],
+            "intent": "agent_message",
+            "date": message["created_at"]
+        })
+
+    return Response(status_code=204)
+
+
+async def google_auth(request: Request) -> Response:
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    content, status = await handle_google_auth_async(body if isinstance(body, dict) else {})
+    if isinstance(content, dict):
+        return JSONResponse(content, status)
+    return PlainTextResponse(content, status)
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    yield
+    # Async clients are bound to this loop, so they are closed here rather than at exit
+    await transport.aclose_async_client()
+    close_async_firestore_clients()
+
+
+def create_app() -> Starlette:
+    middleware = [
+        Middleware(
+            CORSMiddleware,
+            allow_origins=[os.getenv("CORS_ALLOW_ORIGIN", "http://localhost:8081")],
+            allow_credentials=True,
+            allow_headers=["Content-Type", "Authorization"],
+            allow_methods=["GET", "POST", "OPTIONS"]
+        )
+    ]
+    routes = [
+        Route("/", webhook, methods=["POST"]),
+        Route("/stream", stream, methods=["POST"]),
+        Route("/check-message", check_message, methods=["GET"]),
+        Route("/auth/google", google_auth, methods=["POST"])
+    ]
+    return Starlette(debug=(_ENVIRONMENT == "dev"), routes=routes, middleware=middleware, lifespan=lifespan)
+
+
+app = create_app()
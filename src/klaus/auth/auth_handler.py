@@ -1,45 +1,90 @@
+import asyncio
 import os
-import requests
+import re
 import base64
+import hashlib
 import logging
+import threading
+import time
 
-from data.user import get_user_doc, save_user
+from cache import TTLCache
+from data.user import get_user_doc, get_user_doc_async, save_user
 from schemas import User
 from schemas import AuthCodeRequest
 from auth.credentials import extract_email_from_token, sanitize_id
+from externals import transport
 
 from datetime import datetime, timezone
 from google.oauth2 import id_token as google_id_token
-from google.auth.transport import requests as google_requests
 from flask import jsonify
 from pydantic import ValidationError
-from typing import Any, Dict, Tuple, Union
+from typing import Any, Dict, Optional, Tuple, Union
 from flask import Request
 
 
 TOKEN_URI = "https://oauth2.googleapis.com/token"
+CACHE_MAX_AGE = re.compile(r"max-age=(\d+)")
 
 
 # logging configuration
 _ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
-logging.basicConfig(level=logging.DEBUG if _ENVIRONMENT == "dev" else logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def _refresh_id_token(chat_id: str) -> str:
-    user = get_user_doc(chat_id)
+class _CachedCertsRequest:
+    """
+    google.auth transport that keeps GET responses (Google's signing certs) for the
+    Cache-Control max-age the server sends, so verification doesn't refetch them.
+    Requests go through the pooled session of the current process, resolved on every call.
+    """
+
+    def __init__(self):
+        self._responses = {}
+        self._lock = threading.Lock()
+
+
+    def __call__(self, url, method="GET", body=None, headers=None, **kwargs):
+        request = transport.google_auth_request()
+        if method != "GET":
+            return request(url, method=method, body=body, headers=headers, **kwargs)
+
+        with self._lock:
+            cached = self._responses.get(url)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        response = request(url, method=method, body=body, headers=headers, **kwargs)
+        max_age = CACHE_MAX_AGE.search(response.headers.get("Cache-Control", "") or "")
+        if response.status == 200 and max_age:
+            with self._lock:
+                self._responses[url] = (time.monotonic() + int(max_age.group(1)), response)
+        return response
+
+
+_certs_request = _CachedCertsRequest()
+
+# Verified claims keyed by token hash, kept until the token expires
+_id_info_cache = TTLCache(int(os.getenv("ID_TOKEN_CACHE_SIZE", "1024")), ttl=0)
+
+
+def _refresh_token_data(user: Optional[User]) -> Dict[str, Any]:
     if user is None:
         raise Exception("User not found. Please login at the front-end.")
     refresh_token = getattr(user, "refresh_token", None)
     if not refresh_token:
         raise Exception("Unauthorized. Please login at the front-end.")
 
-    resp = requests.post(TOKEN_URI, data={
+    return {
         "client_id": os.getenv("GOOGLE_CLIENT_ID"),
         "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
         "refresh_token": refresh_token,
         "grant_type": "refresh_token"
-    }, headers={"Content-Type": "application/x-www-form-urlencoded"})
+    }
+
+
+def _refresh_id_token(chat_id: str) -> str:
+    data = _refresh_token_data(get_user_doc(chat_id))
+    resp = transport.post(TOKEN_URI, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"})
 
     if resp.status_code != 200:
         raise Exception(f"Error renewing token: {resp.text}")
@@ -47,6 +92,39 @@ def _refresh_id_token(chat_id: str) -> str:
     return resp.json()["id_token"]
 
 
+async def _refresh_id_token_async(chat_id: str) -> str:
+    data = _refresh_token_data(await get_user_doc_async(chat_id))
+    resp = await transport.apost(TOKEN_URI, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"})
+
+    if resp.status_code != 200:
+        raise Exception(f"Error renewing token: {resp.text}")
+
+    return resp.json()["id_token"]
+
+
+def _check_id_info(idinfo, id_token_str: str) -> Tuple[int, Optional[str]]:
+    # Claim checks shared by both authenticate_request flavours: (status, chat_id)
+    if not idinfo:
+        logger.error(f"❌ [ERROR] Invalid ID token: {id_token_str}")
+        return 401, None
+    
+    email = idinfo.get("email")
+    if not idinfo.get("email_verified"):
+        logger.error(f"❌ [ERROR] Email not verified: {email}")
+        return 403, None 
+
+    allowed = os.getenv("ALLOWED_EMAILS", "").split(",")
+    if email not in allowed:
+        logger.critical(f"❌ [CRITICAL] Unauthorized email: {email}")
+        return 403, None
+    
+    chat_id = sanitize_id(email)
+    if not chat_id:
+        logger.error(f"❌ [ERROR] Invalid chat_id: {chat_id}")
+        return 401, None
+    return 200, chat_id
+
+
 def authenticate_request(auth_header) -> Tuple[int, Union[None, "User"]]:
     if not auth_header.startswith("Bearer "):
         logger.error(f"❌ [ERROR] Invalid authorization header: {auth_header}")
@@ -65,27 +143,42 @@ def authenticate_request(auth_header) -> Tuple[int, Union[None, "User"]]:
         except Exception as refresh_error:
             logger.error(f"❌ [ERROR] Refresh token has failed: {refresh_error}")
             return 401, None
-        
-    if not idinfo:
-        logger.error(f"❌ [ERROR] Invalid ID token: {id_token_str}")
-        return 401, None
-    
-    email = idinfo.get("email")
-    if not idinfo.get("email_verified"):
-        logger.error(f"❌ [ERROR] Email not verified: {email}")
-        return 403, None 
 
-    allowed = os.getenv("ALLOWED_EMAILS", "").split(",")
-    if email not in allowed:
-        logger.critical(f"❌ [CRITICAL] Unauthorized email: {email}")
-        return 403, None
+    status, chat_id = _check_id_info(idinfo, id_token_str)
+    if status != 200:
+        return status, None
+
+    user = get_user_doc(chat_id)
+    if not user:
+        return 404, None
     
-    chat_id = sanitize_id(email)
-    if not chat_id:
-        logger.error(f"❌ [ERROR] Invalid chat_id: {chat_id}")
+    return 200, user
+
+
+async def authenticate_request_async(auth_header) -> Tuple[int, Union[None, "User"]]:
+    if not auth_header.startswith("Bearer "):
+        logger.error(f"❌ [ERROR] Invalid authorization header: {auth_header}")
         return 401, None
 
-    user = get_user_doc(chat_id)
+    id_token_str = auth_header.split(" ", 1)[1]
+    idinfo = None
+    try:
+        idinfo = await get_id_info_async(id_token_str)
+    except Exception as e:
+        try:
+            email_guess = extract_email_from_token(id_token_str)
+            chat_id = sanitize_id(email_guess)
+            id_token_str = await _refresh_id_token_async(chat_id)
+            idinfo = await get_id_info_async(id_token_str)
+        except Exception as refresh_error:
+            logger.error(f"❌ [ERROR] Refresh token has failed: {refresh_error}")
+            return 401, None
+
+    status, chat_id = _check_id_info(idinfo, id_token_str)
+    if status != 200:
+        return status, None
+
+    user = await get_user_doc_async(chat_id)
     if not user:
         return 404, None
     
@@ -108,58 +201,115 @@ def handle_google_auth(request):
     
     body = request.get_json(silent=True) or {}
     try:
-        auth_req = AuthCodeRequest(**body)
+        data = _authorization_code_data(body)
     except ValidationError as err:
         return (f"Bad Request: {err}", 400, headers)
-    code = auth_req.code
-
-    data = {
-        "client_id":     os.getenv("GOOGLE_CLIENT_ID"),
-        "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-        "code":          code,
-        "grant_type":    "authorization_code",
-        "redirect_uri":  os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8081")
-    }
 
-    resp = requests.post(
+    resp = transport.post(
         TOKEN_URI,
         data=data,
         headers={"Content-Type": "application/x-www-form-urlencoded"}
     )
-
     if resp.status_code != 200:
-        if resp.status_code in (400, 401):
-            return ("Invalid authorization code", 401, headers)
-        return ("Bad Gateway: error fetching tokens", 502, headers)
+        return (*_token_error(resp.status_code), headers)
 
     tokens = resp.json()
-    idtok   = tokens["id_token"]
-    refresh = tokens.get("refresh_token")
-    if not refresh:
+    if not tokens.get("refresh_token"):
         return ("No refresh token returned", 502, headers)
 
     try:
-        idinfo = get_id_info(idtok)
+        idinfo = get_id_info(tokens["id_token"])
     except Exception as e:
         logger.error(f"❌ [ERROR] Invalid ID token: {e}")
         return ("Invalid ID token", 401, headers)
 
+    user, payload = _user_from_tokens(tokens, idinfo)
+    save_user(user)
+
+    return (jsonify(payload), 200, headers)
+
+
+async def handle_google_auth_async(body: Dict[str, Any]) -> Tuple[Union[str, Dict[str, Any]], int]:
+    # POST body of /auth/google -> (text or JSON payload, status); CORS is left to the ASGI middleware
+    try:
+        data = _authorization_code_data(body)
+    except ValidationError as err:
+        return (f"Bad Request: {err}", 400)
+
+    resp = await transport.apost(
+        TOKEN_URI,
+        data=data,
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    if resp.status_code != 200:
+        return _token_error(resp.status_code)
+
+    tokens = resp.json()
+    if not tokens.get("refresh_token"):
+        return ("No refresh token returned", 502)
+
+    try:
+        idinfo = await get_id_info_async(tokens["id_token"])
+    except Exception as e:
+        logger.error(f"❌ [ERROR] Invalid ID token: {e}")
+        return ("Invalid ID token", 401)
+
+    user, payload = _user_from_tokens(tokens, idinfo)
+    await asyncio.to_thread(save_user, user)
+
+    return (payload, 200)
+
+
+def _authorization_code_data(body: Dict[str, Any]) -> Dict[str, Any]:
+    auth_req = AuthCodeRequest(**body)
+    return {
+        "client_id":     os.getenv("GOOGLE_CLIENT_ID"),
+        "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
+        "code":          auth_req.code,
+        "grant_type":    "authorization_code",
+        "redirect_uri":  os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8081")
+    }
+
+
+def _token_error(status_code: int) -> Tuple[str, int]:
+    if status_code in (400, 401):
+        return ("Invalid authorization code", 401)
+    return ("Bad Gateway: error fetching tokens", 502)
+
+
+def _user_from_tokens(tokens: Dict[str, Any], idinfo) -> Tuple[User, Dict[str, Any]]:
+    # (user to save, response payload)
     user = User(
         chat_id=base64.urlsafe_b64encode(idinfo["email"].encode("utf-8")).decode("ascii").rstrip("="),
         email=idinfo.get("email"),
         name=idinfo.get("name"),
-        refresh_token=refresh
+        refresh_token=tokens["refresh_token"]
     )
-    save_user(user)
-
-    return (jsonify({"idToken": idtok, "email": idinfo.get("email"), "name": idinfo.get("name")}), 200, headers)
+    return user, {"idToken": tokens["id_token"], "email": idinfo.get("email"), "name": idinfo.get("name")}
 
 
 def get_id_info(id_token_str):
+    token_hash = hashlib.sha256(id_token_str.encode("utf-8")).hexdigest()
+    idinfo = _id_info_cache.get(token_hash)
+    if idinfo is not None:
+        return dict(idinfo)
+
+    clock_skew = 10 if _ENVIRONMENT == "dev" else 0
     idinfo = google_id_token.verify_oauth2_token(
         id_token_str,
-        google_requests.Request(),
+        _certs_request,
         os.getenv("GOOGLE_CLIENT_ID"),
-        clock_skew_in_seconds=10 if _ENVIRONMENT == "dev" else 0
+        clock_skew_in_seconds=clock_skew
     )
-    return idinfo
\ No newline at end of file
+    ttl = idinfo.get("exp", 0) - clock_skew - time.time()
+    if ttl > 0:
+        _id_info_cache.set(token_hash, dict(idinfo), ttl)
+    return idinfo
+
+
+async def get_id_info_async(id_token_str):
+    # Cache hits stay on the loop; verifying a new token (certs fetch + RSA check) runs in a thread
+    idinfo = _id_info_cache.get(hashlib.sha256(id_token_str.encode("utf-8")).hexdigest())
+    if idinfo is not None:
+        return dict(idinfo)
+    return await asyncio.to_thread(get_id_info, id_token_str)
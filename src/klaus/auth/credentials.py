@@ -1,14 +1,30 @@
 import base64
 import os
 import jwt
+import logging
+import threading
 
+from cache import LRUCache
 from data.user import get_user_doc, save_user
 
+from datetime import datetime, timedelta, timezone
 from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
+from externals.transport import google_auth_request
+from typing import Optional, Tuple
 
 
 TOKEN_URI = "https://oauth2.googleapis.com/token"
+# google-auth treats tokens as expired 3m45s before expiry, so the margin must stay above that
+ACCESS_TOKEN_EXPIRY_MARGIN_SECONDS = float(os.getenv("ACCESS_TOKEN_EXPIRY_MARGIN_SECONDS", "300"))
+ACCESS_TOKEN_REFRESH_AHEAD_SECONDS = float(os.getenv("ACCESS_TOKEN_REFRESH_AHEAD_SECONDS", "600"))
+
+# logging configuration
+logger = logging.getLogger(__name__)
+
+# Access tokens per (chat_id, scopes) as (token, naive UTC expiry), like google-auth keeps them
+_access_tokens = LRUCache(int(os.getenv("ACCESS_TOKEN_CACHE_SIZE", "1024")))
+# Bounded like the tokens; evicting a lock mid-refresh at worst lets a second refresh run
+_refresh_locks = LRUCache(int(os.getenv("ACCESS_TOKEN_CACHE_SIZE", "1024")))
 
 
 def sanitize_id(raw: str) -> str:
@@ -25,26 +41,88 @@ def extract_email_from_token(token: str) -> str:
 
 
 
-def load_credentials(chat_id: str, scopes: list[str]) -> Credentials:
-    user = get_user_doc(chat_id)
-    if not user:
-        raise Exception("User not authorized. Please login at the front-end.")
-    refresh = getattr(user, "refresh_token", None)
-    if not refresh:
-        raise Exception("No refresh token found. Please re-authorize.")
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
-    creds = Credentials(
-        token=None,
-        refresh_token=refresh,
+
+def _seconds_left(cached: Optional[Tuple[str, datetime]]) -> float:
+    if not cached:
+        return 0
+    return (cached[1] - _utcnow()).total_seconds()
+
+
+def _refresh_lock(key: Tuple[str, Tuple[str, ...]]) -> threading.Lock:
+    return _refresh_locks.get_or_create(key, threading.Lock)
+
+
+def _new_credentials(refresh_token: str, scopes: list[str], token: Optional[str] = None, expiry: Optional[datetime] = None) -> Credentials:
+    return Credentials(
+        token=token,
+        expiry=expiry,
+        refresh_token=refresh_token,
         token_uri=TOKEN_URI,
         client_id=os.getenv("GOOGLE_CLIENT_ID"),
         client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
         scopes=scopes,
     )
-    if creds.expired or not creds.valid:
-        creds.refresh(Request())
+
+
+def _refresh_access_token(chat_id: str, scopes: list[str], min_seconds_left: float) -> Tuple[str, datetime]:
+    # Single flight: concurrent callers for the same user wait for one refresh and share its token
+    key = (chat_id, tuple(sorted(scopes)))
+    with _refresh_lock(key):
+        cached = _access_tokens.get(key)
+        if _seconds_left(cached) > min_seconds_left:
+            return cached
+
+        user = get_user_doc(chat_id)
+        if not user:
+            raise Exception("User not authorized. Please login at the front-end.")
+        refresh = getattr(user, "refresh_token", None)
+        if not refresh:
+            raise Exception("No refresh token found. Please re-authorize.")
+
+        creds = _new_credentials(refresh, scopes)
+        creds.refresh(google_auth_request())
         new_rt = getattr(creds, "refresh_token", None)
         if new_rt and new_rt != refresh:
             user.refresh_token = new_rt
             save_user(user)
-    return creds
+
+        cached = (creds.token, creds.expiry or _utcnow() + timedelta(hours=1))
+        _access_tokens.set(key, cached)
+        return cached
+
+
+def _refresh_in_background(chat_id: str, scopes: list[str]) -> None:
+    key = (chat_id, tuple(sorted(scopes)))
+    if _refresh_lock(key).locked():
+        return  # A refresh for this user is already running
+
+    def refresh():
+        try:
+            _refresh_access_token(chat_id, scopes, ACCESS_TOKEN_REFRESH_AHEAD_SECONDS)
+        except Exception as e:
+            logger.warning(f"⚠️ [WARNING] Background access token refresh failed: {e}")
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def load_credentials(chat_id: str, scopes: list[str]) -> Credentials:
+    key = (chat_id, tuple(sorted(scopes)))
+    cached = _access_tokens.get(key)
+    seconds_left = _seconds_left(cached)
+    if seconds_left <= ACCESS_TOKEN_EXPIRY_MARGIN_SECONDS:
+        cached = _refresh_access_token(chat_id, scopes, ACCESS_TOKEN_EXPIRY_MARGIN_SECONDS)
+    elif seconds_left <= ACCESS_TOKEN_REFRESH_AHEAD_SECONDS:
+        _refresh_in_background(chat_id, scopes)
+
+    user = get_user_doc(chat_id)
+    if not user:
+        raise Exception("User not authorized. Please login at the front-end.")
+    refresh = getattr(user, "refresh_token", None)
+    if not refresh:
+        raise Exception("No refresh token found. Please re-authorize.")
+
+    token, expiry = cached
+    return _new_credentials(refresh, scopes, token, expiry)
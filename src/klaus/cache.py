@@ -0,0 +1,210 @@
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU mapping with hit/miss/eviction counters.
+    `on_evict(key, value)` is called, outside the lock, for every entry pushed out by `maxsize`.
+    """
+
+    def __init__(self, maxsize: int = 128, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.maxsize = max(1, int(maxsize))
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._creating: Dict[Hashable, threading.Lock] = {}
+
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+
+    def set(self, key: Hashable, value: Any) -> None:
+        evicted: List[Tuple[Hashable, Any]] = []
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False))
+                self.evictions += 1
+        self._notify(evicted)
+
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        # Concurrent misses on the same key build the value only once; other keys are not blocked
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            key_lock = self._creating.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                with self._lock:
+                    value = self._lookup(key)
+                if value is not _MISSING:
+                    return value
+                value = factory()
+                self.set(key, value)
+                return value
+        finally:
+            with self._lock:
+                self._creating.pop(key, None)
+
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        # Like get, without counting a hit or miss or refreshing the entry's recency
+        with self._lock:
+            return self._data.get(key, default)
+
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+
+    def clear(self, notify: bool = False) -> None:
+        with self._lock:
+            items = list(self._data.items())
+            self._data.clear()
+        if notify:
+            self._notify(items)
+
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+    def _lookup(self, key: Hashable) -> Any:
+        # Must be called with the lock held
+        if key not in self._data:
+            return _MISSING
+        self._data.move_to_end(key)
+        return self._data[key]
+
+
+    def _notify(self, items: List[Tuple[Hashable, Any]]) -> None:
+        if not self.on_evict:
+            return
+        for key, value in items:
+            self.on_evict(key, value)
+
+
+class TTLCache(LRUCache):
+    """
+    LRUCache whose entries also expire `ttl` seconds after being set (or after a per-entry `ttl`).
+    Expired entries count as misses and are handed to `on_evict` like evicted ones.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 60, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        super().__init__(maxsize, on_evict)
+        self.ttl = ttl
+        self.expirations = 0
+        self._expires_at: Dict[Hashable, float] = {}
+
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        expired = self._pop_expired(key)
+        self._notify(expired)
+        return super().get(key, default)
+
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._expires_at[key] = time.monotonic() + (self.ttl if ttl is None else ttl)
+        super().set(key, value)
+
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            expires_at = self._expires_at.get(key)
+            if expires_at is not None and expires_at <= time.monotonic():
+                return default
+            return super().peek(key, default)
+
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            self._expires_at.pop(key, None)
+            return super().pop(key, default)
+
+
+    def clear(self, notify: bool = False) -> None:
+        with self._lock:
+            self._expires_at.clear()
+        super().clear(notify)
+
+
+    def expire(self) -> int:
+        # Drops every expired entry; returns how many were dropped
+        now = time.monotonic()
+        with self._lock:
+            keys = [key for key, expires_at in self._expires_at.items() if expires_at <= now]
+            expired = [(key, self._data.pop(key)) for key in keys if key in self._data]
+            for key in keys:
+                self._expires_at.pop(key, None)
+            self.expirations += len(expired)
+        self._notify(expired)
+        return len(expired)
+
+
+    def stats(self) -> Dict[str, int]:
+        stats = super().stats()
+        stats["expirations"] = self.expirations
+        return stats
+
+
+    def _lookup(self, key: Hashable) -> Any:
+        expires_at = self._expires_at.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            return _MISSING
+        return super()._lookup(key)
+
+
+    def _pop_expired(self, key: Hashable) -> List[Tuple[Hashable, Any]]:
+        with self._lock:
+            expires_at = self._expires_at.get(key)
+            if expires_at is None or expires_at > time.monotonic() or key not in self._data:
+                return []
+            self._expires_at.pop(key, None)
+            self.expirations += 1
+            return [(key, self._data.pop(key))]
+
+
+    def _notify(self, items: List[Tuple[Hashable, Any]]) -> None:
+        with self._lock:
+            for key, _ in items:
+                if key not in self._data:
+                    self._expires_at.pop(key, None)
+        super()._notify(items)
@@ -1,25 +1,96 @@
+import asyncio
+import atexit
 import pytz
 import os
 import logging
+import threading
+import weakref
 
 from google.cloud import firestore
 from datetime import datetime
+from typing import Dict, Optional, Tuple
 
 
 TIMEZONE = pytz.timezone(os.getenv("TIMEZONE", "America/Sao_Paulo"))
 
 # logging configuration
-_ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
-logging.basicConfig(level=logging.DEBUG if _ENVIRONMENT == "dev" else logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_firestore_client():
+# One client (and gRPC channel) per (project, database, emulator) for the whole process
+_clients: Dict[Tuple[Optional[str], Optional[str], Optional[str]], firestore.Client] = {}
+_clients_lock = threading.Lock()
 
-    emulator = os.getenv("FIRESTORE_EMULATOR_HOST")
-    
+
+def _create_firestore_client(project: Optional[str], database: Optional[str], emulator: Optional[str], client_class=firestore.Client):
     if emulator:
-        os.environ.setdefault("GCLOUD_PROJECT", os.getenv("DB_PROJECT_ID"))
+        os.environ.setdefault("GCLOUD_PROJECT", project)
         logger.warning(f"⚠️ {datetime.now(TIMEZONE).strftime('%H:%M:%S')} - Using firestore emulator")
-        return firestore.Client()
-    
-    return firestore.Client(project=os.getenv("DB_PROJECT_ID"), database=os.getenv("DB_NAME"))
\ No newline at end of file
+        return client_class()
+
+    return client_class(project=project, database=database)
+
+
+def _client_key() -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    return os.getenv("DB_PROJECT_ID"), os.getenv("DB_NAME"), os.getenv("FIRESTORE_EMULATOR_HOST")
+
+
+def get_firestore_client() -> firestore.Client:
+    key = _client_key()
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _create_firestore_client(*key)
+            _clients[key] = client
+    return client
+
+
+# Async clients (ASGI mode) use grpc.aio channels, which belong to the event loop that created them
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, firestore.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+
+def get_async_firestore_client() -> firestore.AsyncClient:
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    key = _client_key()
+    client = clients.get(key)
+    if client is None:
+        # No lock needed: a loop runs one coroutine at a time and this never awaits
+        client = _create_firestore_client(*key, client_class=firestore.AsyncClient)
+        clients[key] = client
+    return client
+
+
+def close_async_firestore_clients() -> None:
+    for client in _async_clients.pop(asyncio.get_running_loop(), {}).values():
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"⚠️ [WARNING] Error closing async firestore client: {e}")
+
+
+def close_firestore_clients() -> None:
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"⚠️ [WARNING] Error closing firestore client: {e}")
+
+
+def _reset_after_fork() -> None:
+    # gRPC channels must not be shared with a forked child (e.g. preforked gunicorn workers):
+    # drop the parent's clients without closing them, the child lazily builds its own
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+    _async_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(close_firestore_clients)
@@ -0,0 +1,86 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+
+from array import array
+from typing import List, Optional
+
+from cache import LRUCache
+
+
+# logging configuration
+logger = logging.getLogger(__name__)
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: an in-memory LRU tier backed by an optional
+    SQLite file (`disk_path`) that survives restarts. Keys are hashes of model + text.
+    """
+
+    def __init__(self, maxsize: int = 1024, disk_path: Optional[str] = None):
+        self.memory = LRUCache(maxsize)
+        self.disk_hits = 0
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        if disk_path:
+            self._open_disk(disk_path)
+
+
+    def _open_disk(self, disk_path: str) -> None:
+        try:
+            directory = os.path.dirname(disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._disk.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [WARNING] Embedding disk cache disabled, couldn't open {disk_path}: {e}")
+            self._disk = None
+
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = embedding_key(model, text)
+        embedding = self.memory.get(key)
+        if embedding is not None or self._disk is None:
+            return embedding
+
+        with self._disk_lock:
+            row = self._disk.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        embedding = array("d", row[0]).tolist()
+        self.disk_hits += 1
+        self.memory.set(key, embedding)
+        return embedding
+
+
+    def set(self, model: str, text: str, embedding: List[float]) -> None:
+        key = embedding_key(model, text)
+        embedding = list(embedding)
+        self.memory.set(key, embedding)
+        if self._disk is None:
+            return
+        try:
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    (key, array("d", embedding).tobytes())
+                )
+                self._disk.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [WARNING] Couldn't persist embedding on disk cache: {e}")
+
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        stats["disk_enabled"] = self._disk is not None
+        return stats
@@ -1,23 +1,37 @@
 import pytz
 import os
 import logging
+import threading
+import uuid
 
+from cache import TTLCache
 from datetime import datetime
 from data.client import get_firestore_client
+from fuzzy_index import FuzzyIndex
+from google.cloud import firestore
 from google.cloud.firestore_v1.collection import CollectionReference
+from google.cloud.firestore_v1.field_path import FieldPath
 
 
 TIMEZONE = pytz.timezone(os.getenv("TIMEZONE", "America/Sao_Paulo"))
+LIST_MATCH_THRESHOLD = float(os.getenv("LIST_MATCH_THRESHOLD", "90"))
+FIRESTORE_BATCH_SIZE = 500  # Max writes per Firestore batch
+LAYOUT_SUBCOLLECTION = "subcollection"  # One document per item under lists/{name}/items
+LAYOUT_DOCUMENT = "document"  # Every item in an "items" map on the lists/{name} document
+LIST_STORAGE_BACKEND = os.getenv("LIST_STORAGE_BACKEND", LAYOUT_SUBCOLLECTION).lower()
+# Larger lists stay in the subcollection; a conversion (one write per item plus the list document) must fit one transaction
+LIST_DOCUMENT_MAX_ITEMS = min(int(os.getenv("LIST_DOCUMENT_MAX_ITEMS", "400")), FIRESTORE_BATCH_SIZE - 1)
+LIST_CACHE_TTL_SECONDS = float(os.getenv("LIST_CACHE_TTL_SECONDS", "60"))  # Staleness bound for writes from other instances
+LIST_CACHE_LISTENERS = os.getenv("LIST_CACHE_LISTENERS", "false").lower() == "true"
+LIST_CACHE_IDLE_SECONDS = float(os.getenv("LIST_CACHE_IDLE_SECONDS", "600"))  # Listened lists unread this long are released
+LIST_LISTENER_TIMEOUT_SECONDS = float(os.getenv("LIST_LISTENER_TIMEOUT_SECONDS", "5"))
 
 # logging configuration
-_ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
-logging.basicConfig(level=logging.DEBUG if _ENVIRONMENT == "dev" else logging.INFO)
 logger = logging.getLogger(__name__)
 
-firestore_client = get_firestore_client()
 
 def _get_list_ref(chat_id: str, list_name: str):
-    return firestore_client \
+    return get_firestore_client() \
         .collection("users") \
         .document(chat_id) \
         .collection("lists") \
@@ -28,40 +42,328 @@ def _get_items_ref(chat_id: str, list_name: str) -> CollectionReference:
     return _get_list_ref(chat_id, list_name).collection("items")
 
 
-def _get_list_item_ref(chat_id: str, list_name: str, item_description: str): 
-    try:
-        items = _get_items_ref(chat_id, list_name)
-        if not items:
-            return None
-        for doc in items.stream():
-            if doc.to_dict()["text"] == item_description:
-                return doc  # Return the DocumentReference to use .delete()
+def get_layout(snapshot) -> str | None:
+    # Lists written before the document layout existed have no list document (or no marker) at all
+    if not snapshot.exists:
         return None
+    return (snapshot.to_dict() or {}).get("layout")
+
+
+def _get_document_items(snapshot) -> dict:
+    return (snapshot.to_dict() or {}).get("items", {}) if snapshot.exists else {}
+
+
+def _sorted_items(items: dict) -> list[dict]:
+    ordered = sorted(items.items(), key=lambda entry: (entry[1].get("createdAt") is None, entry[1].get("createdAt") or 0, entry[0]))
+    return [{"id": item_id, "text": item["text"]} for item_id, item in ordered]
+
+
+def _match_items(texts: list[str], item_descriptions: list[str]) -> list[int | None]:
+    # Matches every requested item against the list texts in a single batch.
+    # Returns, per requested item, the position of the matching text or None; each text is matched at most once,
+    # so asking twice for an entry the list holds twice removes both copies.
+    matches = FuzzyIndex(enumerate(texts)).best_many(item_descriptions, LIST_MATCH_THRESHOLD, distinct=True)
+    return [match[0] if match else None for match in matches]
+
+
+def _find_list_items(chat_id: str, list_name: str, item_descriptions: list[str]) -> list:
+    # Streams the list once and matches every requested item against it in a single batch.
+    # Returns, per requested item, the matching DocumentSnapshot (use .reference.delete()) or None.
+    try:
+        docs = list(_get_items_ref(chat_id, list_name).stream())
+        positions = _match_items([doc.to_dict()["text"] for doc in docs], item_descriptions)
+        return [docs[position] if position is not None else None for position in positions]
     except Exception as e:
         logger.error(f"❌ [ERROR] Error trying to find list item from list: {e}")
+        return [None for _ in item_descriptions]
+
+
+def _release_list(key, entry: dict) -> None:
+    # Called for evicted, expired and invalidated lists: a listener left open keeps a stream (and billing) alive
+    watch = entry.get("watch")
+    if watch is None:
+        return
+    entry["watch"] = None
+    try:
+        watch.unsubscribe()
+    except Exception as e:
+        logger.warning(f"⚠️ [WARNING] Couldn't stop listener for list {key}: {e}")
+
+
+# In-process list cache keyed by (chat_id, list name). Entries are {"items": [...], "watch": Watch or None, "stale": bool};
+# listened entries are kept current by Firestore, the others are invalidated by this module's writes.
+_list_cache = TTLCache(int(os.getenv("LIST_CACHE_SIZE", "256")), LIST_CACHE_TTL_SECONDS, on_evict=_release_list)
+_list_writes: dict[tuple, int] = {}  # Writes this process made per key, to spot reads that raced with one
+_list_lock = threading.Lock()
+
+
+def _list_key(chat_id: str, list_name: str) -> tuple:
+    return chat_id, list_name.lower()
+
+
+def _store_list(key: tuple, entry: dict, writes: int) -> None:
+    # `writes` is the key's write count when the read started. A plain read that a write overtook may hold
+    # the old items, so it isn't cached; a listened one is, marked stale until the listener catches up.
+    with _list_lock:
+        if _list_writes.get(key, 0) != writes:
+            if entry["watch"] is None:
+                return
+            entry["stale"] = True
+        previous = _list_cache.pop(key)
+        _list_cache.set(key, entry, LIST_CACHE_IDLE_SECONDS if entry["watch"] is not None else LIST_CACHE_TTL_SECONDS)
+    if previous is not None and previous is not entry:
+        _release_list(key, previous)
+
+
+def invalidate_list_cache(chat_id: str, list_name: str) -> None:
+    # Called after this process writes a list. A listened entry keeps its listener, which delivers the write,
+    # and is only marked stale until then; a plain entry is dropped.
+    key = _list_key(chat_id, list_name)
+    with _list_lock:
+        _list_writes[key] = _list_writes.get(key, 0) + 1
+        entry = _list_cache.peek(key)
+        if entry is None:
+            return
+        if entry["watch"] is not None:
+            entry["stale"] = True
+            return
+        _list_cache.pop(key)
+
+
+def get_list_cache_stats() -> dict:
+    return _list_cache.stats()
+
+
+def _watch_list(chat_id: str, list_name: str) -> dict | None:
+    # Attaches an on_snapshot listener and waits for its first snapshot, which replaces the initial read.
+    # Returns None when the list can't be listened to (timeout, or not a single-document list on the document backend).
+    entry = {"items": None, "watch": None, "stale": False}
+    ready = threading.Event()
+    watch_document = LIST_STORAGE_BACKEND == LAYOUT_DOCUMENT
+
+    def on_snapshot(snapshots, changes, read_time):
+        if watch_document:
+            snapshot = snapshots[0] if snapshots else None
+            if snapshot is not None and get_layout(snapshot) == LAYOUT_DOCUMENT:
+                entry["items"] = _sorted_items(_get_document_items(snapshot))
+            else:
+                entry["items"] = None  # Not (or no longer) a single-document list, readers reload it
+        else:
+            entry["items"] = [{"id": doc.id, "text": doc.to_dict()["text"]} for doc in snapshots]
+        entry["stale"] = False
+        ready.set()
+
+    ref = _get_list_ref(chat_id, list_name) if watch_document else _get_items_ref(chat_id, list_name)
+    try:
+        entry["watch"] = ref.on_snapshot(on_snapshot)
+    except Exception as e:
+        logger.warning(f"⚠️ [WARNING] Couldn't listen to list \"{list_name}\" for chat_id {chat_id}: {e}")
         return None
+    if not ready.wait(LIST_LISTENER_TIMEOUT_SECONDS) or entry["items"] is None:
+        _release_list(_list_key(chat_id, list_name), entry)
+        return None
+    return entry
 
 
-def add_items_to_list(chat_id: str, list_name: str, items: list[str]):
-    items_ref = _get_items_ref(chat_id, list_name)
-    for text in items:
-        items_ref.add({
-            "text": text,
-            "createdAt": datetime.now(TIMEZONE)
-        })
+def _commit_in_batches(writes: list[tuple]) -> None:
+    # Writes are (DocumentReference, data) pairs; data None deletes the document
+    firestore_client = get_firestore_client()
+    for start in range(0, len(writes), FIRESTORE_BATCH_SIZE):
+        batch = firestore_client.batch()
+        for ref, data in writes[start:start + FIRESTORE_BATCH_SIZE]:
+            if data is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, data)
+        batch.commit()
 
 
-def remove_items_from_list(chat_id: str, list_name: str, items: list[str]):
-    deleted_items = []
-    for item in items:
-        item_found = _get_list_item_ref(chat_id, list_name, item)
-        if item_found: 
-            item_found.reference.delete()
-            deleted_items.append(item_found.to_dict()['text'])
-        logger.warning(f"▶️ [DEBUG] List item \"{item}\" not found on list \"{list_name}\" for chat_id: {chat_id}")
-    return deleted_items
+@firestore.transactional
+def _add_to_document(transaction, list_ref, entries: dict) -> bool:
+    # Returns False, without writing, when the list left the document layout or would outgrow it
+    snapshot = list_ref.get(transaction=transaction)
+    if get_layout(snapshot) != LAYOUT_DOCUMENT:
+        return False
+    if len(_get_document_items(snapshot)) + len(entries) > LIST_DOCUMENT_MAX_ITEMS:
+        return False
+    transaction.set(list_ref, {"items": entries}, merge=True)
+    return True
 
 
-def get_list(chat_id: str, list_name: str) -> list[dict]:
+@firestore.transactional
+def _write_to_subcollection(transaction, list_ref, writes: list[tuple]) -> bool:
+    # Returns False, without writing, when the list was packed into its document since the caller checked
+    if get_layout(list_ref.get(transaction=transaction)) == LAYOUT_DOCUMENT:
+        return False
+    for ref, data in writes:
+        if data is None:
+            transaction.delete(ref)
+        else:
+            transaction.set(ref, data)
+    return True
+
+
+def _commit_to_subcollection(chat_id: str, list_name: str, writes: list[tuple]) -> bool:
+    # With the document backend a list can be packed into its document at any time, so item writes check the
+    # layout in the same transaction as migrate_list does. Writes too many for one transaction would push the
+    # list past LIST_DOCUMENT_MAX_ITEMS anyway.
+    if not writes:
+        return True
+    if LIST_STORAGE_BACKEND != LAYOUT_DOCUMENT or len(writes) >= FIRESTORE_BATCH_SIZE:
+        _commit_in_batches(writes)
+        return True
+    return _write_to_subcollection(get_firestore_client().transaction(), _get_list_ref(chat_id, list_name), writes)
+
+
+@firestore.transactional
+def _remove_from_document(transaction, list_ref, item_descriptions: list[str]) -> list[str | None] | None:
+    # Returns, per requested item, the removed text or None; None overall when the list isn't a document anymore
+    snapshot = list_ref.get(transaction=transaction)
+    if get_layout(snapshot) != LAYOUT_DOCUMENT:
+        return None
+    stored = _get_document_items(snapshot)
+    item_ids = list(stored)
+    positions = _match_items([stored[item_id]["text"] for item_id in item_ids], item_descriptions)
+    removed_ids = [item_ids[position] for position in positions if position is not None]
+    if removed_ids:
+        transaction.update(list_ref, {FieldPath("items", item_id).to_api_repr(): firestore.DELETE_FIELD for item_id in removed_ids})
+    return [stored[item_ids[position]]["text"] if position is not None else None for position in positions]
+
+
+@firestore.transactional
+def _pack_into_document(transaction, list_ref) -> str:
+    # Item documents are read, deleted and folded into the list document in one transaction
+    snapshot = list_ref.get(transaction=transaction)
+    if get_layout(snapshot) == LAYOUT_DOCUMENT:
+        return LAYOUT_DOCUMENT
+    docs = list(list_ref.collection("items").stream(transaction=transaction))
+    if len(docs) > LIST_DOCUMENT_MAX_ITEMS:
+        transaction.set(list_ref, {"layout": LAYOUT_SUBCOLLECTION}, merge=True)
+        return LAYOUT_SUBCOLLECTION
+    items = {doc.id: {"text": doc.to_dict()["text"], "createdAt": doc.to_dict().get("createdAt")} for doc in docs}
+    transaction.set(list_ref, {"layout": LAYOUT_DOCUMENT, "items": items}, merge=["layout", "items"])
+    for doc in docs:
+        transaction.delete(doc.reference)
+    return LAYOUT_DOCUMENT
+
+
+@firestore.transactional
+def _unpack_into_subcollection(transaction, list_ref) -> str:
+    snapshot = list_ref.get(transaction=transaction)
+    items_ref = list_ref.collection("items")
+    for item_id, item in _get_document_items(snapshot).items():
+        transaction.set(items_ref.document(item_id), item)
+    transaction.set(list_ref, {"layout": LAYOUT_SUBCOLLECTION, "items": firestore.DELETE_FIELD}, merge=True)
+    return LAYOUT_SUBCOLLECTION
+
+
+def migrate_list(chat_id: str, list_name: str, layout: str = LAYOUT_DOCUMENT) -> str:
+    # Moves a list between layouts in one transaction and returns the layout it ended up in. Lists larger
+    # than LIST_DOCUMENT_MAX_ITEMS are only marked, never packed into a single document.
+    list_ref = _get_list_ref(chat_id, list_name)
+    if layout == LAYOUT_DOCUMENT:
+        return _pack_into_document(get_firestore_client().transaction(), list_ref)
+    return _unpack_into_subcollection(get_firestore_client().transaction(), list_ref)
+
+
+def _uses_document_layout(chat_id: str, list_name: str) -> bool:
+    # Lists are converted the first time they are written with the document backend enabled
+    if LIST_STORAGE_BACKEND != LAYOUT_DOCUMENT:
+        return False
+    layout = get_layout(_get_list_ref(chat_id, list_name).get())
+    if layout is None:
+        layout = migrate_list(chat_id, list_name, LAYOUT_DOCUMENT)
+    return layout == LAYOUT_DOCUMENT
+
+
+def add_items_to_list(chat_id: str, list_name: str, items: list[str]) -> list[str]:
+    # Document layout: one transaction. Subcollection layout: one batched commit (per 500 items)
+    # instead of a round-trip per item. Returns the new item ids.
+    try:
+        created_at = datetime.now(TIMEZONE)
+        if _uses_document_layout(chat_id, list_name):
+            entries = {uuid.uuid4().hex: {"text": text, "createdAt": created_at} for text in items}
+            if _add_to_document(get_firestore_client().transaction(), _get_list_ref(chat_id, list_name), entries):
+                return list(entries)
+            logger.info(f"▶️ List \"{list_name}\" for chat_id {chat_id} outgrew a single document, moving it to the subcollection layout")
+            migrate_list(chat_id, list_name, LAYOUT_SUBCOLLECTION)
+
+        items_ref = _get_items_ref(chat_id, list_name)
+        refs = [items_ref.document() for _ in items]
+        if not _commit_to_subcollection(chat_id, list_name, [(ref, {"text": text, "createdAt": created_at}) for ref, text in zip(refs, items)]):
+            return add_items_to_list(chat_id, list_name, items)  # Packed meanwhile, write to the document instead
+        return [ref.id for ref in refs]
+    finally:
+        # After the write; a read that started before it isn't cached either (see _store_list)
+        invalidate_list_cache(chat_id, list_name)
+
+
+def remove_items_from_list(chat_id: str, list_name: str, items: list[str]) -> list[str | None]:
+    # Resolves every item from one snapshot and deletes the matches in one transaction (document layout)
+    # or one batch (subcollection layout).
+    # Returns, aligned with `items`, the text of the removed entry or None when nothing matched.
+    try:
+        removed = None
+        if _uses_document_layout(chat_id, list_name):
+            try:
+                removed = _remove_from_document(get_firestore_client().transaction(), _get_list_ref(chat_id, list_name), items)
+            except Exception as e:
+                logger.error(f"❌ [ERROR] Error trying to remove items from list document: {e}")
+                removed = [None for _ in items]
+
+        matches = []
+        if removed is None:
+            removed = []
+            for item_found in _find_list_items(chat_id, list_name, items):
+                if item_found:
+                    matches.append(item_found)
+                removed.append(item_found.to_dict()['text'] if item_found else None)
+
+        if not _commit_to_subcollection(chat_id, list_name, [(doc.reference, None) for doc in matches]):
+            return remove_items_from_list(chat_id, list_name, items)  # Packed meanwhile, remove from the document instead
+
+        for item, text in zip(items, removed):
+            if text is None:
+                logger.warning(f"▶️ [DEBUG] List item \"{item}\" not found on list \"{list_name}\" for chat_id: {chat_id}")
+        return removed
+    finally:
+        # After the write; a read that started before it isn't cached either (see _store_list)
+        invalidate_list_cache(chat_id, list_name)
+
+
+def _read_list(chat_id: str, list_name: str) -> list[dict]:
+    # Document layout costs one read; lists still (or deliberately) in the subcollection are streamed
+    if LIST_STORAGE_BACKEND == LAYOUT_DOCUMENT:
+        snapshot = _get_list_ref(chat_id, list_name).get()
+        if get_layout(snapshot) == LAYOUT_DOCUMENT:
+            return _sorted_items(_get_document_items(snapshot))
     docs = list(_get_items_ref(chat_id, list_name).stream())
-    return [{"id": doc.id, "text": doc.to_dict()["text"]} for doc in docs]
\ No newline at end of file
+    return [{"id": doc.id, "text": doc.to_dict()["text"]} for doc in docs]
+
+
+def get_list(chat_id: str, list_name: str) -> list[dict]:
+    _list_cache.expire()  # Releases the listeners of lists nobody read for LIST_CACHE_IDLE_SECONDS
+    key = _list_key(chat_id, list_name)
+    entry = _list_cache.get(key)
+    if entry is None or entry["items"] is None:
+        writes = _list_writes.get(key, 0)
+        entry = (_watch_list(chat_id, list_name) if LIST_CACHE_LISTENERS else None) \
+            or {"items": _read_list(chat_id, list_name), "watch": None, "stale": False}
+        _store_list(key, entry, writes)
+    elif entry["watch"] is not None:
+        _list_cache.set(key, entry, LIST_CACHE_IDLE_SECONDS)  # Listened lists stay cached while they're read
+        if entry["stale"]:
+            return _read_list(chat_id, list_name)  # This process's write hasn't come back through the listener yet
+    return [dict(item) for item in entry["items"]]
+
+
+def _reset_after_fork() -> None:
+    # Listener streams belong to the parent's Firestore client; the child starts with an empty cache
+    global _list_lock
+    _list_cache.clear()
+    _list_writes.clear()
+    _list_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
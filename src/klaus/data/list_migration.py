@@ -0,0 +1,49 @@
+import argparse
+import logging
+import os
+
+from data.client import get_firestore_client
+from data.list import LAYOUT_DOCUMENT, LAYOUT_SUBCOLLECTION, get_layout, migrate_list
+
+
+# logging configuration
+logger = logging.getLogger(__name__)
+
+
+def iter_lists(chat_id: str | None = None):
+    # list_documents() also returns "missing" documents, which is what subcollection lists
+    # look like: items were only ever written under lists/{name}/items
+    users_ref = get_firestore_client().collection("users")
+    user_refs = [users_ref.document(chat_id)] if chat_id else users_ref.list_documents()
+    for user_ref in user_refs:
+        for list_ref in user_ref.collection("lists").list_documents():
+            yield user_ref.id, list_ref
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert Klaus lists between the subcollection and single-document layouts.")
+    parser.add_argument("--to", choices=[LAYOUT_DOCUMENT, LAYOUT_SUBCOLLECTION], default=LAYOUT_DOCUMENT, help="target layout (default: document)")
+    parser.add_argument("--chat-id", help="only migrate the lists of this user")
+    parser.add_argument("--dry-run", action="store_true", help="report each list's current layout without writing")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    totals: dict[str, int] = {}
+    for chat_id, list_ref in iter_lists(args.chat_id):
+        if args.dry_run:
+            layout = get_layout(list_ref.get()) or f"{LAYOUT_SUBCOLLECTION} (unmarked)"
+        else:
+            try:
+                layout = migrate_list(chat_id, list_ref.id, args.to)
+            except Exception as e:
+                logger.error(f"❌ [ERROR] Couldn't migrate list \"{list_ref.id}\" for chat_id {chat_id}: {e}")
+                layout = "failed"
+        totals[layout] = totals.get(layout, 0) + 1
+        logger.info(f"▶️ chat_id {chat_id}, list \"{list_ref.id}\": {layout}")
+
+    logger.info(f"✅ {sum(totals.values())} list(s): " + ", ".join(f"{count} {layout}" for layout, count in sorted(totals.items())))
+    return 1 if "failed" in totals else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
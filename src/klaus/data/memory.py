@@ -1,34 +1,99 @@
-import chromadb
+import asyncio
+import math
 import os
 import uuid
 import pytz
 import logging
 
 from datetime import datetime
-from google import genai
 from google.cloud import firestore
-from typing import Tuple, Dict, Any, List
+from typing import TYPE_CHECKING, Callable, Tuple, Dict, Any, List, NamedTuple, Optional
 
-from data.client import get_firestore_client
+from cache import LRUCache
+from data.client import get_async_firestore_client, get_firestore_client
+from data.embedding_cache import EmbeddingCache
+from data.write_behind import WriteBehindQueue
+from externals.gemini import get_genai_client
+
+if TYPE_CHECKING:
+    import chromadb
+    from data.vector_store import VectorStore
 
 
 # Constants
 TIMEZONE = pytz.timezone(os.getenv("TIMEZONE", "America/Sao_Paulo"))
-_ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
-
-# AI Configuration
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+CHROMA_MAX_OPEN_USERS = int(os.getenv("CHROMA_MAX_OPEN_USERS", "32"))
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "chroma").lower()  # "chroma" or "numpy"
+MEMORY_STORE_PATH = os.getenv("MEMORY_STORE_PATH", "./storage/memories")
+MEMORIES_COLLECTION = "memories"
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_BATCH_SIZE = 100  # Max texts per embed_content call
+FIRESTORE_BATCH_SIZE = 500  # Max writes per Firestore batch
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+# Cosine similarity at which a new memory is merged into its nearest existing one instead of stored (0 disables)
+MEMORY_DEDUP_THRESHOLD = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.95"))
+MERGED_IDS_KEPT = 50  # Ids of the latest records folded into a memory, so a replayed batch doesn't count them twice
 
 # Logging configuration
-logging.basicConfig(level=logging.DEBUG if _ENVIRONMENT == "dev" else logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Embeddings are content-addressed, so repeated texts (and the query/insert pair of a turn) skip the remote call
+_embedding_cache = EmbeddingCache(
+    int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+    os.getenv("EMBEDDING_CACHE_PATH")
+)
+
 
-def get_chroma_client(chat_id: str) -> chromadb.api.models.Collection:
+def _open_chroma(chat_id: str) -> Tuple[Any, Any]:
     storage_path = os.getenv("CHROMA_STORAGE_PATH", "./storage/chroma")
     user_path = os.path.join(storage_path, str(chat_id))
     os.makedirs(user_path, exist_ok=True)
-    return chromadb.PersistentClient(path=user_path)
+    import chromadb  # Heavy import, only paid when a user's memories are first opened
+    chroma_client = chromadb.PersistentClient(path=user_path)
+    collection = chroma_client.get_or_create_collection(MEMORIES_COLLECTION)
+    logger.debug(f"▶️ {datetime.now(TIMEZONE).strftime('%H:%M:%S')} - Opened chroma store for chat_id {chat_id}")
+    return chroma_client, collection
+
+
+def _open_vector_store(chat_id: str) -> Tuple[Any, Any]:
+    from data.vector_store import VectorStore  # numpy is only needed by this backend
+    store = VectorStore(os.path.join(MEMORY_STORE_PATH, str(chat_id)))
+    logger.debug(f"▶️ {datetime.now(TIMEZONE).strftime('%H:%M:%S')} - Opened vector store for chat_id {chat_id} ({store.count()} memories)")
+    return store, store
+
+
+def _open_store(chat_id: str) -> Tuple[Any, Any]:
+    if MEMORY_BACKEND == "numpy":
+        return _open_vector_store(chat_id)
+    return _open_chroma(chat_id)
+
+
+def _close_chroma(chat_id: str, entry: Tuple[Any, Any]) -> None:
+    chroma_client, _ = entry
+    close = getattr(chroma_client, "close", None)  # Only available on recent chromadb versions
+    if not close:
+        return
+    try:
+        close()
+    except Exception as e:
+        logger.warning(f"⚠️ [WARNING] Error closing chroma store for chat_id {chat_id}: {e}")
+
+
+# Process-wide registry of open per-user stores (Chroma or VectorStore), least recently used users are closed first
+_chroma_registry = LRUCache(CHROMA_MAX_OPEN_USERS, on_evict=_close_chroma)
+
+
+def get_chroma_client(chat_id: str) -> "chromadb.ClientAPI":
+    return _chroma_registry.get_or_create(str(chat_id), lambda: _open_store(chat_id))[0]
+
+
+def get_memories_collection(chat_id: str) -> "chromadb.Collection | VectorStore":
+    # Both backends answer the same add/upsert/query calls
+    return _chroma_registry.get_or_create(str(chat_id), lambda: _open_store(chat_id))[1]
+
+
+def get_chroma_registry_stats() -> Dict[str, int]:
+    return _chroma_registry.stats()
 
 
 def save_message(chat_id: str, role: str, text: str) -> Tuple[str, Dict[str, Any]]:
@@ -44,16 +109,96 @@ def save_message(chat_id: str, role: str, text: str) -> Tuple[str, Dict[str, Any
 
 
 def generate_embedding(text: str) -> List[float]:
-    result = client.models.embed_content(
-        model="models/text-embedding-004",
+    embedding = _embedding_cache.get(EMBEDDING_MODEL, text)
+    if embedding is not None:
+        return embedding
+
+    result = get_genai_client().models.embed_content(
+        model=EMBEDDING_MODEL,
         contents=text)
-    return result.embeddings[0].values
+    embedding = list(result.embeddings[0].values)
+    _embedding_cache.set(EMBEDDING_MODEL, text, embedding)
+    return embedding
+
+
+async def generate_embedding_async(text: str) -> List[float]:
+    embedding = _embedding_cache.get(EMBEDDING_MODEL, text)
+    if embedding is not None:
+        return embedding
+
+    result = await get_genai_client().aio.models.embed_content(
+        model=EMBEDDING_MODEL,
+        contents=text)
+    embedding = list(result.embeddings[0].values)
+    _embedding_cache.set(EMBEDDING_MODEL, text, embedding)
+    return embedding
+
+
+def generate_embeddings(texts: List[str]) -> List[List[float]]:
+    embeddings: List[Any] = [_embedding_cache.get(EMBEDDING_MODEL, text) for text in texts]
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+
+    generated: Dict[str, List[float]] = {}
+    for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+        chunk = missing[start:start + EMBEDDING_BATCH_SIZE]
+        result = get_genai_client().models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=chunk)
+        for text, item in zip(chunk, result.embeddings):
+            generated[text] = list(item.values)
+            _embedding_cache.set(EMBEDDING_MODEL, text, generated[text])
+
+    return [embedding if embedding is not None else generated[text] for text, embedding in zip(texts, embeddings)]
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    return _embedding_cache.stats()
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _find_duplicate(collection, embedding: List[float]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    # Nearest stored memory as (id, metadata) when it is close enough to count as the same memory
+    if MEMORY_DEDUP_THRESHOLD <= 0 or not collection.count():
+        return None
+    result = collection.query(query_embeddings=[embedding], n_results=1, include=["metadatas", "embeddings"])
+    if not result["ids"][0]:
+        return None
+    if cosine_similarity(embedding, list(result["embeddings"][0][0])) < MEMORY_DEDUP_THRESHOLD:
+        return None
+    return result["ids"][0][0], result["metadatas"][0][0] or {}
+
+
+def merged_metadata(metadata: Dict[str, Any], seen_at: str, occurrences: int = 1, merged_id: Optional[str] = None) -> Dict[str, Any]:
+    # A merged memory keeps its first text and timestamp, and counts how often it came up again
+    merged = {
+        **metadata,
+        "occurrences": int(metadata.get("occurrences", 1)) + occurrences,
+        "last_seen": max(seen_at, metadata.get("last_seen") or metadata.get("timestamp") or seen_at)
+    }
+    if merged_id:
+        # Space-separated, since Chroma metadata values can't be lists
+        merged["merged_ids"] = " ".join((metadata.get("merged_ids", "").split() + [merged_id])[-MERGED_IDS_KEPT:])
+    return merged
+
+
+def _already_merged(metadata: Dict[str, Any], record_id: str) -> bool:
+    return record_id in (metadata.get("merged_ids") or "").split()
 
 
 def save_embedding(text: str, chat_id: str, message_id: str) -> None:
-    chroma_client = get_chroma_client(chat_id)
-    collection = chroma_client.get_or_create_collection("memories")
+    collection = get_memories_collection(chat_id)
     embedding = generate_embedding(text)
+    duplicate = _find_duplicate(collection, embedding)
+    if duplicate:
+        memory_id, metadata = duplicate
+        collection.update(ids=[memory_id], metadatas=[merged_metadata(metadata, datetime.now(TIMEZONE).isoformat())])
+        logger.debug(f"▶️ {datetime.now(TIMEZONE).strftime('%H:%M:%S')} - Merged memory into {memory_id} for chat_id {chat_id}")
+        return
     uid = str(uuid.uuid4())
 
     collection.add(
@@ -68,26 +213,180 @@ def save_embedding(text: str, chat_id: str, message_id: str) -> None:
     )
 
 
-def fetch_similar_memories(chat_id: str, query_text: str, top_k: int = 3) -> List[str]:
-    chroma_client = get_chroma_client(chat_id)
-    collection = chroma_client.get_or_create_collection("memories")
-    query_embedding = generate_embedding(query_text)
-    results = collection.query(
+_saved_listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+
+
+def add_saved_listener(listener: Callable[[List[Dict[str, Any]]], None]) -> None:
+    # `listener(records)` is called once save_messages has stored a batch of messages
+    _saved_listeners.append(listener)
+
+
+def save_messages(records: List[Dict[str, Any]]) -> None:
+    # Bulk counterpart of save_message + save_embedding. Idempotent: message documents and
+    # memories are keyed by the record id, so a replayed batch overwrites instead of duplicating
+    firestore_client = get_firestore_client()
+    messages_ref = firestore_client.collection("messages")
+    for start in range(0, len(records), FIRESTORE_BATCH_SIZE):
+        batch = firestore_client.batch()
+        for record in records[start:start + FIRESTORE_BATCH_SIZE]:
+            batch.set(messages_ref.document(record["id"]), {
+                "chat_id": record["chat_id"],
+                "role": record["role"],
+                "text": record["text"],
+                "timestamp": record["timestamp"]
+            })
+        batch.commit()
+
+    for listener in _saved_listeners:
+        try:
+            listener(records)
+        except Exception as e:
+            logger.error(f"❌ [ERROR] Saved-messages listener failed: {e}")  # Not a reason to write the batch again
+
+    to_embed = [record for record in records if record.get("embed")]
+    if not to_embed:
+        return
+    embeddings = generate_embeddings([record["text"] for record in to_embed])
+
+    by_chat: Dict[str, List[Tuple[Dict[str, Any], List[float]]]] = {}
+    for record, embedding in zip(to_embed, embeddings):
+        by_chat.setdefault(record["chat_id"], []).append((record, embedding))
+    for chat_id, entries in by_chat.items():
+        collection = get_memories_collection(chat_id)
+        entries = _merge_duplicates(collection, entries)
+        if not entries:
+            continue
+        collection.upsert(
+            documents=[record["text"] for record, _ in entries],
+            embeddings=[embedding for _, embedding in entries],
+            metadatas=[{
+                "chat_id": chat_id,
+                "message_id": record["id"],
+                "timestamp": record["timestamp"],
+                **{key: record[key] for key in ("occurrences", "last_seen", "merged_ids") if key in record}
+            } for record, _ in entries],
+            ids=[record["id"] for record, _ in entries]
+        )
+
+
+def _merge_duplicates(collection, entries: List[Tuple[Dict[str, Any], List[float]]]) -> List[Tuple[Dict[str, Any], List[float]]]:
+    # Folds near-duplicates (of stored memories or of earlier entries in the batch) into the
+    # memory they repeat and returns the entries that still need to be stored. Merges are keyed
+    # on the record id (see merged_metadata), so replaying a batch doesn't count them again
+    merges: Dict[str, Dict[str, Any]] = {}
+    kept: List[Tuple[Dict[str, Any], List[float]]] = []
+    for record, embedding in entries:
+        if MEMORY_DEDUP_THRESHOLD > 0:
+            earlier = next((r for r, e in kept if cosine_similarity(embedding, e) >= MEMORY_DEDUP_THRESHOLD), None)
+            if earlier is not None:
+                merged = merged_metadata(earlier, record["timestamp"], merged_id=record["id"])
+                earlier.update({key: merged[key] for key in ("occurrences", "last_seen", "merged_ids")})
+                continue
+        duplicate = _find_duplicate(collection, embedding)
+        if duplicate and duplicate[0] == record["id"]:
+            continue  # Replayed record, already stored
+        if duplicate:
+            memory_id, metadata = duplicate
+            metadata = merges.get(memory_id, metadata)
+            if not _already_merged(metadata, record["id"]):
+                merges[memory_id] = merged_metadata(metadata, record["timestamp"], merged_id=record["id"])
+            continue
+        kept.append(({**record}, embedding))
+
+    if merges:
+        collection.update(ids=list(merges), metadatas=list(merges.values()))
+    return kept
+
+
+_message_writer = WriteBehindQueue(
+    save_messages,
+    max_queue=int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "1000")),
+    batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0")),
+    spill_path=os.getenv("WRITE_BEHIND_SPILL_PATH", "./storage/write_behind.jsonl")
+)
+
+
+def enqueue_message(chat_id: str, role: str, text: str, embed: bool) -> str:
+    # Queues the message (and its embedding) for the background writer and returns the message id right away
+    message_id = uuid.uuid4().hex
+    _message_writer.submit({
+        "id": message_id,
+        "chat_id": chat_id,
+        "role": role,
+        "text": text,
+        "timestamp": datetime.now(TIMEZONE).isoformat(),
+        "embed": embed
+    })
+    return message_id
+
+
+def flush_pending_messages() -> None:
+    _message_writer.close()
+
+
+class MemoryCandidates(NamedTuple):
+    # Similar memories with their vectors, for rerankers that need more than the ranking
+    query_embedding: List[float]
+    documents: List[str]
+    embeddings: List[List[float]]
+
+
+def _query_memories(chat_id: str, query_text: str, query_embedding: List[float], top_k: int, include: Optional[List[str]] = None) -> Dict[str, Any]:
+    results = get_memories_collection(chat_id).query(
         query_embeddings=[query_embedding],
-        n_results=top_k
+        n_results=top_k,
+        include=include or ["documents"]
     )
     logger.info(f"Fetched {len(results.get('documents', [[]])[0])} similar memories for query: {query_text} on chat_id {chat_id}. These are the memories: {results.get('documents', [[]])[0]}")
+    return results
+
+
+def _memory_candidates(chat_id: str, query_text: str, query_embedding: List[float], top_k: int) -> MemoryCandidates:
+    results = _query_memories(chat_id, query_text, query_embedding, top_k, ["documents", "embeddings"])
+    return MemoryCandidates(query_embedding, results["documents"][0], [list(e) for e in results["embeddings"][0]])
+
+
+def fetch_similar_memories(chat_id: str, query_text: str, top_k: int = 3) -> List[str]:
+    return _query_memories(chat_id, query_text, generate_embedding(query_text), top_k).get("documents", [[]])[0]
+
+
+async def fetch_similar_memories_async(chat_id: str, query_text: str, top_k: int = 3) -> List[str]:
+    # Chroma is a local, blocking store: the query runs in a worker thread
+    query_embedding = await generate_embedding_async(query_text)
+    results = await asyncio.to_thread(_query_memories, chat_id, query_text, query_embedding, top_k)
     return results.get("documents", [[]])[0]
 
 
+def fetch_memory_candidates(chat_id: str, query_text: str, top_k: int = 15) -> MemoryCandidates:
+    return _memory_candidates(chat_id, query_text, generate_embedding(query_text), top_k)
+
+
+async def fetch_memory_candidates_async(chat_id: str, query_text: str, top_k: int = 15) -> MemoryCandidates:
+    query_embedding = await generate_embedding_async(query_text)
+    return await asyncio.to_thread(_memory_candidates, chat_id, query_text, query_embedding, top_k)
+
+
+def _latest_messages_query(messages_ref, chat_id: str, limit: int):
+    messages_ref = messages_ref.where("chat_id", "==", chat_id)
+    return messages_ref.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit)
+
+
 def get_latest_messages(chat_id: str, limit: int = 16) -> List[Dict[str, Any]]:
     try:
         firestore_client = get_firestore_client()
-        messages_ref = firestore_client.collection("messages")
-        messages_ref = messages_ref.where("chat_id", "==", chat_id)
-        query = messages_ref.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit)
-        results = query.stream()
+        results = _latest_messages_query(firestore_client.collection("messages"), chat_id, limit).stream()
         return [doc.to_dict() for doc in results]
+    except Exception as e:
+        logger.error(f"❌ Error fetching latest messages: {e}")
+        return []
+
+
+async def get_latest_messages_async(chat_id: str, limit: int = 16) -> List[Dict[str, Any]]:
+    try:
+        firestore_client = get_async_firestore_client()
+        query = _latest_messages_query(firestore_client.collection("messages"), chat_id, limit)
+        return [doc.to_dict() async for doc in query.stream()]
     except Exception as e:
         logger.error(f"❌ Error fetching latest messages: {e}")
         return []
\ No newline at end of file
@@ -0,0 +1,149 @@
+import argparse
+import contextlib
+import logging
+import os
+
+import numpy as np
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from data.memory import MEMORY_BACKEND, MEMORY_STORE_PATH, TIMEZONE, get_memories_collection, merged_metadata
+
+
+# Constants
+MEMORY_RETENTION_DAYS = float(os.getenv("MEMORY_RETENTION_DAYS", "30"))
+MEMORY_COMPACTION_THRESHOLD = float(os.getenv("MEMORY_COMPACTION_THRESHOLD", "0.9"))
+MEMORY_MAX_PER_USER = int(os.getenv("MEMORY_MAX_PER_USER", "5000"))
+
+# logging configuration
+logger = logging.getLogger(__name__)
+
+
+def _last_seen(metadata: Dict[str, Any]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(metadata.get("last_seen") or metadata.get("timestamp"))
+    except (TypeError, ValueError):
+        return None
+
+
+def plan_compaction(
+    ids: List[str],
+    embeddings,
+    metadatas: List[Dict[str, Any]],
+    now: datetime,
+    retention_days: float = MEMORY_RETENTION_DAYS,
+    threshold: float = MEMORY_COMPACTION_THRESHOLD,
+    max_memories: int = MEMORY_MAX_PER_USER
+) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """
+    Decides what to merge and prune for one user: (metadata updates by id, ids to delete).
+    Only memories not seen for `retention_days` are touched. Walking newest first, an old memory
+    within `threshold` cosine similarity of one already kept is merged into it (occurrences add up).
+    Then, while more than `max_memories` remain (0 = no cap), the old memories that came up the
+    fewest times, least recently, are pruned.
+    """
+    if not ids:
+        return {}, []
+    cutoff = now - timedelta(days=retention_days)
+    seen = [_last_seen(metadata or {}) for metadata in metadatas]
+    is_old = [when is not None and when < cutoff for when in seen]
+    order = sorted(range(len(ids)), key=lambda i: seen[i] or now, reverse=True)
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+
+    kept_vectors = np.empty_like(vectors)
+    kept: List[int] = []
+    current = {i: dict(metadatas[i] or {}) for i in range(len(ids))}
+    updated: set = set()
+    deleted: List[str] = []
+    for i in order:
+        if is_old[i] and kept:
+            similarities = kept_vectors[:len(kept)] @ vectors[i]
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                leader = kept[best]
+                current[leader] = merged_metadata(
+                    current[leader],
+                    current[i].get("last_seen") or current[i].get("timestamp") or "",
+                    int(current[i].get("occurrences", 1))
+                )
+                updated.add(leader)
+                deleted.append(ids[i])
+                continue
+        kept_vectors[len(kept)] = vectors[i]
+        kept.append(i)
+
+    if max_memories and len(kept) > max_memories:
+        prunable = sorted((i for i in kept if is_old[i]), key=lambda i: (int(current[i].get("occurrences", 1)), seen[i]))
+        for i in prunable[:len(kept) - max_memories]:
+            deleted.append(ids[i])
+            updated.discard(i)
+
+    return {ids[i]: current[i] for i in updated}, deleted
+
+
+def iter_memory_users(chat_id: str | None = None):
+    storage_path = MEMORY_STORE_PATH if MEMORY_BACKEND == "numpy" else os.getenv("CHROMA_STORAGE_PATH", "./storage/chroma")
+    if chat_id:
+        yield chat_id
+        return
+    if os.path.isdir(storage_path):
+        for name in sorted(os.listdir(storage_path)):
+            if os.path.isdir(os.path.join(storage_path, name)):
+                yield name
+
+
+def compact_user(chat_id: str, dry_run: bool = False, **policy: Any) -> Tuple[int, int, int]:
+    # (memories before, merged or pruned, memories after)
+    collection = get_memories_collection(chat_id)
+    # The vector store is shared with the running app: hold its lock so no write lands between the plan and the rewrite
+    with collection.locked() if hasattr(collection, "locked") else contextlib.nullcontext():
+        stored = collection.get(include=["embeddings", "metadatas"])
+        updates, deleted = plan_compaction(stored["ids"], stored["embeddings"], stored["metadatas"], datetime.now(TIMEZONE), **policy)
+        total = len(stored["ids"])
+        if dry_run or not (updates or deleted):
+            return total, len(deleted), total - len(deleted)
+
+        if updates:
+            collection.update(ids=list(updates), metadatas=list(updates.values()))
+        if deleted:
+            collection.delete(ids=deleted)
+        if hasattr(collection, "compact"):
+            collection.compact()  # Vector store: rewrite without the deleted rows
+        return total, len(deleted), collection.count()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Merge near-duplicate and prune old memories of each Klaus user.")
+    parser.add_argument("--chat-id", help="only compact the memories of this user")
+    parser.add_argument("--retention-days", type=float, default=MEMORY_RETENTION_DAYS, help=f"only memories not seen for this long are merged or pruned (default: {MEMORY_RETENTION_DAYS:g})")
+    parser.add_argument("--threshold", type=float, default=MEMORY_COMPACTION_THRESHOLD, help=f"cosine similarity that merges two memories (default: {MEMORY_COMPACTION_THRESHOLD:g})")
+    parser.add_argument("--max-memories", type=int, default=MEMORY_MAX_PER_USER, help=f"memories kept per user, 0 for no cap (default: {MEMORY_MAX_PER_USER})")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be removed without writing")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if MEMORY_BACKEND != "numpy" and not args.dry_run:
+        logger.warning("⚠️ [WARNING] Chroma doesn't support two processes on one directory: run this job while the app is stopped.")
+
+    policy = {"retention_days": args.retention_days, "threshold": args.threshold, "max_memories": args.max_memories}
+    users = removed = failed = 0
+    for chat_id in iter_memory_users(args.chat_id):
+        try:
+            before, dropped, after = compact_user(chat_id, args.dry_run, **policy)
+        except Exception as e:
+            logger.error(f"❌ [ERROR] Couldn't compact memories for chat_id {chat_id}: {e}")
+            failed += 1
+            continue
+        users += 1
+        removed += dropped
+        logger.info(f"▶️ chat_id {chat_id}: {before} -> {after} memories{' (dry run)' if args.dry_run else ''}")
+
+    logger.info(f"✅ {removed} memories merged or pruned for {users} user(s), {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,79 @@
+import argparse
+import logging
+import os
+
+from data.memory import _close_chroma, _open_chroma, MEMORY_STORE_PATH
+
+
+# Constants
+IMPORT_BATCH_SIZE = 500
+
+# logging configuration
+logger = logging.getLogger(__name__)
+
+
+def iter_chroma_users(chat_id: str | None = None):
+    # Every per-user directory under CHROMA_STORAGE_PATH
+    storage_path = os.getenv("CHROMA_STORAGE_PATH", "./storage/chroma")
+    if chat_id:
+        if os.path.isdir(os.path.join(storage_path, chat_id)):
+            yield chat_id
+        return
+    if os.path.isdir(storage_path):
+        for name in sorted(os.listdir(storage_path)):
+            if os.path.isdir(os.path.join(storage_path, name)):
+                yield name
+
+
+def import_chroma_user(chat_id: str, dry_run: bool = False, batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    # Copies one user's Chroma memories into the numpy vector store. Ids are kept, so re-running is safe
+    entry = _open_chroma(chat_id)
+    try:
+        collection = entry[1]
+        total = collection.count()
+        if dry_run or not total:
+            return total
+
+        from data.vector_store import VectorStore
+        store = VectorStore(os.path.join(MEMORY_STORE_PATH, chat_id))
+        for offset in range(0, total, batch_size):
+            page = collection.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+            store.upsert(
+                ids=page["ids"],
+                embeddings=page["embeddings"],
+                documents=page["documents"],
+                metadatas=page["metadatas"]
+            )
+        store.compact()  # Drops the rows replaced by a previous run
+        store.close()
+        return total
+    finally:
+        _close_chroma(chat_id, entry)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Import per-user Chroma memories into the numpy vector store (MEMORY_BACKEND=numpy).")
+    parser.add_argument("--chat-id", help="only import the memories of this user")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help=f"memories read per Chroma call (default: {IMPORT_BATCH_SIZE})")
+    parser.add_argument("--dry-run", action="store_true", help="count each user's memories without writing")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    users = imported = failed = 0
+    for chat_id in iter_chroma_users(args.chat_id):
+        try:
+            count = import_chroma_user(chat_id, args.dry_run, args.batch_size)
+        except Exception as e:
+            logger.error(f"❌ [ERROR] Couldn't import memories for chat_id {chat_id}: {e}")
+            failed += 1
+            continue
+        users += 1
+        imported += count
+        logger.info(f"▶️ chat_id {chat_id}: {count} memories{' (dry run)' if args.dry_run else ''}")
+
+    logger.info(f"✅ {imported} memories from {users} user(s), {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
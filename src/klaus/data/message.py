@@ -10,15 +10,11 @@ from google.cloud.firestore_v1.collection import CollectionReference
 TIMEZONE = pytz.timezone(os.getenv("TIMEZONE", "America/Sao_Paulo"))
 
 # logging configuration
-_ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
-logging.basicConfig(level=logging.DEBUG if _ENVIRONMENT == "dev" else logging.INFO)
 logger = logging.getLogger(__name__)
 
-firestore_client = get_firestore_client()
-
 
 def _get_message_ref(chat_id: str) -> CollectionReference:
-    return firestore_client \
+    return get_firestore_client() \
         .collection("users") \
         .document(chat_id) \
         .collection("agent_messages")
@@ -0,0 +1,56 @@
+import os
+
+from cache import TTLCache
+from data.client import get_async_firestore_client, get_firestore_client
+from datetime import datetime, timezone
+from google.cloud import firestore
+from typing import Any, Dict, List, Optional
+
+
+# Rolling conversation summary, one document per user at users/{chat_id}/summaries/rolling:
+# {"text", "covered_until" (timestamp of the newest summarized message), "updated_at"}
+SUMMARY_COLLECTION = "summaries"
+SUMMARY_DOCUMENT = "rolling"
+_NO_SUMMARY = object()
+_summary_cache = TTLCache(int(os.getenv("SUMMARY_CACHE_SIZE", "1024")), float(os.getenv("SUMMARY_CACHE_TTL_SECONDS", "300")))
+
+
+def _summary_ref(client, chat_id: str):
+    return client.collection("users").document(chat_id).collection(SUMMARY_COLLECTION).document(SUMMARY_DOCUMENT)
+
+
+def _cache_snapshot(chat_id: str, snapshot) -> Optional[Dict[str, Any]]:
+    summary = snapshot.to_dict() if snapshot.exists else None
+    _summary_cache.set(chat_id, summary if summary else _NO_SUMMARY)
+    return summary
+
+
+def get_summary(chat_id: str) -> Optional[Dict[str, Any]]:
+    cached = _summary_cache.get(chat_id)
+    if cached is not None:
+        return None if cached is _NO_SUMMARY else dict(cached)
+    return _cache_snapshot(chat_id, _summary_ref(get_firestore_client(), chat_id).get())
+
+
+async def get_summary_async(chat_id: str) -> Optional[Dict[str, Any]]:
+    cached = _summary_cache.get(chat_id)
+    if cached is not None:
+        return None if cached is _NO_SUMMARY else dict(cached)
+    return _cache_snapshot(chat_id, await _summary_ref(get_async_firestore_client(), chat_id).get())
+
+
+def save_summary(chat_id: str, text: str, covered_until: str) -> Dict[str, Any]:
+    summary = {"text": text, "covered_until": covered_until, "updated_at": datetime.now(timezone.utc).isoformat()}
+    _summary_ref(get_firestore_client(), chat_id).set(summary)
+    _summary_cache.set(chat_id, summary)
+    return summary
+
+
+def get_unsummarized_messages(chat_id: str, covered_until: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    # Up to `limit` of the newest messages after `covered_until`, oldest first. Ordered like
+    # get_latest_messages so both queries share the same (chat_id, timestamp desc) index
+    query = get_firestore_client().collection("messages").where("chat_id", "==", chat_id)
+    if covered_until:
+        query = query.where("timestamp", ">", covered_until)
+    query = query.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit)
+    return [doc.to_dict() for doc in query.stream()][::-1]
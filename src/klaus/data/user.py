@@ -1,17 +1,50 @@
+import os
+
+from cache import TTLCache
 from schemas import User
-from data.client import get_firestore_client
+from data.client import get_async_firestore_client, get_firestore_client
 
 from datetime import datetime, timezone
 
 
+# Per-process profile cache: hits skip the Firestore read, missing users are cached for a shorter time
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+USER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("USER_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+_USER_NOT_FOUND = object()
+_user_cache = TTLCache(int(os.getenv("USER_CACHE_SIZE", "1024")), USER_CACHE_TTL_SECONDS)
+
+
 def _get_user_doc(chat_id: str):
     firestore_client = get_firestore_client()
     return firestore_client.collection("users").document(chat_id)
 
 
+def _get_cached_user(chat_id: str):
+    cached = _user_cache.get(chat_id)
+    if cached is None or cached is _USER_NOT_FOUND:
+        return cached
+    return cached.model_copy()  # Callers may mutate the user before saving it
+
+
 def get_user_doc(chat_id: str) -> User:
-    db_user = _get_user_doc(chat_id).get()
+    cached = _get_cached_user(chat_id)
+    if cached is not None:
+        return None if cached is _USER_NOT_FOUND else cached
+    return _cache_user_snapshot(chat_id, _get_user_doc(chat_id).get())
+
+
+async def get_user_doc_async(chat_id: str) -> User:
+    # Same cache as get_user_doc; a miss reads through the event loop's async Firestore client
+    cached = _get_cached_user(chat_id)
+    if cached is not None:
+        return None if cached is _USER_NOT_FOUND else cached
+    db_user = await get_async_firestore_client().collection("users").document(chat_id).get()
+    return _cache_user_snapshot(chat_id, db_user)
+
+
+def _cache_user_snapshot(chat_id: str, db_user) -> User:
     if not db_user.exists:
+        _user_cache.set(chat_id, _USER_NOT_FOUND, USER_CACHE_NEGATIVE_TTL_SECONDS)
         return None
 
     data = db_user.to_dict()
@@ -24,17 +57,25 @@ def get_user_doc(chat_id: str) -> User:
         habitica_token=data.get("habitica_token", ""),
         updated_at=data.get("updated_at", None)
     )
+    _user_cache.set(chat_id, user.model_copy())
     return user
 
 
+def invalidate_user_cache(chat_id: str) -> None:
+    _user_cache.pop(chat_id)
+
+
 def save_user(user: User) -> None:
     db_user = _get_user_doc(user.chat_id)
+    updated_at = datetime.now(timezone.utc).isoformat()
     db_user.set({
         "name": user.name,
         "refresh_token": user.refresh_token,
         "email": user.email,
         "habitica_id": user.habitica_id,
         "habitica_token": user.habitica_token,
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "updated_at": updated_at
     }, merge=True)  # Use merge=True to update existing fields without overwriting the entire document
-    
\ No newline at end of file
+    # Write-through: every field above was just written, so the cached copy matches the document
+    _user_cache.set(user.chat_id, user.model_copy(update={"updated_at": updated_at}))
+    
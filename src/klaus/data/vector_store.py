@@ -0,0 +1,367 @@
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+# Constants
+STORE_VERSION = 1
+GENERATION = re.compile(r"^meta-(\d+)\.jsonl$")
+LOCK_FILE = "lock"
+
+# logging configuration
+logger = logging.getLogger(__name__)
+
+
+class VectorStore:
+    """
+    Exact-search vector store for one user's memories, a lighter alternative to a Chroma directory.
+    Vectors are L2-normalized float32 rows appended to `vectors-<gen>.f32` and searched through a
+    read-only memmap; ids, documents and metadata live in the append-only `meta-<gen>.jsonl` log.
+    Implements the part of the Chroma collection API that data.memory uses (add, upsert, update,
+    get, delete, query, count); query distances are cosine distances (1 - similarity).
+    Several processes may open the same store: writes and compaction hold an exclusive flock on
+    the directory, reads a shared one, and each call first catches up with what others wrote.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dim: Optional[int] = None
+        self._lock = threading.RLock()
+        self._rows: Dict[str, int] = {}  # id -> live row
+        self._entries: Dict[int, Dict[str, Any]] = {}  # live row -> {"id", "document", "metadata"}
+        self._alive = np.zeros(0, dtype=bool)
+        self._next_row = 0
+        self._updates = 0  # Metadata-only records in the log, folded away by compact()
+        self._meta_offset = 0  # How much of the metadata log has been applied
+        self._matrix: Optional[np.memmap] = None
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = None
+        self._pid: Optional[int] = None
+        self._held = False  # Whether this instance holds the file lock (see locked())
+        self._generation = -1  # Loaded by the first call
+        with self._locked():
+            pass
+
+
+    def _latest_generation(self) -> int:
+        generations = [int(m.group(1)) for m in map(GENERATION.match, os.listdir(self.path)) if m]
+        return max(generations, default=0)
+
+
+    def _vectors_path(self, generation: Optional[int] = None) -> str:
+        return os.path.join(self.path, f"vectors-{self._generation if generation is None else generation}.f32")
+
+
+    def _meta_path(self, generation: Optional[int] = None) -> str:
+        return os.path.join(self.path, f"meta-{self._generation if generation is None else generation}.jsonl")
+
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False) -> Iterator[None]:
+        with self._lock:
+            if self._held:
+                yield  # Inside locked(), which already holds the exclusive lock
+                return
+            if self._pid != os.getpid():
+                # A descriptor inherited across fork() would share its lock with the parent
+                self._lock_file = open(os.path.join(self.path, LOCK_FILE), "a")
+                self._pid = os.getpid()
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._held = True
+            try:
+                self._refresh(exclusive)
+                yield
+            finally:
+                self._held = False
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+
+    def locked(self):
+        # Holds the exclusive lock across several calls, so a read-modify-write (like a compaction job)
+        # doesn't race with writes from other processes
+        return self._locked(exclusive=True)
+
+
+    def _refresh(self, exclusive: bool = False) -> None:
+        # Catches up with other processes: a compaction means a new generation, otherwise new log records
+        generation = self._latest_generation()
+        if generation != self._generation:
+            self._matrix = None
+            self._generation = generation
+            self.dim = None
+            self._rows, self._entries, self._alive, self._updates, self._meta_offset = {}, {}, np.zeros(0, dtype=bool), 0, 0
+        self._load(exclusive)
+
+
+    def _load(self, exclusive: bool) -> None:
+        # Replays the metadata log from where the last call stopped; vectors stay on disk until a query maps them.
+        # Readers skip what a killed writer left half-written; the next writer cuts it off before appending
+        meta_path = self._meta_path()
+        if os.path.exists(meta_path) and os.path.getsize(meta_path) > self._meta_offset:
+            with open(meta_path, "r+b" if exclusive else "rb") as meta:
+                meta.seek(self._meta_offset)
+                data = meta.read()
+                complete = data.rfind(b"\n") + 1
+                if complete < len(data) and exclusive:
+                    # So the next record starts on its own line
+                    logger.warning(f"⚠️ [WARNING] Dropping a torn record at the end of {meta_path}")
+                    meta.truncate(self._meta_offset + complete)
+                for line in data[:complete].splitlines():
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"⚠️ [WARNING] Skipping unreadable line in {meta_path}")
+                        continue
+                    self._apply(record)
+                self._meta_offset += complete
+
+        # The vector file decides where rows end: vectors are written before the metadata that points at them
+        size = os.path.getsize(self._vectors_path()) if os.path.exists(self._vectors_path()) else 0
+        if not self.dim:
+            if size and exclusive:
+                with open(self._vectors_path(), "r+b") as vectors:
+                    vectors.truncate(0)  # Vectors of a first write whose header never made it to the log
+            self._next_row = 0
+            return
+        row_bytes = self.dim * 4
+        if size % row_bytes and exclusive:
+            with open(self._vectors_path(), "r+b") as vectors:
+                vectors.truncate(size - size % row_bytes)  # So appended rows stay aligned
+        available = size // row_bytes
+        for row in [row for row in self._entries if row >= available]:
+            self._drop_row(row)  # Metadata written but its vector never reached the disk
+        self._next_row = available
+        self._reserve(self._next_row)
+
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        op = record.get("op")
+        if op == "header":
+            self.dim = record["dim"]
+        elif op == "add":
+            previous = self._rows.get(record["id"])
+            if previous is not None:
+                self._drop_row(previous)
+            row = record["row"]
+            if row in self._entries:
+                self._drop_row(row)  # The row was lost in a crash and reused; the later record wins
+            self._rows[record["id"]] = row
+            self._entries[row] = {"id": record["id"], "document": record.get("document"), "metadata": record.get("metadata") or {}}
+            self._set_alive(row, True)
+            self._next_row = max(self._next_row, row + 1)
+        elif op == "update":
+            row = self._rows.get(record["id"])
+            if row is not None:
+                entry = self._entries[row]
+                if record.get("document") is not None:
+                    entry["document"] = record["document"]
+                if record.get("metadata") is not None:
+                    entry["metadata"] = record["metadata"]
+                self._updates += 1
+        elif op == "delete":
+            row = self._rows.get(record["id"])
+            if row is not None:
+                self._drop_row(row)
+
+
+    def _drop_row(self, row: int) -> None:
+        entry = self._entries.pop(row, None)
+        if entry and self._rows.get(entry["id"]) == row:
+            del self._rows[entry["id"]]
+        self._set_alive(row, False)
+
+
+    def _set_alive(self, row: int, alive: bool) -> None:
+        self._reserve(row + 1)
+        self._alive[row] = alive
+
+
+    def _reserve(self, rows: int) -> None:
+        if rows > len(self._alive):
+            grown = np.zeros(max(rows, 2 * len(self._alive), 64), dtype=bool)
+            grown[:len(self._alive)] = self._alive
+            self._alive = grown
+
+
+    def _append(self, vectors: np.ndarray, records: List[Dict[str, Any]]) -> None:
+        # Called under the exclusive lock. Vectors first, then their metadata: after a crash in between,
+        # _load treats the file size as the end of the rows and the unreferenced ones are never returned
+        if vectors.size:
+            with open(self._vectors_path(), "ab") as file:
+                file.write(vectors.tobytes())
+        with open(self._meta_path(), "ab") as file:
+            file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8"))
+            self._meta_offset = file.tell()
+        for record in records:
+            self._apply(record)
+
+
+    def _matrix_view(self) -> np.ndarray:
+        # Remapped only when rows were appended since the last query
+        if self._matrix is None or self._matrix.shape[0] < self._next_row:
+            self._matrix = np.memmap(self._vectors_path(), dtype=np.float32, mode="r", shape=(self._next_row, self.dim))
+        return self._matrix[:self._next_row]
+
+
+    def _normalize(self, embeddings: Iterable[Iterable[float]]) -> np.ndarray:
+        vectors = np.asarray(list(embeddings), dtype=np.float32)
+        if vectors.ndim != 2 or (self.dim is not None and vectors.shape[1] != self.dim):
+            raise ValueError(f"Embeddings must have dimension {self.dim}, got shape {vectors.shape}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+    def _write(self, ids: List[str], embeddings, documents: Optional[List[str]], metadatas: Optional[List[Dict[str, Any]]]) -> None:
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        records: List[Dict[str, Any]] = []
+        if self.dim is None:
+            records.append({"op": "header", "version": STORE_VERSION, "dim": int(vectors.shape[1])})
+        for offset, item_id in enumerate(ids):
+            records.append({
+                "op": "add",
+                "id": item_id,
+                "row": self._next_row + offset,  # Taken from the vector file's size when the lock was acquired
+                "document": documents[offset] if documents else None,
+                "metadata": metadatas[offset] if metadatas else {}
+            })
+        self._append(vectors, records)
+
+
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None, metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        # Like Chroma, ids that already exist are left untouched
+        with self._locked(exclusive=True):
+            keep = [i for i, item_id in enumerate(ids) if item_id not in self._rows and item_id not in ids[:i]]
+            embeddings = list(embeddings)
+            self._write(
+                [ids[i] for i in keep],
+                [embeddings[i] for i in keep],
+                [documents[i] for i in keep] if documents else None,
+                [metadatas[i] for i in keep] if metadatas else None
+            )
+
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None, metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        # Append-only: a replaced id gets a new row and its old row just stops matching
+        with self._locked(exclusive=True):
+            self._write(list(ids), embeddings, documents, metadatas)
+
+
+    def update(self, ids: List[str], documents: Optional[List[str]] = None, metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        # Documents and metadata only; the vector is kept
+        with self._locked(exclusive=True):
+            records = [
+                {
+                    "op": "update",
+                    "id": item_id,
+                    "document": documents[i] if documents else None,
+                    "metadata": metadatas[i] if metadatas else None
+                }
+                for i, item_id in enumerate(ids) if item_id in self._rows
+            ]
+            if records:
+                self._append(np.zeros(0, dtype=np.float32), records)
+
+
+    def delete(self, ids: List[str]) -> None:
+        with self._locked(exclusive=True):
+            records = [{"op": "delete", "id": item_id} for item_id in ids if item_id in self._rows]
+            if records:
+                self._append(np.zeros(0, dtype=np.float32), records)
+
+
+    def count(self) -> int:
+        with self._locked():
+            return len(self._rows)
+
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas"]
+        with self._locked():
+            rows = [self._rows[item_id] for item_id in ids if item_id in self._rows] if ids is not None else sorted(self._entries)
+            result: Dict[str, Any] = {"ids": [self._entries[row]["id"] for row in rows]}
+            if "documents" in include:
+                result["documents"] = [self._entries[row]["document"] for row in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [dict(self._entries[row]["metadata"]) for row in rows]
+            if "embeddings" in include:
+                result["embeddings"] = np.array(self._matrix_view()[rows]) if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+        return result
+
+
+    def query(self, query_embeddings, n_results: int = 10, include: Optional[List[str]] = None) -> Dict[str, List[List[Any]]]:
+        # Exact top-k: one matrix-vector product over the mapped rows, argpartition, then sort the k winners
+        include = include or ["documents", "metadatas", "distances"]
+        result: Dict[str, List[List[Any]]] = {key: [] for key in ["ids"] + include}
+        with self._locked():
+            live = len(self._rows)
+            matrix = self._matrix_view() if live else None
+            alive = self._alive[:self._next_row]
+            for query in self._normalize(query_embeddings) if live else [None for _ in query_embeddings]:
+                k = min(n_results, live)
+                if not k:
+                    for key in result:
+                        result[key].append([])
+                    continue
+                scores = matrix @ query
+                scores[~alive] = -np.inf
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                entries = [self._entries[int(row)] for row in top]
+                result["ids"].append([entry["id"] for entry in entries])
+                if "documents" in include:
+                    result["documents"].append([entry["document"] for entry in entries])
+                if "metadatas" in include:
+                    result["metadatas"].append([dict(entry["metadata"]) for entry in entries])
+                if "distances" in include:
+                    result["distances"].append([float(1 - scores[row]) for row in top])
+                if "embeddings" in include:
+                    result["embeddings"].append(np.array(matrix[top]))
+        return result
+
+
+    def compact(self) -> int:
+        # Rewrites live rows into a new generation, dropping replaced and deleted ones (and folding
+        # metadata updates). The new metadata log is renamed into place last, so a crash leaves the
+        # previous generation as the current one. Returns the number of rows dropped
+        with self._locked(exclusive=True):
+            rows = sorted(self._entries)
+            dropped = self._next_row - len(rows)
+            if not dropped and not self._updates:
+                return 0
+            generation = self._generation + 1
+            vectors = np.array(self._matrix_view()[rows]) if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+            with open(self._vectors_path(generation), "wb") as file:
+                file.write(vectors.tobytes())
+            records = [{"op": "header", "version": STORE_VERSION, "dim": self.dim}]
+            for new_row, row in enumerate(rows):
+                entry = self._entries[row]
+                records.append({"op": "add", "id": entry["id"], "row": new_row, "document": entry["document"], "metadata": entry["metadata"]})
+            temp_path = self._meta_path(generation) + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            os.replace(temp_path, self._meta_path(generation))
+
+            previous = self._generation
+            self._refresh(exclusive=True)  # Picks up the new generation, as the other processes will on their next call
+            for path in (self._vectors_path(previous), self._meta_path(previous)):
+                if os.path.exists(path):
+                    os.remove(path)
+            return dropped
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._matrix = None  # Unmapped once the last view is gone
+            if self._lock_file is not None and not self._held:
+                self._lock_file.close()
+                self._lock_file, self._pid = None, None  # Reopened if the store is used again
@@ -0,0 +1,231 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from typing import Any, Callable, Dict, List, Optional
+
+
+# logging configuration
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Background write-behind stage. Records are appended to a local spill file, queued, and
+    handed to `flush_fn` in batches by a daemon thread. Every record must carry a unique "id"
+    and `flush_fn` must be idempotent: records not acknowledged in the spill file are replayed
+    on the next start, so writes survive the instance being killed.
+    Each process spills to its own `<spill_path stem>.<pid><ext>` file and holds a lock on it
+    while alive; files whose lock is free belong to dead processes and are adopted on start.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Dict[str, Any]]], None],
+        max_queue: int = 1000,
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        spill_path: Optional[str] = None
+    ):
+        self.flush_fn = flush_fn
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(1, max_queue))
+        self._spill_lock = threading.Lock()
+        self._outstanding = 0
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._spill_file = None  # This process's spill file, flock-ed while the process lives
+
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        self._ensure_started()
+        self._spill({"op": "put", "record": record})
+        try:
+            self._queue.put(record, timeout=self.flush_interval)
+        except queue.Full:
+            # Backpressure: the queue is bounded, so the caller pays for the write instead of growing memory
+            logger.warning("⚠️ [WARNING] Write-behind queue is full, writing synchronously.")
+            self._flush([record])
+
+
+    def close(self) -> None:
+        if not self._thread or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._release_spill()
+
+
+    def _ensure_started(self) -> None:
+        # Threads don't survive fork(), so each process starts (and replays) its own worker
+        if self._thread and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread and self._pid == os.getpid():
+                return
+            if self._spill_file and self._pid != os.getpid():
+                # Inherited from the parent: drop our copy so the parent's lock ends with the parent
+                self._spill_file.close()
+                self._spill_file = None
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            pending = self._replay_spill()
+            self._thread = threading.Thread(target=self._run, args=(pending,), name="write-behind", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+
+    def _run(self, pending: List[Dict[str, Any]]) -> None:
+        while pending:
+            self._flush_with_retry(pending[:self.batch_size])
+            pending = pending[self.batch_size:]
+
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._flush_with_retry(batch)
+            elif self._stop.is_set():
+                break
+
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        batch: List[Dict[str, Any]] = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+
+    def _flush_with_retry(self, batch: List[Dict[str, Any]]) -> None:
+        delay = self.flush_interval
+        while not self._flush(batch):
+            if self._stop.is_set():
+                # Shutting down: leave the batch in the spill file to be replayed on the next start
+                return
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> bool:
+        try:
+            self.flush_fn(batch)
+        except Exception as e:
+            logger.error(f"❌ [ERROR] Write-behind flush of {len(batch)} record(s) failed: {e}")
+            return False
+        self._spill({"op": "ack", "ids": [record["id"] for record in batch]})
+        return True
+
+
+    def _spill(self, entry: Dict[str, Any]) -> None:
+        if not self._spill_file:
+            return
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._spill_lock:
+            if entry["op"] == "put":
+                self._outstanding += 1
+            else:
+                self._outstanding = max(0, self._outstanding - len(entry["ids"]))
+            # Once every record is acknowledged the log carries no information, so start it over
+            if self._outstanding == 0:
+                self._spill_file.truncate(0)
+            else:
+                self._spill_file.write(line)
+            self._spill_file.flush()
+
+
+    def _process_spill_path(self, pid: int) -> str:
+        stem, ext = os.path.splitext(self.spill_path)
+        return f"{stem}.{pid}{ext}"
+
+
+    def _replay_spill(self) -> List[Dict[str, Any]]:
+        if not self.spill_path:
+            return []
+        directory = os.path.dirname(self.spill_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        own_path = self._process_spill_path(os.getpid())
+        stem, ext = os.path.splitext(self.spill_path)
+        pending: Dict[str, Dict[str, Any]] = {}
+        adopted = 0
+        with self._spill_lock, open(self.spill_path + ".lock", "a") as directory_lock:
+            # Serializes processes starting at the same time, so a file is adopted once and a
+            # new process holds its own lock before anyone else looks at it
+            fcntl.flock(directory_lock, fcntl.LOCK_EX)
+            spill_file = open(own_path, "a+", encoding="utf-8")
+            fcntl.flock(spill_file, fcntl.LOCK_EX)
+            spill_file.seek(0)
+            self._read_spill(spill_file, pending)  # Left by an earlier process with our pid
+
+            # Other processes' files, plus the un-suffixed one older versions shared
+            others = [path for path in glob.glob(glob.escape(stem) + ".*" + glob.escape(ext)) if path[len(stem) + 1:len(path) - len(ext)].isdigit()]
+            for path in [self.spill_path] + sorted(others):
+                if path == own_path or not os.path.exists(path):
+                    continue
+                with open(path, "r", encoding="utf-8") as orphan:
+                    try:
+                        fcntl.flock(orphan, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # Its process is still running
+                    adopted += self._read_spill(orphan, pending)
+                    os.remove(path)
+
+            # Rewrite the file with only the unacknowledged records
+            spill_file.truncate(0)
+            for record in pending.values():
+                spill_file.write(json.dumps({"op": "put", "record": record}, ensure_ascii=False) + "\n")
+            spill_file.flush()
+            self._spill_file = spill_file
+            self._outstanding = len(pending)
+
+        if pending:
+            logger.warning(f"⚠️ [WARNING] Replaying {len(pending)} unflushed write(s) ({adopted} from stopped processes) from {own_path}")
+        return list(pending.values())
+
+
+    def _read_spill(self, spill, pending: Dict[str, Dict[str, Any]]) -> int:
+        # Folds a spill log into `pending`; returns how many records it still had outstanding
+        records: Dict[str, Dict[str, Any]] = {}
+        for line in spill:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Torn last line from a killed instance
+            if entry.get("op") == "put":
+                records[entry["record"]["id"]] = entry["record"]
+            elif entry.get("op") == "ack":
+                for record_id in entry.get("ids", []):
+                    records.pop(record_id, None)
+        pending.update(records)
+        return len(records)
+
+
+    def _release_spill(self) -> None:
+        # Removes the file once nothing is outstanding, otherwise leaves it for the next process to adopt
+        if not self._spill_file:
+            return
+        with self._spill_lock, open(self.spill_path + ".lock", "a") as directory_lock:
+            fcntl.flock(directory_lock, fcntl.LOCK_EX)
+            if self._outstanding == 0:
+                os.remove(self._spill_file.name)
+            self._spill_file.close()
+            self._spill_file = None
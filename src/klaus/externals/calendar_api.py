@@ -1,49 +1,214 @@
 import os
 import pytz
 import logging
+import threading
+import time
+import httplib2
 
 from auth.credentials import load_credentials
+from cache import LRUCache, TTLCache
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+from typing import Any, Dict, List
 
 
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 TOKEN_URI = "https://oauth2.googleapis.com/token"
 TIMEZONE = pytz.timezone(os.getenv("TIMEZONE", "America/Sao_Paulo"))
+CALENDAR_SERVICE_MAX_TTL_SECONDS = float(os.getenv("CALENDAR_SERVICE_MAX_TTL_SECONDS", "3600"))
+CALENDAR_SYNC_INTERVAL_SECONDS = float(os.getenv("CALENDAR_SYNC_INTERVAL_SECONDS", "30"))
+CALENDAR_SYNC_WINDOW_DAYS = int(os.getenv("CALENDAR_SYNC_WINDOW_DAYS", "14"))
+EVENTS_PAGE_SIZE = 250
 
 
 # logging configuration
-_ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
-logging.basicConfig(level=logging.DEBUG if _ENVIRONMENT == "dev" else logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The bundled (static) discovery document is read once per process
+_discovery_document = None
+_discovery_lock = threading.Lock()
+
+# Built services per chat_id, kept while their credentials are valid
+_services = TTLCache(int(os.getenv("CALENDAR_SERVICE_CACHE_SIZE", "256")), CALENDAR_SERVICE_MAX_TTL_SECONDS)
+
+# httplib2 connections aren't thread-safe, so each thread keeps its own
+_thread_local = threading.local()
+
+
+def _get_discovery_document() -> str:
+    global _discovery_document
+    if _discovery_document is None:
+        with _discovery_lock:
+            if _discovery_document is None:
+                from googleapiclient import discovery_cache  # googleapiclient is imported on the first calendar call
+                _discovery_document = discovery_cache.get_static_doc("calendar", "v3")
+    return _discovery_document
+
+
+def _thread_http() -> httplib2.Http:
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = httplib2.Http(timeout=30)
+        _thread_local.http = http
+    return http
+
+
+def _build_service(creds: Credentials):
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import HttpRequest
+
+    def build_request(http, *args, **kwargs):
+        # A shared service object is used from many threads: authorize each request on this thread's connection
+        return HttpRequest(AuthorizedHttp(creds, http=_thread_http()), *args, **kwargs)
+
+    return build_from_document(
+        _get_discovery_document(),
+        http=AuthorizedHttp(creds, http=_thread_http()),
+        requestBuilder=build_request
+    )
+
+
+def _get_service(chat_id: str):
+    service = _services.get(chat_id)
+    if service is not None:
+        return service
+
+    creds = load_credentials(chat_id, SCOPES)
+    service = _build_service(creds)
+    ttl = CALENDAR_SERVICE_MAX_TTL_SECONDS
+    if creds.expiry:
+        # google-auth keeps expiry as naive UTC
+        remaining = (creds.expiry.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)).total_seconds()
+        ttl = min(ttl, remaining)
+    if ttl > 0:
+        _services.set(chat_id, service, ttl)
+    return service
+
+
+def invalidate_service(chat_id: str) -> None:
+    _services.pop(chat_id)
+
+
+# Per-user event store: filled by a windowed full sync, then kept current with syncToken deltas
+_event_stores = LRUCache(int(os.getenv("CALENDAR_EVENT_STORE_SIZE", "256")))
+
+
+def _new_event_store() -> Dict[str, Any]:
+    return {"lock": threading.Lock(), "events": {}, "sync_token": None, "start": None, "end": None, "synced_at": 0.0}
+
+
+def _event_bounds(event: Dict[str, Any]) -> tuple:
+    # All-day events only carry a date, which is midnight in the user's timezone
+    bounds = []
+    for field in ("start", "end"):
+        value = event.get(field, {})
+        if "dateTime" in value:
+            bounds.append(datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00")))
+        else:
+            bounds.append(TIMEZONE.localize(datetime.strptime(value["date"], "%Y-%m-%d")))
+    return tuple(bounds)
+
+
+def _apply_events(store: Dict[str, Any], items: List[Dict[str, Any]]) -> None:
+    for event in items:
+        if event.get("status") == "cancelled":
+            store["events"].pop(event["id"], None)
+        else:
+            store["events"][event["id"]] = event
+
+
+def _list_pages(service, store: Dict[str, Any], **params) -> None:
+    # Streams every page into the store; the last page carries the token for the next delta
+    page_token = None
+    while True:
+        response = service.events().list(
+            calendarId="primary", singleEvents=True, maxResults=EVENTS_PAGE_SIZE, pageToken=page_token, **params
+        ).execute()
+        _apply_events(store, response.get("items", []))
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            store["sync_token"] = response.get("nextSyncToken")
+            store["synced_at"] = time.monotonic()
+            return
+
+
+def _full_sync(service, store: Dict[str, Any], start: datetime, end: datetime) -> None:
+    store["events"] = {}
+    store["start"], store["end"] = start, end
+    _list_pages(service, store, timeMin=start.isoformat(), timeMax=end.isoformat())
+
+
+def _incremental_sync(service, store: Dict[str, Any]) -> None:
+    _list_pages(service, store, syncToken=store["sync_token"])
+    # Deltas aren't limited to the window, so drop whatever falls outside it
+    for event_id, event in list(store["events"].items()):
+        event_start, event_end = _event_bounds(event)
+        if event_start >= store["end"] or event_end <= store["start"]:
+            del store["events"][event_id]
+
+
+def _sync_event_store(chat_id: str, store: Dict[str, Any], start: datetime, end: datetime) -> None:
+    service = _get_service(chat_id)
+    covered = store["sync_token"] and store["start"] <= start and end <= store["end"]
+    if not covered:
+        # Cover the request and the next days so nearby queries don't refetch; past windows aren't kept
+        today = datetime.now(TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        window_start = min(start, today)
+        window_end = max(end, today + timedelta(days=CALENDAR_SYNC_WINDOW_DAYS))
+        _full_sync(service, store, window_start, window_end)
+        return
+
+    if time.monotonic() - store["synced_at"] < CALENDAR_SYNC_INTERVAL_SECONDS:
+        return
+    from googleapiclient.errors import HttpError
+    try:
+        _incremental_sync(service, store)
+    except HttpError as e:
+        if e.resp.status != 410:
+            raise
+        # Sync token expired: start over with the same window
+        _full_sync(service, store, store["start"], store["end"])
+
+
+def list_events(chat_id: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    # Events overlapping [start, end), ordered by start time
+    store = _event_stores.get_or_create(chat_id, _new_event_store)
+    with store["lock"]:
+        try:
+            _sync_event_store(chat_id, store, start, end)
+        except Exception:
+            invalidate_service(chat_id)
+            _event_stores.pop(chat_id)
+            raise
+        events = list(store["events"].values())
+
+    in_range = []
+    for event in events:
+        event_start, event_end = _event_bounds(event)
+        if event_start < end and event_end > start:
+            in_range.append((event_start, event))
+    return [event for _, event in sorted(in_range, key=lambda item: item[0])]
+
 
 def list_today_events(chat_id: str) -> list[str]:
     try:
-        creds = load_credentials(chat_id, SCOPES)
-        service = build("calendar", "v3", credentials=creds)
-        now = datetime.now(TIMEZONE).isoformat()
-        end = datetime.now(TIMEZONE).replace(hour=23, minute=59, second=59, microsecond=0).isoformat()
-        events = service.events().list(
-            calendarId="primary", timeMin=now, timeMax=end,
-            singleEvents=True, orderBy="startTime"
-        ).execute().get("items", [])
+        now = datetime.now(TIMEZONE)
+        end = now.replace(hour=23, minute=59, second=59, microsecond=0)
+        events = list_events(chat_id, now, end)
         if not events:
             return ["Nenhum evento para hoje."]
         return [
-            f"📅 {e['summary']} – {datetime.fromisoformat(e['start'].get('dateTime', e['start'].get('date'))).strftime('%H:%M') if 'dateTime' in e['start'] else 'Dia todo'}"
+            f"📅 {e.get('summary', '')} – {datetime.fromisoformat(e['start'].get('dateTime', e['start'].get('date'))).strftime('%H:%M') if 'dateTime' in e['start'] else 'Dia todo'}"
             for e in events
         ]
     except Exception as e:
-        logger.error("❌ [ERROR] Error listing events:", repr(e))
+        logger.error(f"❌ [ERROR] Error listing events: {e!r}")
         raise
 
 def create_event(chat_id: str, summary: str, start: str, end: str) -> str:
-    creds = load_credentials(chat_id, SCOPES)
-    service = build("calendar", "v3", credentials=creds)
+    service = _get_service(chat_id)
 
     start_dt = TIMEZONE.localize(datetime.strptime(start, "%d/%m/%Y %H:%M"))
     end_dt   = TIMEZONE.localize(
@@ -55,5 +220,15 @@ def create_event(chat_id: str, summary: str, start: str, end: str) -> str:
         "start":   {"dateTime": start_dt.isoformat(), "timeZone": str(TIMEZONE)},
         "end":     {"dateTime": end_dt.isoformat(),   "timeZone": str(TIMEZONE)},
     }
-    created = service.events().insert(calendarId="primary", body=event).execute()
+    try:
+        created = service.events().insert(calendarId="primary", body=event).execute()
+    except Exception:
+        invalidate_service(chat_id)
+        raise
+
+    # Show our own write right away; the next incremental sync confirms it
+    store = _event_stores.get(chat_id)
+    if store is not None:
+        with store["lock"]:
+            _apply_events(store, [created])
     return f"Evento criado: {created.get('htmlLink')}"
\ No newline at end of file
@@ -0,0 +1,34 @@
+import os
+import threading
+
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from google import genai
+
+
+# One Gemini client for the whole process. google-genai takes about a second to import, so it is
+# only loaded when the first request actually needs the model (not on a /check-message cold start).
+_client: Optional["genai.Client"] = None
+_client_lock = threading.Lock()
+
+
+def get_genai_client() -> "genai.Client":
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                _client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    return _client
+
+
+def _reset_after_fork() -> None:
+    # The client's HTTP pools belong to the parent; the child builds its own
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,13 +1,34 @@
-import requests
+import asyncio
 import os
 import pytz
-from rapidfuzz import fuzz
-from typing import Any, Dict, List, Optional
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 
+from cache import LRUCache
+from externals import transport
+from fuzzy_index import FuzzyIndex
+
 
 # Constants
 TIMEZONE = pytz.timezone(os.getenv("TIMEZONE", "America/Sao_Paulo"))
+TASKS_CACHE_TTL_SECONDS = float(os.getenv("TASKS_CACHE_TTL_SECONDS", "60"))
+TASKS_CACHE_STALE_SECONDS = float(os.getenv("TASKS_CACHE_STALE_SECONDS", "600"))
+
+# logging configuration
+logger = logging.getLogger(__name__)
+
+# Task snapshots per (habitica user, due date) - the full list uses None as due date.
+# Fresh for TASKS_CACHE_TTL_SECONDS, then served stale while a background refresh runs.
+_task_snapshots = LRUCache(int(os.getenv("TASKS_CACHE_SIZE", "256")))
+# Writes this process made per habitica user, to spot fetches that started before one of them
+_task_writes = LRUCache(int(os.getenv("TASKS_CACHE_SIZE", "256")))
+_snapshots_lock = threading.Lock()
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+_refresh_tasks: set = set()  # Strong references to in-flight async refreshes, the loop only keeps weak ones
 
 
 def _get_headers(user_id: str, api_token: str) -> Dict[str, str]:
@@ -18,43 +39,164 @@ def _get_headers(user_id: str, api_token: str) -> Dict[str, str]:
     }
 
 
-def _get_tasks_from_habitica(user_id: str, api_token: str, today_only: bool = False) -> List[Dict[str, Any]]:
-
+def _tasks_url(today_only: bool) -> str:
     url = "https://habitica.com/api/v3/tasks/user"
     if today_only:
         current_date = datetime.now(TIMEZONE).strftime("%Y-%m-%d")
         url += f"?duedate={current_date}"
-    response = requests.get(url, headers=_get_headers(user_id, api_token))
+    return url
+
+
+def _get_tasks_from_habitica(user_id: str, api_token: str, today_only: bool = False) -> List[Dict[str, Any]]:
+
+    response = transport.get(_tasks_url(today_only), headers=_get_headers(user_id, api_token))
     if response.status_code == 200:
         return response.json()["data"]
     else:
         raise Exception(f"Error fetching tasks: {response.status_code}")
 
 
+async def _get_tasks_from_habitica_async(user_id: str, api_token: str, today_only: bool = False) -> List[Dict[str, Any]]:
+
+    response = await transport.aget(_tasks_url(today_only), headers=_get_headers(user_id, api_token))
+    if response.status_code == 200:
+        return response.json()["data"]
+    else:
+        raise Exception(f"Error fetching tasks: {response.status_code}")
+
+
+def _snapshot_key(user_id: str, today_only: bool) -> Tuple[str, Optional[str]]:
+    return (user_id, datetime.now(TIMEZONE).strftime("%Y-%m-%d") if today_only else None)
+
+
+def _write_count(user_id: str) -> int:
+    return _task_writes.peek(user_id, 0)
+
+
+def _store_snapshot(key: Tuple[str, Optional[str]], tasks: List[Dict[str, Any]], writes: int) -> Dict[str, Any]:
+    # `writes` is the user's write count when the fetch started. If one of our writes was patched in since,
+    # the fetched tasks may predate it: they are returned but not cached, so the patched snapshot stays
+    snapshot = {"tasks": tasks, "fetched_at": time.monotonic()}
+    with _snapshots_lock:
+        if _write_count(key[0]) == writes:
+            _task_snapshots.set(key, snapshot)
+    return snapshot
+
+
+def _refresh_snapshot(key: Tuple[str, Optional[str]], api_token: str) -> None:
+    try:
+        writes = _write_count(key[0])
+        _store_snapshot(key, _get_tasks_from_habitica(key[0], api_token, key[1] is not None), writes)
+    except Exception as e:
+        logger.error(f"❌ [ERROR] Error refreshing habitica tasks in background: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+async def _refresh_snapshot_async(key: Tuple[str, Optional[str]], api_token: str) -> None:
+    try:
+        writes = _write_count(key[0])
+        _store_snapshot(key, await _get_tasks_from_habitica_async(key[0], api_token, key[1] is not None), writes)
+    except Exception as e:
+        logger.error(f"❌ [ERROR] Error refreshing habitica tasks in background: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def _snapshot_state(key: Tuple[str, Optional[str]]) -> Tuple[Optional[Dict[str, Any]], bool]:
+    # (usable snapshot or None, whether a background refresh should start now)
+    snapshot = _task_snapshots.get(key)
+    if snapshot is None:
+        return None, False
+    age = time.monotonic() - snapshot["fetched_at"]
+    if age > TASKS_CACHE_STALE_SECONDS:
+        return None, False
+    if age <= TASKS_CACHE_TTL_SECONDS:
+        return snapshot, False
+    with _refreshing_lock:
+        start_refresh = key not in _refreshing
+        _refreshing.add(key)
+    return snapshot, start_refresh
+
+
+def _get_task_snapshot(user_id: str, api_token: str, today_only: bool = False) -> Dict[str, Any]:
+    key = _snapshot_key(user_id, today_only)
+    snapshot, start_refresh = _snapshot_state(key)
+
+    if snapshot is None:
+        writes = _write_count(user_id)
+        snapshot = _store_snapshot(key, _get_tasks_from_habitica(user_id, api_token, today_only), writes)
+    elif start_refresh:
+        threading.Thread(target=_refresh_snapshot, args=(key, api_token), daemon=True).start()
+    return snapshot
+
+
+async def _get_task_snapshot_async(user_id: str, api_token: str, today_only: bool = False) -> Dict[str, Any]:
+    key = _snapshot_key(user_id, today_only)
+    snapshot, start_refresh = _snapshot_state(key)
+
+    if snapshot is None:
+        writes = _write_count(user_id)
+        snapshot = _store_snapshot(key, await _get_tasks_from_habitica_async(user_id, api_token, today_only), writes)
+    elif start_refresh:
+        task = asyncio.create_task(_refresh_snapshot_async(key, api_token))
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
+    return snapshot
+
+
+def _get_task_index(snapshot: Dict[str, Any]) -> FuzzyIndex:
+    # Built once per snapshot, over the tasks that can be completed
+    index = snapshot.get("index")
+    if index is None:
+        index = FuzzyIndex((t, t.get("text", "")) for t in snapshot["tasks"] if t.get("type") in ("todo", "daily"))
+        snapshot["index"] = index
+    return index
+
+
+def _patch_snapshots(user_id: str, patch) -> None:
+    # Applies our own writes to every cached view of this user, so they don't force a refetch.
+    # `patch` must be idempotent: a snapshot fetched after the write already contains it
+    with _snapshots_lock:
+        _task_writes.set(user_id, _write_count(user_id) + 1)
+        for key in (_snapshot_key(user_id, False), _snapshot_key(user_id, True)):
+            snapshot = _task_snapshots.get(key)
+            if snapshot:
+                _task_snapshots.set(key, {"tasks": patch(snapshot["tasks"]), "fetched_at": snapshot["fetched_at"]})
+
+
 def find_task_by_message(user_id: str, api_token: str, message: str, threshold: int = 80) -> Dict[str, Any]:
-    # Searches 'todo' and 'daily' tasks for the best Levenshtein match to `message`.
+    # Searches 'todo' and 'daily' tasks for the best Levenshtein match to `message` (case and accent insensitive).
     # Returns a dict with 'id', 'title' and 'score'. Raises if best score < threshold.
-    best_score = 0
-    best_task: Optional[Dict[str, Any]] = None
+    match = find_tasks_by_message(user_id, api_token, message, limit=1)
+    best_score = match[0]["score"] if match else 0
 
-    tasks = _get_tasks_from_habitica(user_id, api_token)
+    if not match or best_score < threshold:
+        raise Exception(f"No matching task found for '{message}'. Best score: {best_score}%.")
 
-    for t in tasks:
-        if t.get("type") not in ("todo", "daily"):
-            continue
-        title = t.get("text", "")
-        score = fuzz.ratio(message, title)
-        if score > best_score:
-            best_score = score
-            best_task = t
+    return match[0]
 
-    if not best_task or best_score < threshold:
-        raise Exception(f"No matching task found for '{message}'. Best score: {best_score}%.")
 
-    return {"id": best_task["_id"], "title": best_task["text"], "score": best_score}
+def find_tasks_by_message(user_id: str, api_token: str, message: str, limit: int = 5, threshold: int = 0) -> List[Dict[str, Any]]:
+    # Top-N candidates for `message`, best first
+    index = _get_task_index(_get_task_snapshot(user_id, api_token))
+    return [
+        {"id": task["_id"], "title": title, "score": score}
+        for task, title, score in index.top(message, limit, threshold)
+    ]
 
 
 def get_tasks(user_id: str, api_token: str, today_only: bool = False) -> str:   
+    return _format_tasks(_get_task_snapshot(user_id, api_token, today_only)["tasks"])
+
+
+async def get_tasks_async(user_id: str, api_token: str, today_only: bool = False) -> str:
+    return _format_tasks((await _get_task_snapshot_async(user_id, api_token, today_only))["tasks"])
+
+
+def _format_tasks(tasks: List[Dict[str, Any]]) -> str:
     priority_mapping = {
         0.1: "Trivial",
         1: "Easy",
@@ -62,8 +204,6 @@ def get_tasks(user_id: str, api_token: str, today_only: bool = False) -> str:
         2: "Hard"
     }
 
-    tasks = _get_tasks_from_habitica(user_id, api_token, today_only)
-
     todos_text: List[str] = []
     for task in tasks:
         if task.get("type") == "todo":
@@ -102,18 +242,29 @@ def create_task_todo(user_id: str, api_token: str, text: str, notes: str = "", p
     if iso_date:
         payload["date"] = iso_date
 
-    response = requests.post(url, headers=_get_headers(user_id, api_token), json=payload)
+    response = transport.post(url, headers=_get_headers(user_id, api_token), json=payload)
     if response.status_code != 201:
         raise Exception(f"Error creating task: {response.text}")
 
-    return response.json()["data"]
+    task = response.json()["data"]
+    _patch_snapshots(user_id, lambda tasks: tasks if any(t.get("_id") == task.get("_id") for t in tasks) else tasks + [task])
+    return task
 
 
 def complete_task(user_id: str, api_token: str, task_id: str) -> Dict[str, Any]:
 
     url = f"https://habitica.com/api/v3/tasks/{task_id}/score/up"
-    response = requests.post(url, headers=_get_headers(user_id, api_token))
+    response = transport.post(url, headers=_get_headers(user_id, api_token))
     if response.status_code != 200:
         raise Exception(f"Error completing task: {response.text}")
-    
+
+    def mark_completed(tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Completed todos leave the /tasks/user listing, completed dailies stay there checked
+        return [
+            {**t, "completed": True} if t.get("_id") == task_id else t
+            for t in tasks
+            if not (t.get("_id") == task_id and t.get("type") == "todo")
+        ]
+
+    _patch_snapshots(user_id, mark_completed)
     return response.json()["data"]
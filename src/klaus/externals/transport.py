@@ -0,0 +1,164 @@
+import asyncio
+import os
+import threading
+import weakref
+import requests
+
+from google.auth.transport import requests as google_requests
+from requests.adapters import HTTPAdapter
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    import httpx
+
+
+# Constants
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "20"))
+DEFAULT_TIMEOUT: Tuple[float, float] = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+GOOGLE_AUTH_POOL = "google-auth"
+
+
+class _PooledSession(requests.Session):
+    # Keep-alive session whose requests get the default connect/read timeouts unless told otherwise
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+_sessions: Dict[str, _PooledSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def _create_session() -> _PooledSession:
+    session = _PooledSession()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(pool: str) -> requests.Session:
+    # One pooled session per host (or named pool), shared by the whole process
+    session = _sessions.get(pool)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(pool)
+        if session is None:
+            session = _create_session()
+            _sessions[pool] = session
+    return session
+
+
+def request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    return get_session(urlsplit(url).netloc).request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+class _GoogleAuthRequest(google_requests.Request):
+    # google-auth always passes its own 120 s timeout down to the session; use the pool's defaults instead
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+        return super().__call__(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+
+
+    def __del__(self):
+        pass  # The session belongs to the pool, don't close it with this wrapper
+
+
+_google_auth_request: Optional[_GoogleAuthRequest] = None
+
+
+def google_auth_request() -> google_requests.Request:
+    # google-auth transport (token refresh, cert download) backed by the shared pool.
+    # Resolve it per use rather than keeping it: after a fork the child gets its own
+    global _google_auth_request
+    if _google_auth_request is None:
+        _google_auth_request = _GoogleAuthRequest(session=get_session(GOOGLE_AUTH_POOL))
+    return _google_auth_request
+
+
+def get_transport_stats() -> Dict[str, Dict[str, int]]:
+    # Per pool: requests sent and connections opened; the difference is how many requests reused a connection
+    stats: Dict[str, Dict[str, int]] = {}
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    for pool, session in sessions.items():
+        opened = sent = 0
+        for adapter in set(session.adapters.values()):
+            pool_manager = getattr(adapter, "poolmanager", None)
+            if pool_manager is None:
+                continue
+            for connection_pool in list(pool_manager.pools._container.values()):
+                opened += connection_pool.num_connections
+                sent += connection_pool.num_requests
+        stats[pool] = {"requests": sent, "connections": opened, "reused": max(0, sent - opened)}
+    return stats
+
+
+# Async side (ASGI mode): one httpx client per event loop, since its connections are bound to the loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        import httpx  # Only the async serving mode needs it
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_POOL_MAXSIZE * HTTP_POOL_CONNECTIONS, max_keepalive_connections=HTTP_POOL_MAXSIZE)
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def arequest(method: str, url: str, **kwargs: Any) -> "httpx.Response":
+    return await get_async_client().request(method, url, **kwargs)
+
+
+async def aget(url: str, **kwargs: Any) -> "httpx.Response":
+    return await arequest("GET", url, **kwargs)
+
+
+async def apost(url: str, **kwargs: Any) -> "httpx.Response":
+    return await arequest("POST", url, **kwargs)
+
+
+async def aclose_async_client() -> None:
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def close_sessions() -> None:
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def _reset_after_fork() -> None:
+    # Pooled sockets must not be shared with a forked child; it opens its own
+    global _sessions_lock, _google_auth_request
+    _sessions.clear()
+    _google_auth_request = None
+    _sessions_lock = threading.Lock()
+    _async_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,78 @@
+import re
+import unicodedata
+
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    # Case and accent insensitive form: "Lição  de Casa" -> "licao de casa"
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return WHITESPACE.sub(" ", without_accents).strip().lower()
+
+
+class FuzzyIndex:
+    """
+    Titles normalized once at build time; every lookup is a single rapidfuzz batch call.
+    Entries are (key, title) pairs and matches are returned as (key, title, score).
+    """
+
+    def __init__(self, entries: Iterable[Tuple[Any, str]], scorer: Optional[Callable[..., float]] = None):
+        if scorer is None:
+            from rapidfuzz import fuzz  # Imported by the first lookup instead of at startup
+            scorer = fuzz.ratio
+        self.scorer = scorer
+        self.keys: List[Any] = []
+        self.titles: List[str] = []
+        for key, title in entries:
+            self.keys.append(key)
+            self.titles.append(title)
+        self._choices = [normalize_text(title) for title in self.titles]
+
+
+    def __len__(self) -> int:
+        return len(self._choices)
+
+
+    def best(self, query: str, threshold: float = 0) -> Optional[Tuple[Any, str, float]]:
+        if not self._choices:
+            return None
+        from rapidfuzz import process
+        result = process.extractOne(normalize_text(query), self._choices, scorer=self.scorer, processor=None, score_cutoff=threshold)
+        if result is None:
+            return None
+        _, score, index = result
+        return self.keys[index], self.titles[index], score
+
+
+    def top(self, query: str, limit: int = 5, threshold: float = 0) -> List[Tuple[Any, str, float]]:
+        if not self._choices:
+            return []
+        from rapidfuzz import process
+        results = process.extract(normalize_text(query), self._choices, scorer=self.scorer, processor=None, limit=limit, score_cutoff=threshold)
+        return [(self.keys[index], self.titles[index], score) for _, score, index in results]
+
+
+    def best_many(self, queries: List[str], threshold: float = 0, distinct: bool = False) -> List[Optional[Tuple[Any, str, float]]]:
+        # One score matrix for all queries instead of a lookup per query.
+        # With `distinct`, each entry is matched at most once: queries, in order, take their best entry not taken yet
+        if not self._choices or not queries:
+            return [None for _ in queries]
+        from rapidfuzz import process
+        scores = process.cdist([normalize_text(q) for q in queries], self._choices, scorer=self.scorer, processor=None, workers=-1)
+        matches: List[Optional[Tuple[Any, str, float]]] = []
+        taken: List[int] = []
+        for row in scores:
+            row[taken] = -1
+            index = int(row.argmax())
+            score = float(row[index])
+            if score < threshold:
+                matches.append(None)
+                continue
+            if distinct:
+                taken.append(index)
+            matches.append((self.keys[index], self.titles[index], score))
+        return matches
@@ -3,11 +3,11 @@ import os
 import pytz
 import re
 
-from dateparser import parse as dp_parse
 from datetime import datetime, timezone, timedelta
-from google import genai
-from google.genai import types
-from typing import List, Dict, Any, Optional
+from functools import lru_cache
+from typing import List, Dict, Any, AsyncIterator, FrozenSet, Iterator, Optional, Tuple
+
+from externals.gemini import get_genai_client
 
 
 # Constants
@@ -31,57 +31,117 @@ BASIC_INSTRUCTIONS = """
     Pense passo a passo antes de elaborar a resposta. Se algo não estiver claro, solicite esclarecimentos.
     --- INFORMAÇÕES ADICIONAIS ---
     Hoje é {TODAY_DATE}."""
-INSERTION_KEYWORDS = r'\b(?:coloque|coloca|colocar|adicione|adicionar|ponha|inclua|incluir|insira|acrescente|crie)\b'
-SHOW_KEYWORDS = r'\b(?:mostre|tenho|quais)\b'
-FINISH_KEYWORDS = r'\b(?:terminei|já fiz|concluí|acabei|finalizei)\b'
-CREATE_KEYWORDS = r'\b(crie|adicione|novo)\b'
-REMOVAL_KEYWORDS = r'\b(remova|remove|remover|exclua|excluir|delete|deletar|apague|apagar|retire|retirar|tire|tira|tirar)\b'
-BETWEEN_QUOTES = r'["“”‘’\'«»]([^"“”‘’\'\'«»]+)["“”‘’\'«»]'
+BETWEEN_QUOTES = re.compile(r'["“”‘’\'«»]([^"“”‘’\'\'«»]+)["“”‘’\'«»]')
+LIST_NAME = re.compile(r'\blista\b (?:\bde\b|\bdo\b|\bda\b) ([\wçãõáéíóúâêôàèìòùü\s]+)')
+WORD = re.compile(r'\w+')
+DATE_INTERVAL = re.compile(r'das?\s*(\d{1,2}:\d{2})\s*(?:às?|a)\s*(\d{1,2}:\d{2})(?:\s*no dia\s*(\d{1,2}/\d{1,2}/\d{2,4}))?')
+DATE_MENTION = re.compile(r'((?:hoje|amanhã|ontem|próximo[oa]? [a-zç]+|\d{1,2}/\d{1,2}/\d{2,4})(?:\s*às?\s*(\d{1,2}:\d{2}))?)')
+# Fast path for what DATE_INTERVAL and DATE_MENTION capture; anything else goes to dateparser
+# (separators follow what dateparser accepts: it rejects "à 10:00" and "hojeàs 10:00")
+RELATIVE_DATE = re.compile(r'(hoje|amanhã|ontem)(?:\s+às\s*(\d{1,2}):(\d{2}))?')
+NUMERIC_DATE = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{2}|\d{4})(?:(?:\s*às\s*|\s+)(\d{1,2}):(\d{2}))?')
+RELATIVE_DAYS = {"hoje": 0, "amanhã": 1, "ontem": -1}
+DATEPARSER_CACHE_SIZE = int(os.getenv("DATEPARSER_CACHE_SIZE", "256"))
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "200"))
+FINISH_PAIR = re.compile(r'\bjá fiz\b')
+MEETING_TIME = re.compile(r'\b(reunião.*às)\b')
+
+# Intent engine: every keyword set is folded once into a single word -> tokens table. A message is scanned
+# once with WORD and the intent rules below are evaluated over the set of tokens it produced.
+KEYWORD_TOKENS: Dict[str, Tuple[str, ...]] = {}
+for _token, _words in {
+    "insert": ("coloque", "coloca", "colocar", "adicione", "adicionar", "ponha", "inclua", "incluir", "insira", "acrescente", "crie"),
+    "show": ("mostre", "tenho", "quais"),
+    "finish": ("terminei", "concluí", "acabei", "finalizei"),  # and FINISH_PAIR
+    "create": ("crie", "adicione", "novo"),
+    "remove": ("remova", "remove", "remover", "exclua", "excluir", "delete", "deletar", "apague", "apagar", "retire", "retirar", "tire", "tira", "tirar"),
+    "lista": ("lista",),
+    "de": ("de",),
+    "calendar": ("agenda", "agendas", "evento", "eventos", "compromisso", "compromissos", "calendário", "calendários", "reunião", "reuniões", "dia"),
+    "tasks": ("tarefa", "tarefas", "afazer", "pendência", "pendências", "atividade", "atividades", "dia"),
+}.items():
+    for _word in _words:
+        KEYWORD_TOKENS[_word] = KEYWORD_TOKENS.get(_word, ()) + (_token,)
+SUBSTRING_TOKENS = ("preciso", "tarefa", "evento", "eventos")  # Matched anywhere, even inside other words
+
+# Ordered rules: the first intent with a clause whose tokens are all present wins
+INTENT_RULES: Tuple[Tuple[str, Tuple[FrozenSet[str], ...]], ...] = tuple(
+    (intent, tuple(frozenset(clause) for clause in clauses)) for intent, clauses in (
+        ("new_task", (("preciso",), ("insert", "tarefa"))),
+        ("task_status", (("show", "tarefa"),)),
+        ("task_conclusion", (("finish",),)),
+        ("list_calendar", (("show", "eventos"),)),
+        ("create_calendar", (("create", "evento"), ("meeting_time",))),
+        ("create_list_item", (("insert", "lista"),)),
+        ("remove_list_item", (("remove", "lista"),)),
+        ("list_user_list_items", (("de", "lista"),)),
+    )
+)
+
+
+
+def _fast_parse_date(date_text: str, now: datetime) -> Optional[datetime]:
+    # Deterministic parser for the phrases the date regexes capture; None means "not handled here",
+    # including invalid dates and times, which dateparser decides about
+    match = RELATIVE_DATE.fullmatch(date_text)
+    if match:
+        dt = now + timedelta(days=RELATIVE_DAYS[match.group(1)])
+        if match.group(2) is None:
+            return dt
+        hour, minute = int(match.group(2)), int(match.group(3))
+        if hour > 23 or minute > 59:
+            return None
+        return dt.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    match = NUMERIC_DATE.fullmatch(date_text)
+    if not match:
+        return None
+    day, month, year = int(match.group(1)), int(match.group(2)), match.group(3)
+    if len(year) == 2:
+        year = (2000 if int(year) < 69 else 1900) + int(year)  # Same pivot as dateparser and strptime's %y
+    hour, minute = (int(match.group(4)), int(match.group(5))) if match.group(4) else (0, 0)
+    try:
+        return TIMEZONE.localize(datetime(int(year), month, day, hour, minute))
+    except ValueError:
+        return None
 
 
-# AI Configuration
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+@lru_cache(maxsize=DATEPARSER_CACHE_SIZE)
+def _dateparser_parse(date_text: str, today: str) -> Optional[datetime]:
+    # `today` is only part of the cache key: relative phrases ("próximo sábado") change meaning every day.
+    # dateparser is slow to import (language data), so it's loaded on the first phrase the fast path can't handle.
+    from dateparser import parse as dp_parse
+    return dp_parse(date_text, languages=['pt'], settings={'TIMEZONE': TIMEZONE.zone, 'RETURN_AS_TIMEZONE_AWARE': True})
+
+
+def _parse_date(date_text: str) -> Optional[datetime]:
+    now = datetime.now(TIMEZONE)
+    return _fast_parse_date(date_text, now) or _dateparser_parse(date_text, now.strftime("%d/%m/%Y"))
 
 
 def _extract_date(msg_lower):
     start_iso: Optional[str] = None
     end_iso: Optional[str] = None
 
-    interval_match = re.search(
-        r'das?\s*(\d{1,2}:\d{2})\s*(?:às?|a)\s*(\d{1,2}:\d{2})(?:\s*no dia\s*(\d{1,2}/\d{1,2}/\d{2,4}))?',
-        msg_lower
-    )
+    interval_match = DATE_INTERVAL.search(msg_lower)
     if interval_match:
         start_time = interval_match.group(1)
         end_time = interval_match.group(2)
         date_part = interval_match.group(3)
-        if date_part:
-            start_dt = dp_parse(f"{date_part} {start_time}", languages=['pt'], settings={'TIMEZONE': TIMEZONE.zone, 'RETURN_AS_TIMEZONE_AWARE': True})
-            end_dt = dp_parse(f"{date_part} {end_time}", languages=['pt'], settings={'TIMEZONE': TIMEZONE.zone, 'RETURN_AS_TIMEZONE_AWARE': True})
-        else:
-            today_str = datetime.now(TIMEZONE).strftime("%d/%m/%Y")
-            start_dt = dp_parse(f"{today_str} {start_time}", languages=['pt'], settings={'TIMEZONE': TIMEZONE.zone, 'RETURN_AS_TIMEZONE_AWARE': True})
-            end_dt = dp_parse(f"{today_str} {end_time}", languages=['pt'], settings={'TIMEZONE': TIMEZONE.zone, 'RETURN_AS_TIMEZONE_AWARE': True})
+        if not date_part:
+            date_part = datetime.now(TIMEZONE).strftime("%d/%m/%Y")
+        start_dt = _parse_date(f"{date_part} {start_time}")
+        end_dt = _parse_date(f"{date_part} {end_time}")
         if start_dt:
             start_iso = start_dt.strftime("%d/%m/%Y %H:%M")
         if end_dt:
             end_iso = end_dt.strftime("%d/%m/%Y %H:%M")
     else:
-        date_match = re.search(
-            r'((?:hoje|amanhã|ontem|próximo[oa]? [a-zç]+|\d{1,2}/\d{1,2}/\d{2,4})(?:\s*às?\s*(\d{1,2}:\d{2}))?)',
-            msg_lower
-        )
+        date_match = DATE_MENTION.search(msg_lower)
         if date_match:
             date_str = date_match.group(1)
             hour_str = date_match.group(2)
-            dt = dp_parse(
-                date_str,
-                languages=['pt'],
-                settings={
-                    'TIMEZONE': TIMEZONE.zone,
-                    'RETURN_AS_TIMEZONE_AWARE': True
-                }
-                )
+            dt = _parse_date(date_str)
             if dt:
                 if hour_str:
                     hour, minute = map(int, hour_str.split(":"))
@@ -94,29 +154,47 @@ def _extract_date(msg_lower):
 
 
 def _extract_list_items(text: str) -> List[str]:
-    pattern = BETWEEN_QUOTES
-    return re.findall(pattern, text)
+    return BETWEEN_QUOTES.findall(text)
 
 
-def check_intents(user_message: str) -> List[str]:
-    intents = []
-    msg = user_message.lower()
+@lru_cache(maxsize=4096)
+def _word_tokens(word: str) -> FrozenSet[str]:
+    return frozenset(KEYWORD_TOKENS.get(word, ()) + tuple(token for token in SUBSTRING_TOKENS if token in word))
 
-    if re.search(r"\b(agendas?|eventos?|compromissos?|calendários?|reunião|reuniões|dia)\b", msg):
-        intents.append("calendar")
-    if re.search(r"\b(tarefas?|afazer|pendências?|atividades?|dia)\b", msg):
-        intents.append("tasks")
 
-    return intents
+@lru_cache(maxsize=1024)
+def _scan(msg_lower: str) -> FrozenSet[str]:
+    # One pass splits the message into words, each distinct word is looked up once. Cached, as
+    # check_intents and interpret_user_message see the same messages.
+    words = set(WORD.findall(msg_lower))
+    tokens = set().union(*map(_word_tokens, words))
+    # The two multi-word keywords are only searched for when their words are present
+    if "já" in words and "fiz" in words and FINISH_PAIR.search(msg_lower):
+        tokens.add("finish")
+    if "às" in msg_lower and "reunião" in msg_lower and MEETING_TIME.search(msg_lower):
+        tokens.add("meeting_time")
+    return frozenset(tokens)
 
 
-def chat(message: str, context: list[dict[str, str]]) -> str:
+def _match_intent(tokens: FrozenSet[str]) -> str:
+    for intent, clauses in INTENT_RULES:
+        if any(clause <= tokens for clause in clauses):
+            return intent
+    return "unrelated"
+
 
-    instructions = BASIC_INSTRUCTIONS.format(TODAY_DATE=TODAY_DATE)
-    for msg in context:
-        instructions += msg["content"] + "\n"
+def check_intents(user_message: str) -> List[str]:
+    tokens = _scan(user_message.lower())
+    return [intent for intent in ("calendar", "tasks") if intent in tokens]
+
+
+def _chat_request(message: str, context: list[dict[str, str]]) -> Dict[str, Any]:
+    from google.genai import types  # Loaded with the first model call, not at import
+
+    # One join instead of growing the string message by message
+    instructions = "".join([BASIC_INSTRUCTIONS.format(TODAY_DATE=TODAY_DATE), *(msg["content"] + "\n" for msg in context)])
 
-    response = client.models.generate_content(
+    return dict(
         model="gemini-2.5-flash",
         contents=message,
         config=types.GenerateContentConfig(
@@ -125,10 +203,10 @@ def chat(message: str, context: list[dict[str, str]]) -> str:
             temperature=1
         )
     )
-    return response.text
 
 
-def generate_tasks_suggestion(tasks: str, events: str, user_context: str) -> str:
+def _tasks_suggestion_request(tasks: str, events: str, user_context: str) -> Dict[str, Any]:
+    from google.genai import types
 
     instructions = BASIC_INSTRUCTIONS.replace("{TODAY_DATE}", TODAY_DATE)
 
@@ -146,18 +224,97 @@ def generate_tasks_suggestion(tasks: str, events: str, user_context: str) -> str
         tasks=tasks,
         events=events)
 
-    response = client.models.generate_content(
+    return dict(
         model="gemini-2.5-flash",
         contents=user_context,
-        config=genai.types.GenerateContentConfig(
+        config=types.GenerateContentConfig(
             system_instruction=instructions,
             thinking_config=types.ThinkingConfig(thinking_budget=256),
             temperature=0.5
         )
     )
+
+
+def _summary_request(previous_summary: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from google.genai import types
+
+    instructions = f"""
+    --- INSTRUÇÕES ---
+    Você mantém o resumo da conversa entre o usuário e Klaus, um assistente pessoal.
+    Atualize o resumo anterior com as novas mensagens e devolva apenas o novo resumo.
+    • Mantenha fatos sobre o usuário, preferências, pedidos em aberto e decisões tomadas.
+    • Descarte cumprimentos, agradecimentos e assuntos já encerrados.
+    • Escreva em português, em até {SUMMARY_MAX_WORDS} palavras.
+    --- RESUMO ANTERIOR ---
+    {previous_summary or "(vazio)"}"""
+    contents = "\n".join(f"[{msg['timestamp']}] {msg['role']}: {msg['text']}" for msg in messages)
+
+    return dict(
+        model="gemini-2.5-flash",
+        contents=contents,
+        config=types.GenerateContentConfig(
+            system_instruction=instructions,
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+            temperature=0.2
+        )
+    )
+
+
+def _stream_text(request: Dict[str, Any]) -> Iterator[str]:
+    # Yields the answer as Gemini produces it; chunks without text (e.g. while thinking) are skipped
+    for chunk in get_genai_client().models.generate_content_stream(**request):
+        if chunk.text:
+            yield chunk.text
+
+
+async def _stream_text_async(request: Dict[str, Any]) -> AsyncIterator[str]:
+    async for chunk in await get_genai_client().aio.models.generate_content_stream(**request):
+        if chunk.text:
+            yield chunk.text
+
+
+def chat(message: str, context: list[dict[str, str]]) -> str:
+    response = get_genai_client().models.generate_content(**_chat_request(message, context))
     return response.text
 
 
+def chat_stream(message: str, context: list[dict[str, str]]) -> Iterator[str]:
+    return _stream_text(_chat_request(message, context))
+
+
+async def chat_async(message: str, context: list[dict[str, str]]) -> str:
+    response = await get_genai_client().aio.models.generate_content(**_chat_request(message, context))
+    return response.text
+
+
+def chat_stream_async(message: str, context: list[dict[str, str]]) -> AsyncIterator[str]:
+    return _stream_text_async(_chat_request(message, context))
+
+
+def generate_tasks_suggestion(tasks: str, events: str, user_context: str) -> str:
+    response = get_genai_client().models.generate_content(**_tasks_suggestion_request(tasks, events, user_context))
+    return response.text
+
+
+def generate_tasks_suggestion_stream(tasks: str, events: str, user_context: str) -> Iterator[str]:
+    return _stream_text(_tasks_suggestion_request(tasks, events, user_context))
+
+
+async def generate_tasks_suggestion_async(tasks: str, events: str, user_context: str) -> str:
+    response = await get_genai_client().aio.models.generate_content(**_tasks_suggestion_request(tasks, events, user_context))
+    return response.text
+
+
+def generate_tasks_suggestion_stream_async(tasks: str, events: str, user_context: str) -> AsyncIterator[str]:
+    return _stream_text_async(_tasks_suggestion_request(tasks, events, user_context))
+
+
+def summarize_conversation(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    # New rolling summary from the previous one and the messages (oldest first) it doesn't cover yet
+    response = get_genai_client().models.generate_content(**_summary_request(previous_summary, messages))
+    return (response.text or "").strip()
+
+
 def interpret_user_message(user_message: str) -> Dict[str, Any]:
     text = user_message.strip()
     msg_lower = text.lower()
@@ -166,40 +323,23 @@ def interpret_user_message(user_message: str) -> Dict[str, Any]:
     start_iso, end_iso = _extract_date(msg_lower)
 
     # 2) Intent detection
-    if 'preciso' in msg_lower or (re.search(INSERTION_KEYWORDS, msg_lower) and ('tarefas' in msg_lower or 'tarefa' in msg_lower)):
-        intent = 'new_task'
-    elif re.search(SHOW_KEYWORDS, msg_lower) and ('tarefas' in msg_lower or 'tarefa' in msg_lower):
-        intent = 'task_status'
-    elif re.search(FINISH_KEYWORDS, msg_lower):
-        intent = 'task_conclusion'
-    elif re.search(SHOW_KEYWORDS, msg_lower) and 'eventos' in msg_lower:
-        intent = 'list_calendar'
-    elif (re.search(CREATE_KEYWORDS, msg_lower) and 'evento' in msg_lower) or re.search(r'\b(reunião.*às)\b', msg_lower):
-        intent = 'create_calendar'
-    elif re.search(INSERTION_KEYWORDS, msg_lower) and re.search(r'\blista\b', msg_lower):
-        intent = 'create_list_item'
-    elif re.search(REMOVAL_KEYWORDS, msg_lower) and re.search(r'\blista\b', msg_lower):
-        intent = 'remove_list_item'
-    elif re.search(r'\b(de)\b', msg_lower) and re.search(r'\blista\b', msg_lower):
-        intent = 'list_user_list_items'
-    else:
-        intent = 'unrelated'
+    intent = _match_intent(_scan(msg_lower))
 
     # 3) Extract title
     title: Optional[str] = None
+    quotes = _extract_list_items(text) if intent in ('new_task', 'task_conclusion', 'create_calendar', 'create_list_item', 'remove_list_item') else []
     if intent in ('new_task', 'task_conclusion', 'create_calendar'):
-        pattern = BETWEEN_QUOTES
-        title = re.findall(pattern, text)[0] if re.findall(pattern, text) else None
+        title = quotes[0] if quotes else None
     elif intent in ('create_list_item', 'list_user_list_items', 'remove_list_item'):
         # tenta extrair o nome da lista após "lista de"
-        match = re.search(r'\blista\b (?:\bde\b|\bdo\b|\bda\b) ([\wçãõáéíóúâêôàèìòùü\s]+)', msg_lower)
+        match = LIST_NAME.search(msg_lower)
         if match:
             title = match.group(1).strip()
 
     # 4) Extract details for list item
     items = []
     if intent in ('create_list_item','remove_list_item'):
-        items = _extract_list_items(msg_lower)
+        items = [quote.lower() for quote in quotes]
 
     return {
         "message": text,
@@ -0,0 +1,132 @@
+import logging
+import math
+import os
+import pytz
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fuzzy_index import normalize_text
+
+
+# Constants
+TIMEZONE = pytz.timezone(os.getenv("TIMEZONE", "America/Sao_Paulo"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # 0 disables trimming
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CHARS_PER_TOKEN = 4  # Rough average for Gemini on Portuguese text, good enough for budgeting
+# Share of the budget each section is guaranteed, in prompt order; whatever a section leaves unused
+# is handed out again in the same order
+SECTION_SHARES = {"summary": 0.1, "history": 0.3, "memories": 0.3, "calendar": 0.15, "tasks": 0.15}
+SECTION_HEADERS = {
+    "summary": "--- RESUMO DA CONVERSA ---",
+    "history": "--- HISTÓRICO DE MENSAGENS (ordenado) ---",
+    "memories": "--- MEMÓRIAS RELEVANTES ---",
+    "calendar": "--- AGENDA DO USUÁRIO (se necessário) ---",
+    "tasks": "--- TAREFAS DO USUÁRIO (se necessário) ---"
+}
+
+# logging configuration
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def mmr_rerank(query_embedding: Sequence[float], documents: List[str], embeddings: Sequence[Sequence[float]], lambda_: float = CONTEXT_MMR_LAMBDA) -> List[str]:
+    # Maximal marginal relevance: each pick trades similarity to the query against similarity to
+    # what was already picked, so near-duplicate memories sink to the end (and out of the budget)
+    if len(documents) < 2:
+        return list(documents)
+    import numpy as np  # Only chat turns with memories get here
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    relevance = vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    similarity = vectors @ vectors.T
+
+    selected: List[int] = []
+    redundancy = np.full(len(documents), -np.inf)
+    remaining = np.ones(len(documents), dtype=bool)
+    for _ in range(len(documents)):
+        scores = lambda_ * relevance - (1 - lambda_) * redundancy if selected else lambda_ * relevance
+        scores[~remaining] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        remaining[pick] = False
+        redundancy = np.maximum(redundancy, similarity[pick])
+    return [documents[i] for i in selected]
+
+
+def drop_seen_memories(memories: List[str], history: Optional[List[Dict[str, Any]]]) -> List[str]:
+    # A memory that is one of the recent messages would only repeat the history section
+    seen = {normalize_text(msg.get("text", "")) for msg in history or []}
+    return [memory for memory in memories if normalize_text(memory) not in seen]
+
+
+def _history_message(msg: Dict[str, Any]) -> Dict[str, str]:
+    role = msg["role"]
+    if role == "klaus":
+        role = "system" # retrocompatibility only
+    return {"role": role, "content": f"[{msg['timestamp']}] {role}: {msg['text']}"}
+
+
+def fit_to_budget(sections: Dict[str, List[Dict[str, str]]], budget: int) -> Tuple[Dict[str, List[Dict[str, str]]], Dict[str, int]]:
+    """
+    Keeps the longest prefix of each section that fits: first within the section's share of
+    `budget`, then with whatever budget the other sections left. A section's header is only
+    paid for when at least one of its items is kept. Returns (kept items, tokens used per section).
+    """
+    kept: Dict[str, List[Dict[str, str]]] = {name: [] for name in sections}
+    used: Dict[str, int] = {name: 0 for name in sections}
+
+    def take(name: str, allowance: float) -> None:
+        items = sections[name]
+        while len(kept[name]) < len(items):
+            cost = estimate_tokens(items[len(kept[name])]["content"])
+            if not kept[name]:
+                cost += estimate_tokens(SECTION_HEADERS[name])
+            if budget > 0 and used[name] + cost > allowance:
+                return
+            kept[name].append(items[len(kept[name])])
+            used[name] += cost
+
+    for name in sections:
+        take(name, SECTION_SHARES.get(name, 0) * budget)
+    for name in sections:
+        take(name, used[name] + budget - sum(used.values()))
+    return kept, used
+
+
+def assemble_context(context: Dict[str, Any], budget: int = CONTEXT_TOKEN_BUDGET) -> List[Dict[str, str]]:
+    # Prompt context in a fixed order (summary, history, memories, calendar, tasks) trimmed to `budget` tokens.
+    # `memories` is a MemoryCandidates (reranked with MMR) or a plain list of texts
+    summary = (context.get("summary") or {}).get("text")
+    history = context.get("history") or []
+    candidates = context.get("memories")
+    if hasattr(candidates, "documents"):
+        memories = mmr_rerank(candidates.query_embedding, candidates.documents, candidates.embeddings)
+    else:
+        memories = list(candidates or [])
+    memories = drop_seen_memories(memories, history)
+
+    sections = {
+        "summary": [{"role": "system", "content": summary}] if summary else [],
+        "history": [_history_message(msg) for msg in history],
+        "memories": [{"role": "system", "content": f"• {memory}"} for memory in memories],
+        "calendar": [{"role": "system", "content": f"• {event}"} for event in context.get("calendar") or []],
+        "tasks": [{"role": "system", "content": f"• {task}"} for task in context.get("tasks") or []]
+    }
+    kept, used = fit_to_budget(sections, budget)
+    logger.info(
+        f"▶️ {datetime.now(TIMEZONE).strftime('%H:%M:%S')} - Context budget: {sum(used.values())}/{budget or '∞'} tokens ("
+        + ", ".join(f"{name}: {used[name]} tokens, {len(kept[name])}/{len(sections[name])}" for name in sections) + ")"
+    )
+
+    messages: List[Dict[str, str]] = []
+    for name in sections:
+        if kept[name]:
+            messages.append({"role": "system", "content": SECTION_HEADERS[name]})
+            messages.extend(kept[name])
+    return messages
@@ -1,94 +1,193 @@
+import asyncio
 import pytz
 import os
 import logging
-
-from handlers.ai_assistant import chat, check_intents
-from data.memory import fetch_similar_memories, get_latest_messages
-from handlers.utils import save_message_embedding
-from externals.habitica_api import get_tasks
+import time
+
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from handlers.ai_assistant import chat, chat_async, chat_stream, chat_stream_async, check_intents
+from handlers.context import assemble_context
+from handlers.summary import recent_history
+from data.list import get_list
+from data.memory import fetch_memory_candidates, fetch_memory_candidates_async, get_latest_messages, get_latest_messages_async
+from data.summary import get_summary, get_summary_async
+from data.user import get_user_doc, get_user_doc_async
+from handlers.utils import save_message_embedding, save_message_embedding_async
+from externals.habitica_api import get_tasks, get_tasks_async
 from externals.calendar_api import list_today_events
 from data.message import get_pending_message, mark_message_as_sent
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List
 
 
 # Constants
 TIMEZONE = pytz.timezone(os.getenv("TIMEZONE", "America/Sao_Paulo"))
+CONTEXT_MAX_WORKERS = int(os.getenv("CONTEXT_MAX_WORKERS", "8"))
 
 
 # logging configuration
-_ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
-logging.basicConfig(level=logging.DEBUG if _ENVIRONMENT == "dev" else logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-# General handler
-def handle_general_chat(chat_id: str, user_message: str) -> str:
-    
-    # 1) Fetch latest messages
-    messages = []
-    history = get_latest_messages(chat_id, 10) 
-    if history:
-        messages.append({
-            "role": "system",
-            "content": "--- HISTÓRICO DE MENSAGENS (ordenado) ---"
-        })
-        for msg in history:
-            role = msg["role"]
-            if role == "klaus":
-                role = "system" # retrocompatibility only
-            messages.append({"role": role, "content": f"[{msg["timestamp"]}] {role}: {msg["text"]}"})
-
-
-    # 2) Fetch context of similar memories
-    relevant_memories = fetch_similar_memories(chat_id, user_message, 15)
-    if relevant_memories:
-        messages.append({
-            "role": "system",
-            "content": "--- MEMÓRIAS RELEVANTES ---"
-        })
-        for memory in relevant_memories:
-            messages.append({
-                "role": "system",
-                "content": f"• {memory}"
-            })
-
-    # 3) Check for calendar and task intents to include in the context
+# Context sources are independent network calls, so they run side by side on a bounded pool
+_context_executor = ThreadPoolExecutor(max_workers=CONTEXT_MAX_WORKERS, thread_name_prefix="context")
+
+
+def _timed_source(name: str, source: Callable[[], Any], timings: Dict[str, float]) -> Any:
+    start = time.perf_counter()
+    try:
+        return source()
+    except Exception as e:
+        logger.error(f"❌ [ERROR] Error fetching {name} context: {e}")
+        return None
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+
+async def _timed_source_async(name: str, source: Awaitable[Any], timings: Dict[str, float]) -> Any:
+    start = time.perf_counter()
+    try:
+        return await source
+    except Exception as e:
+        logger.error(f"❌ [ERROR] Error fetching {name} context: {e}")
+        return None
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+
+def _log_context_timings(names, timings: Dict[str, float], start: float) -> None:
+    total = (time.perf_counter() - start) * 1000
+    logger.info(
+        f"▶️ {datetime.now(TIMEZONE).strftime('%H:%M:%S')} - Context gathered in {total:.0f}ms ("
+        + ", ".join(f"{name}: {timings.get(name, 0):.0f}ms" for name in names) + ")"
+    )
+
+
+def _gather_context(sources: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    # Runs every source concurrently; a failing source contributes None instead of failing the turn
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    futures = {name: _context_executor.submit(_timed_source, name, source, timings) for name, source in sources.items()}
+    results = {name: future.result() for name, future in futures.items()}
+    _log_context_timings(sources, timings, start)
+    return results
+
+
+async def _gather_context_async(sources: Dict[str, Awaitable[Any]]) -> Dict[str, Any]:
+    # Event-loop counterpart of _gather_context: same failure and timing semantics, no pool threads
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    values = await asyncio.gather(*(_timed_source_async(name, source, timings) for name, source in sources.items()))
+    _log_context_timings(sources, timings, start)
+    return dict(zip(sources, values))
+
+
+def _get_user_tasks(chat_id: str) -> List[str]:
+    user = get_user_doc(chat_id)
+    if user and user.habitica_id and user.habitica_token:
+        tasks = get_tasks(user.habitica_id, user.habitica_token)
+        return [task for task in tasks.split(";") if task]
+    return [item["text"] for item in get_list(chat_id, "tarefas")]
+
+
+async def _get_user_tasks_async(chat_id: str) -> List[str]:
+    user = await get_user_doc_async(chat_id)
+    if user and user.habitica_id and user.habitica_token:
+        tasks = await get_tasks_async(user.habitica_id, user.habitica_token)
+        return [task for task in tasks.split(";") if task]
+    return [item["text"] for item in await asyncio.to_thread(get_list, chat_id, "tarefas")]
+
+
+def _prepare_general_chat(chat_id: str, user_message: str) -> List[Dict[str, str]]:
+
+    # 1) Fetch history, similar memories and, when the message asks for them, calendar and tasks
     intents = check_intents(user_message)
+    sources: Dict[str, Callable[[], Any]] = {
+        "summary": lambda: get_summary(chat_id),
+        "history": lambda: get_latest_messages(chat_id, 10),
+        "memories": lambda: fetch_memory_candidates(chat_id, user_message, 15)
+    }
     if "calendar" in intents:
-        events = list_today_events(chat_id)
-        if events:
-            messages.append({
-                "role": "system",
-                "content": f"--- AGENDA DO USUÁRIO (se necessário) ---"
-            })
-            for event in events:
-                messages.append({
-                    "role": "system",
-                    "content": f"• {event}"
-                })
+        sources["calendar"] = lambda: list_today_events(chat_id)
     if "tasks" in intents:
-        tasks = get_tasks()
-        if tasks:
-            messages.append({
-                "role": "system",
-                "content": f"--- TAREFAS DO USUÁRIO (se necessário) ---"
-            })
-            for task in tasks:
-                messages.append({
-                    "role": "system",
-                    "content": f"• {task}"
-                })
-
-    # 4) User message
+        sources["tasks"] = lambda: _get_user_tasks(chat_id)
+
+    # 2) Assemble the prompt context in a fixed order, within the token budget
+    messages = _assemble_general_context(_gather_context(sources))
+
+    # 3) User message
     save_message_embedding(False, user_message, chat_id)
+    return messages
+
+
+async def _prepare_general_chat_async(chat_id: str, user_message: str) -> List[Dict[str, str]]:
+    intents = check_intents(user_message)
+    sources: Dict[str, Awaitable[Any]] = {
+        "summary": get_summary_async(chat_id),
+        "history": get_latest_messages_async(chat_id, 10),
+        "memories": fetch_memory_candidates_async(chat_id, user_message, 15)
+    }
+    if "calendar" in intents:
+        sources["calendar"] = asyncio.to_thread(list_today_events, chat_id)  # Google API client is blocking
+    if "tasks" in intents:
+        sources["tasks"] = _get_user_tasks_async(chat_id)
+    messages = _assemble_general_context(await _gather_context_async(sources))
+
+    await save_message_embedding_async(False, user_message, chat_id)
+    return messages
 
-    # 5) Generate response
+
+def _assemble_general_context(context: Dict[str, Any]) -> List[Dict[str, str]]:
+    # The rolling summary stands in for older history: only the turns it doesn't cover are sent raw
+    context["history"] = recent_history(context.get("history"), context.get("summary"))
+    return assemble_context(context)
+
+
+# General handler
+def handle_general_chat(chat_id: str, user_message: str) -> str:
+    messages = _prepare_general_chat(chat_id, user_message)
+
+    # 4) Generate response
     response = chat(user_message, messages)
 
-    # 6) Save klaus response
+    # 5) Save klaus response
     save_message_embedding(True, response, chat_id)
     return response
 
 
+def stream_general_chat(chat_id: str, user_message: str) -> Iterator[str]:
+    # Same as handle_general_chat, but yields the answer while Gemini writes it
+    messages = _prepare_general_chat(chat_id, user_message)
+    chunks: List[str] = []
+    try:
+        for chunk in chat_stream(user_message, messages):
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        # Runs on completion and when the client disconnects: history keeps what was actually sent
+        if chunks:
+            save_message_embedding(True, "".join(chunks), chat_id)
+
+
+async def handle_general_chat_async(chat_id: str, user_message: str) -> str:
+    messages = await _prepare_general_chat_async(chat_id, user_message)
+    response = await chat_async(user_message, messages)
+    await save_message_embedding_async(True, response, chat_id)
+    return response
+
+
+async def stream_general_chat_async(chat_id: str, user_message: str) -> AsyncIterator[str]:
+    messages = await _prepare_general_chat_async(chat_id, user_message)
+    chunks: List[str] = []
+    try:
+        async for chunk in chat_stream_async(user_message, messages):
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        if chunks:
+            await save_message_embedding_async(True, "".join(chunks), chat_id)
+
+
 def handle_get_message(chat_id: str) -> dict | None:
     message = get_pending_message(chat_id)
 
@@ -9,8 +9,6 @@ from data.list import remove_items_from_list
 
 
 # logging configuration
-_ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
-logging.basicConfig(level=logging.DEBUG if _ENVIRONMENT == "dev" else logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -69,7 +67,7 @@ def handle_remove_list_item(chat_id: str, user_message: str, title: str, items:
     save_message_embedding(False, user_message, chat_id)
     response = ""
     try:
-        deleted_items = remove_items_from_list(chat_id, title, items)
+        deleted_items = [text for text in remove_items_from_list(chat_id, title, items) if text]
         if deleted_items:
             response = "\nOs itens excluídos foram os seguintes:\n"
             response += "\n - ".join(deleted_items)
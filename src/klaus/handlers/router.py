@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from handlers.general import handle_general_chat, handle_general_chat_async, stream_general_chat, stream_general_chat_async
+from handlers.calendar import handle_list_calendar, handle_create_calendar
+from handlers.task import (
+    handle_task_status, handle_task_status_async, handle_new_task, handle_task_conclusion,
+    stream_task_status, stream_task_status_async
+)
+from handlers.list import handle_create_list_item, handle_list_user_list_items, handle_remove_list_item
+from schemas import User
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+
+# Constants
+STRUCTURED_INTENTS = {
+    "list_calendar", "create_calendar", "new_task", "task_conclusion",
+    "create_list_item", "remove_list_item", "list_user_list_items"
+}
+
+
+def route_intent(user: User, user_message: str, message: Dict[str, Any]) -> str:
+    intent = message.get("type")
+    if intent == "list_calendar":
+        return handle_list_calendar(user.chat_id, user_message)
+    elif intent == "create_calendar":
+        return handle_create_calendar(user.chat_id, user_message, message.get("title"), message.get("start_date"), message.get("end_date"))
+    elif intent == "task_status":
+        return handle_task_status(user, user_message, message.get("start_date"))
+    elif intent == "new_task":
+        return handle_new_task(user, user_message, message.get("title"), message.get("priority"), message.get("start_date"))
+    elif intent == "task_conclusion":
+        return handle_task_conclusion(user, user_message, message.get("title"))
+    elif intent == "create_list_item":
+        return handle_create_list_item(user.chat_id, user_message, message.get("title"), message.get("items"))
+    elif intent == 'remove_list_item':
+        return handle_remove_list_item(user.chat_id, user_message, message.get("title"), message.get("items"))
+    elif intent == "list_user_list_items":
+        return handle_list_user_list_items(user.chat_id, user_message, message.get("title"))
+    return handle_general_chat(user.chat_id, user_message)
+
+
+def stream_intent(user: User, user_message: str, message: Dict[str, Any]) -> Optional[Iterator[str]]:
+    # Intents answered by Gemini stream their answer; the others are quick and answer in one piece (None)
+    intent = message.get("type")
+    if intent == "task_status":
+        return stream_task_status(user, user_message, message.get("start_date"))
+    if intent in STRUCTURED_INTENTS:
+        return None
+    return stream_general_chat(user.chat_id, user_message)
+
+
+async def route_intent_async(user: User, user_message: str, message: Dict[str, Any]) -> str:
+    # Same dispatch as route_intent. The Gemini-backed intents are awaited on the loop; the structured
+    # ones are short write-through calls (lists, Habitica writes, Calendar) and run in a worker thread
+    intent = message.get("type")
+    if intent == "task_status":
+        return await handle_task_status_async(user, user_message, message.get("start_date"))
+    if intent in STRUCTURED_INTENTS:
+        return await asyncio.to_thread(route_intent, user, user_message, message)
+    return await handle_general_chat_async(user.chat_id, user_message)
+
+
+def stream_intent_async(user: User, user_message: str, message: Dict[str, Any]) -> Optional[AsyncIterator[str]]:
+    intent = message.get("type")
+    if intent == "task_status":
+        return stream_task_status_async(user, user_message, message.get("start_date"))
+    if intent in STRUCTURED_INTENTS:
+        return None
+    return stream_general_chat_async(user.chat_id, user_message)
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
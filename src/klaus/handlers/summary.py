@@ -0,0 +1,87 @@
+import os
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from data.memory import add_saved_listener
+from data.summary import get_summary, get_unsummarized_messages, save_summary
+from handlers.ai_assistant import summarize_conversation
+from typing import Any, Dict, List, Optional
+
+
+# Constants
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+SUMMARY_EVERY_MESSAGES = int(os.getenv("SUMMARY_EVERY_MESSAGES", "8"))
+SUMMARY_RECENT_MESSAGES = int(os.getenv("SUMMARY_RECENT_MESSAGES", "4"))
+SUMMARY_MAX_MESSAGES = int(os.getenv("SUMMARY_MAX_MESSAGES", "50"))
+
+# logging configuration
+logger = logging.getLogger(__name__)
+
+# Messages saved per user since the last update was scheduled (per process: the update itself
+# re-reads Firestore, so a lower count on a busy multi-instance deploy only delays it)
+_pending: Dict[str, int] = {}
+_updating: set = set()
+_pending_lock = threading.Lock()
+_summary_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SUMMARY_MAX_WORKERS", "2")), thread_name_prefix="summary")
+
+
+def note_message(chat_id: str) -> None:
+    # Called once a message is stored; every SUMMARY_EVERY_MESSAGES it schedules a background update
+    if not SUMMARY_ENABLED:
+        return
+    with _pending_lock:
+        pending = _pending.get(chat_id, 0) + 1
+        _pending[chat_id] = pending
+        if pending < SUMMARY_EVERY_MESSAGES or chat_id in _updating:
+            return
+        _updating.add(chat_id)
+    _summary_executor.submit(_update_in_background, chat_id, pending)
+
+
+def note_saved_messages(records: List[Dict[str, Any]]) -> None:
+    # Write-behind path: messages count once the background writer has stored them
+    for record in records:
+        note_message(record["chat_id"])
+
+
+def _update_in_background(chat_id: str, counted: int) -> None:
+    updated = None
+    try:
+        updated = update_summary(chat_id)
+    except Exception as e:
+        logger.error(f"❌ [ERROR] Error updating conversation summary for chat_id {chat_id}: {e}")
+    finally:
+        with _pending_lock:
+            _updating.discard(chat_id)
+            if updated is not None:
+                # Only what was counted before the update started is covered by it; when nothing was
+                # folded in, the count stands and the next stored message tries again
+                _pending[chat_id] = max(0, _pending.get(chat_id, 0) - counted)
+
+
+def update_summary(chat_id: str) -> Optional[Dict[str, Any]]:
+    # Folds the messages the summary doesn't cover yet into it and returns the new summary, or None
+    # when there weren't SUMMARY_EVERY_MESSAGES of them to fold in yet
+    summary = get_summary(chat_id) or {}
+    messages = get_unsummarized_messages(chat_id, summary.get("covered_until"), SUMMARY_MAX_MESSAGES)
+    if len(messages) < SUMMARY_EVERY_MESSAGES:
+        return None
+    text = summarize_conversation(summary.get("text", ""), messages)
+    if not text:
+        return None
+    logger.info(f"▶️ Conversation summary for chat_id {chat_id} updated with {len(messages)} messages")
+    return save_summary(chat_id, text, messages[-1]["timestamp"])
+
+
+add_saved_listener(note_saved_messages)
+
+
+def recent_history(history: Optional[List[Dict[str, Any]]], summary: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # With a summary, raw history (newest first) only needs what the summary doesn't cover yet,
+    # plus the last SUMMARY_RECENT_MESSAGES turns for the flow of the conversation
+    history = history or []
+    if not summary or not summary.get("covered_until"):
+        return history
+    covered_until = summary["covered_until"]
+    return [msg for i, msg in enumerate(history) if i < SUMMARY_RECENT_MESSAGES or msg.get("timestamp", "") > covered_until]
@@ -1,16 +1,22 @@
+import asyncio
+
 from data.list import get_list, add_items_to_list, remove_items_from_list
-from handlers.ai_assistant import generate_tasks_suggestion
-from handlers.utils import parse_iso_date, save_message_embedding
-from externals.habitica_api import get_tasks, find_task_by_message, create_task_todo, complete_task
+from handlers.ai_assistant import (
+    generate_tasks_suggestion, generate_tasks_suggestion_async,
+    generate_tasks_suggestion_stream, generate_tasks_suggestion_stream_async
+)
+from handlers.utils import parse_iso_date, save_message_embedding, save_message_embedding_async
+from externals.habitica_api import get_tasks, get_tasks_async, find_task_by_message, create_task_todo, complete_task
 from externals.calendar_api import list_today_events
 from schemas import User
+from typing import AsyncIterator, Iterator
 
 
 # Constants
 PRIORITY_MAP = {"low": 0.1, "medium": 1, "high": 2}
 
 
-def handle_task_status(user: User, user_message: str, start_date: str) -> str:
+def _get_task_status_context(user: User, user_message: str, start_date: str) -> tuple:
     save_message_embedding(False, user_message, user.chat_id)
 
     if not user.habitica_id or not user.habitica_token:
@@ -19,11 +25,59 @@ def handle_task_status(user: User, user_message: str, start_date: str) -> str:
         tasks = get_tasks(user.habitica_id, user.habitica_token, parse_iso_date(start_date) == "hoje")
 
     events = list_today_events(user.chat_id)
+    return tasks, events
+
+
+async def _get_task_status_context_async(user: User, user_message: str, start_date: str) -> tuple:
+    # Tasks and events are independent, so they are fetched at the same time
+    await save_message_embedding_async(False, user_message, user.chat_id)
+
+    if not user.habitica_id or not user.habitica_token:
+        tasks = asyncio.to_thread(get_list, user.chat_id, "tarefas")
+    else:
+        tasks = get_tasks_async(user.habitica_id, user.habitica_token, parse_iso_date(start_date) == "hoje")
+
+    return tuple(await asyncio.gather(tasks, asyncio.to_thread(list_today_events, user.chat_id)))
+
+
+def handle_task_status(user: User, user_message: str, start_date: str) -> str:
+    tasks, events = _get_task_status_context(user, user_message, start_date)
     tasks_suggestion = generate_tasks_suggestion(tasks, events, user_message)
     save_message_embedding(True, tasks_suggestion, user.chat_id)
     return tasks_suggestion
 
 
+def stream_task_status(user: User, user_message: str, start_date: str) -> Iterator[str]:
+    tasks, events = _get_task_status_context(user, user_message, start_date)
+    chunks = []
+    try:
+        for chunk in generate_tasks_suggestion_stream(tasks, events, user_message):
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        if chunks:
+            save_message_embedding(True, "".join(chunks), user.chat_id)
+
+
+async def handle_task_status_async(user: User, user_message: str, start_date: str) -> str:
+    tasks, events = await _get_task_status_context_async(user, user_message, start_date)
+    tasks_suggestion = await generate_tasks_suggestion_async(tasks, events, user_message)
+    await save_message_embedding_async(True, tasks_suggestion, user.chat_id)
+    return tasks_suggestion
+
+
+async def stream_task_status_async(user: User, user_message: str, start_date: str) -> AsyncIterator[str]:
+    tasks, events = await _get_task_status_context_async(user, user_message, start_date)
+    chunks = []
+    try:
+        async for chunk in generate_tasks_suggestion_stream_async(tasks, events, user_message):
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        if chunks:
+            await save_message_embedding_async(True, "".join(chunks), user.chat_id)
+
+
 def handle_new_task(user: User, user_message: str, title: str, priority: str, start_date: str) -> str:
     if not title:
         response = "Parece que você não especificou o título da tarefa. Lembre-se de colocar o título da tarefa entre \"aspas\"."
@@ -1,9 +1,11 @@
+import asyncio
 import pytz
 import os
 
 from datetime import datetime, timedelta
 
-from data.memory import save_message, save_embedding 
+from data.memory import save_message, save_embedding, enqueue_message, WRITE_BEHIND_ENABLED
+from handlers.summary import note_message
 
 
 # Constants
@@ -30,6 +32,17 @@ def save_message_embedding(bot_role: bool, text: str, chat_id: str) -> str:
     # Save message and embedding to the database
     role = "user"
     if bot_role: role = "system"
+    if WRITE_BEHIND_ENABLED:
+        # Counted towards the summary once the writer stores it (see handlers.summary.note_saved_messages)
+        return enqueue_message(chat_id, role, text, embed=(role == "user"))
     message_id, saved_data = save_message(chat_id, role, text)
     if role == "user":
         save_embedding(text, chat_id, message_id)
+    note_message(chat_id)
+    return message_id
+
+
+async def save_message_embedding_async(bot_role: bool, text: str, chat_id: str) -> str:
+    # Always off the event loop: even queuing for the write-behind writer can block (spill file, a full
+    # queue, the replay on first use, or a synchronous flush when the queue stays full)
+    return await asyncio.to_thread(save_message_embedding, bot_role, text, chat_id)
@@ -5,13 +5,11 @@ import logging
 import time
 
 from datetime import datetime
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response, stream_with_context
 from handlers.ai_assistant import interpret_user_message
 from auth.auth_handler import handle_google_auth, authenticate_request
-from handlers.general import handle_general_chat, handle_get_message
-from handlers.calendar import handle_list_calendar, handle_create_calendar
-from handlers.task import handle_task_status, handle_new_task, handle_task_conclusion
-from handlers.list import handle_create_list_item, handle_list_user_list_items, handle_remove_list_item
+from handlers.general import handle_get_message
+from handlers.router import route_intent, stream_intent, sse_event
 from pydantic import ValidationError
 from schemas import ChatRequest
 
@@ -75,7 +73,7 @@ def create_app(*args, **kwargs):
         
         auth_header = request.headers.get("Authorization", "")
         response_code, user = authenticate_request(auth_header)
-        if user.chat_id is None or response_code != 200:
+        if not user or response_code != 200:
             return make_response("Unauthorized user", response_code)
 
         try:
@@ -92,25 +90,7 @@ def create_app(*args, **kwargs):
 
             message = interpret_user_message(user_message)
             intent = message.get("type")
-
-            if intent == "list_calendar":
-                response = handle_list_calendar(user.chat_id, user_message)
-            elif intent == "create_calendar":
-                response = handle_create_calendar(user.chat_id, user_message, message.get("title"), message.get("start_date"), message.get("end_date"))
-            elif intent == "task_status":
-                response = handle_task_status(user, user_message, message.get("start_date"))
-            elif intent == "new_task":
-                response = handle_new_task(user, user_message, message.get("title"), message.get("priority"), message.get("start_date"))
-            elif intent == "task_conclusion":
-                response = handle_task_conclusion(user, user_message, message.get("title"))
-            elif intent == "create_list_item":
-                response = handle_create_list_item(user.chat_id, user_message, message.get("title"), message.get("items"))
-            elif intent == 'remove_list_item':
-                response = handle_remove_list_item(user.chat_id, user_message, message.get("title"), message.get("items"))
-            elif intent == "list_user_list_items":
-                response = handle_list_user_list_items(user.chat_id, user_message, message.get("title"))
-            else:
-                response = handle_general_chat(user.chat_id, user_message)
+            response = route_intent(user, user_message, message)
 
             payload = {
                 "response": response,
@@ -123,6 +103,51 @@ def create_app(*args, **kwargs):
             logger.error(f"❌ [ERROR] General exception: {e}")
             return make_response(f"Error: {e}", 500)
 
+
+    @app.route('/stream', methods=['POST'])
+    def stream():
+        # Server-Sent Events variant of "/": "delta" events carry the answer as it is generated,
+        # a final "done" event carries the whole response (the only event for non-chat intents)
+        logger.debug(f"▶️ {datetime.now(TIMEZONE).strftime('%H:%M:%S')} - stream() -> {request.path}")
+
+        auth_header = request.headers.get("Authorization", "")
+        response_code, user = authenticate_request(auth_header)
+        if not user or response_code != 200:
+            return make_response("Unauthorized user", response_code)
+
+        try:
+            json_data = request.get_json(silent=True) or {}
+            body = ChatRequest(**json_data)
+        except ValidationError as err:
+            logger.error(f"❌ [ERROR] Bad request: {err}")
+            return make_response(f"Bad Request: {err}", 400)
+
+        user_message = body.text
+        if not user_message:
+            return make_response("Bad Request: No text provided", 400)
+
+        def events():
+            intent = None
+            try:
+                message = interpret_user_message(user_message)
+                intent = message.get("type")
+                chunks = stream_intent(user, user_message, message)
+                if chunks is None:
+                    response = route_intent(user, user_message, message)
+                else:
+                    parts = []
+                    for chunk in chunks:
+                        parts.append(chunk)
+                        yield sse_event("delta", {"text": chunk})
+                    response = "".join(parts)
+                yield sse_event("done", {"response": response, "intent": intent, "date": datetime.now(TIMEZONE).isoformat()})
+            except Exception as e:
+                logger.error(f"❌ [ERROR] General exception while streaming: {e}")
+                yield sse_event("error", {"error": str(e), "intent": intent})
+
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
+
     return app
 
 
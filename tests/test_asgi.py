@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from starlette.testclient import TestClient
+
+from src.klaus import asgi
+
+
+USER = SimpleNamespace(chat_id="42")
+
+
+async def authenticated(auth_header):
+    return 200, USER
+
+
+def test_webhook_routes_the_message(monkeypatch):
+    async def route_intent_async(user, user_message, message):
+        return f"{message['type']}: {user_message}"
+
+    monkeypatch.setattr(asgi, "authenticate_request_async", authenticated)
+    monkeypatch.setattr(asgi, "interpret_user_message", lambda text: {"type": "general"})
+    monkeypatch.setattr(asgi, "route_intent_async", route_intent_async)
+
+    with TestClient(asgi.app) as client:
+        response = client.post("/", json={"text": "oi"})
+        assert response.status_code == 200
+        assert response.json()["response"] == "general: oi"
+        assert client.post("/", json={"text": ""}).status_code == 400
+
+
+def test_webhook_rejects_unauthenticated_requests(monkeypatch):
+    async def unauthenticated(auth_header):
+        return 401, None
+
+    monkeypatch.setattr(asgi, "authenticate_request_async", unauthenticated)
+    with TestClient(asgi.app) as client:
+        assert client.post("/", json={"text": "oi"}).status_code == 401
+
+
+def test_stream_sends_deltas_then_done(monkeypatch):
+    async def chunks():
+        yield "Bom "
+        yield "dia"
+
+    monkeypatch.setattr(asgi, "authenticate_request_async", authenticated)
+    monkeypatch.setattr(asgi, "interpret_user_message", lambda text: {"type": "general"})
+    monkeypatch.setattr(asgi, "stream_intent_async", lambda user, user_message, message: chunks())
+
+    with TestClient(asgi.app) as client:
+        response = client.post("/stream", json={"text": "oi"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n")[0] for block in response.text.strip().split("\n\n")]
+    assert events == ["event: delta", "event: delta", "event: done"]
+    assert '"response": "Bom dia"' in response.text
@@ -0,0 +1,68 @@
+from src.klaus.cache import LRUCache, TTLCache
+from src.klaus.data.embedding_cache import EmbeddingCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    evicted = []
+    cache = LRUCache(2, on_evict=lambda key, value: evicted.append(key))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert evicted == ["b"]
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache(2)
+    assert cache.get("missing") is None
+    cache.set("a", 1)
+    cache.get("a")
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+
+
+def test_lru_cache_get_or_create_builds_once():
+    calls = []
+    cache = LRUCache(2)
+
+    def factory():
+        calls.append(1)
+        return "value"
+
+    assert cache.get_or_create("a", factory) == "value"
+    assert cache.get_or_create("a", factory) == "value"
+    assert len(calls) == 1
+
+
+def test_embedding_cache_disk_tier_survives_restart(tmp_path):
+    disk_path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(2, disk_path)
+    assert cache.get("model", "ok") is None
+    cache.set("model", "ok", [0.1, 0.2])
+
+    restarted = EmbeddingCache(2, disk_path)
+    assert restarted.get("model", "ok") == [0.1, 0.2]
+    assert restarted.get("other-model", "ok") is None
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("src.klaus.cache.time.monotonic", lambda: now[0])
+    expired = []
+    cache = TTLCache(4, ttl=10, on_evict=lambda key, value: expired.append(key))
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=1)
+    now[0] += 5
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert expired == ["b"]
+    now[0] += 10
+    assert cache.expire() == 1
+    assert expired == ["b", "a"]
+    assert len(cache) == 0
@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+
+from googleapiclient.errors import HttpError
+
+from src.klaus.externals import calendar_api
+
+
+TODAY = datetime.now(calendar_api.TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _event(event_id, day, status="confirmed"):
+    start = TODAY + timedelta(days=day, hours=10)
+    return {
+        "id": event_id,
+        "status": status,
+        "summary": event_id,
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": (start + timedelta(hours=1)).isoformat()},
+    }
+
+
+class FakeEvents:
+    def __init__(self):
+        self.calendar = {}
+        self.changes = []
+        self.calls = []
+        self.expired = False
+
+    def list(self, **params):
+        self.calls.append(params)
+        return SimpleNamespace(execute=lambda: self._page(params))
+
+    def _page(self, params):
+        if "syncToken" in params:
+            if self.expired:
+                raise HttpError(httplib2.Response({"status": 410}), b"")
+            items, self.changes = self.changes, []
+            return {"items": items, "nextSyncToken": "delta"}
+
+        time_min = datetime.fromisoformat(params["timeMin"])
+        time_max = datetime.fromisoformat(params["timeMax"])
+        items = [
+            event for event in self.calendar.values()
+            if datetime.fromisoformat(event["start"]["dateTime"]) < time_max
+            and datetime.fromisoformat(event["end"]["dateTime"]) > time_min
+        ]
+        # Two pages, the token only comes with the last one
+        if params["pageToken"] is None and len(items) > 1:
+            return {"items": items[:1], "nextPageToken": "page2"}
+        return {"items": items[1:] if params["pageToken"] else items, "nextSyncToken": "full"}
+
+    def change(self, event):
+        if event["status"] == "cancelled":
+            self.calendar.pop(event["id"], None)
+        else:
+            self.calendar[event["id"]] = event
+        self.changes.append(event)
+
+
+def _setup(monkeypatch):
+    now = [1000.0]
+    events = FakeEvents()
+    service = SimpleNamespace(events=lambda: events)
+    monkeypatch.setattr(calendar_api, "_get_service", lambda chat_id: service)
+    monkeypatch.setattr(calendar_api, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(calendar_api, "CALENDAR_SYNC_INTERVAL_SECONDS", 30)
+    monkeypatch.setattr(calendar_api, "CALENDAR_SYNC_WINDOW_DAYS", 14)
+    calendar_api._event_stores.clear()
+    return now, events
+
+
+def _ids(chat_id, start_day, end_day):
+    events = calendar_api.list_events(chat_id, TODAY + timedelta(days=start_day), TODAY + timedelta(days=end_day))
+    return [event["id"] for event in events]
+
+
+def _full_syncs(events):
+    return [call for call in events.calls if "timeMin" in call and call["pageToken"] is None]
+
+
+def test_full_sync_reads_every_page_of_the_window(monkeypatch):
+    now, events = _setup(monkeypatch)
+    for event_id, day in (("b", 3), ("a", 1), ("far", 30)):
+        events.change(_event(event_id, day))
+    events.changes = []
+
+    assert _ids("u", 0, 7) == ["a", "b"]
+    syncs = [call for call in events.calls if "timeMin" in call]
+    assert [call["pageToken"] for call in syncs] == [None, "page2"]
+    assert syncs[0]["timeMin"] == TODAY.isoformat()
+    assert syncs[0]["timeMax"] == (TODAY + timedelta(days=14)).isoformat()
+    assert calendar_api._event_stores.get("u")["sync_token"] == "full"
+
+    assert _ids("u", 2, 5) == ["b"]  # Inside the window and within the interval: no call
+    assert len(events.calls) == 2
+
+
+def test_delta_sync_applies_changes_and_cancellations(monkeypatch):
+    now, events = _setup(monkeypatch)
+    events.change(_event("a", 1))
+    events.change(_event("b", 2))
+    events.changes = []
+    assert _ids("u", 0, 7) == ["a", "b"]
+
+    events.change(_event("a", 1, status="cancelled"))
+    events.change(_event("c", 3))
+    events.change(_event("far", 40))  # Deltas aren't windowed
+    now[0] += 60
+    assert _ids("u", 0, 7) == ["b", "c"]
+    assert events.calls[-1]["syncToken"] == "full"
+    store = calendar_api._event_stores.get("u")
+    assert set(store["events"]) == {"b", "c"}
+    assert store["sync_token"] == "delta"
+
+
+def test_expired_sync_token_falls_back_to_a_full_sync(monkeypatch):
+    now, events = _setup(monkeypatch)
+    events.change(_event("a", 1))
+    assert _ids("u", 0, 7) == ["a"]
+    store = calendar_api._event_stores.get("u")
+    window = (store["start"], store["end"])
+
+    events.expired = True
+    events.calendar = {"b": _event("b", 2)}
+    now[0] += 60
+    assert _ids("u", 0, 7) == ["b"]
+    assert "syncToken" in events.calls[-2]
+    assert (datetime.fromisoformat(events.calls[-1]["timeMin"]), datetime.fromisoformat(events.calls[-1]["timeMax"])) == window
+
+
+def test_query_outside_the_window_refetches_without_keeping_the_old_window(monkeypatch):
+    now, events = _setup(monkeypatch)
+    events.change(_event("past", -20))
+    events.change(_event("a", 1))
+
+    assert _ids("u", -21, -19) == ["past"]
+    store = calendar_api._event_stores.get("u")
+    assert store["start"] == TODAY - timedelta(days=21)
+
+    assert _ids("u", 0, 30) == ["a"]
+    assert len(_full_syncs(events)) == 2
+    assert store["start"] == TODAY  # The earlier start isn't carried over
+    assert store["end"] == TODAY + timedelta(days=30)
+    assert set(store["events"]) == {"a"}
+
+
+def test_sync_errors_drop_the_store(monkeypatch):
+    now, events = _setup(monkeypatch)
+    assert _ids("u", 0, 7) == []
+
+    events.list = lambda **params: SimpleNamespace(execute=lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+    now[0] += 60
+    with pytest.raises(RuntimeError):
+        _ids("u", 0, 7)
+    assert calendar_api._event_stores.get("u") is None
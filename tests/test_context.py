@@ -0,0 +1,42 @@
+from src.klaus.data.memory import MemoryCandidates
+from src.klaus.handlers import context
+
+
+def test_mmr_pushes_near_duplicates_down():
+    documents = ["comprar leite", "comprar leite hoje", "reunião às 10"]
+    embeddings = [[0.9, 0.436, 0], [0.9, 0.42, 0.12], [0.9, -0.436, 0]]
+    assert context.mmr_rerank([1, 0, 0], documents, embeddings, lambda_=0.5) == ["comprar leite", "reunião às 10", "comprar leite hoje"]
+
+
+def test_memories_already_in_history_are_dropped():
+    history = [{"role": "user", "timestamp": "t", "text": "Comprar  Leite"}]
+    assert context.drop_seen_memories(["comprar leite", "pão"], history) == ["pão"]
+
+
+def test_sections_fit_the_budget_and_share_what_is_left():
+    sections = {
+        "history": [{"role": "user", "content": "h" * 40}] * 10,
+        "memories": [{"role": "system", "content": "m" * 40}] * 10,
+        "calendar": [],
+        "tasks": [{"role": "system", "content": "t" * 40}]
+    }
+    kept, used = context.fit_to_budget(sections, budget=200)
+
+    assert sum(used.values()) <= 200
+    assert len(kept["tasks"]) == 1
+    assert used["history"] > 200 * context.SECTION_SHARES["history"]  # took part of the unused calendar share
+    assert kept["calendar"] == []
+
+
+def test_assemble_context_orders_sections_with_headers():
+    messages = context.assemble_context({
+        "history": [{"role": "klaus", "timestamp": "t", "text": "oi"}],
+        "memories": MemoryCandidates([1, 0], ["oi", "gosto de café"], [[1, 0], [0, 1]]),
+        "tasks": ["lavar louça"]
+    }, budget=0)
+
+    assert [m["content"] for m in messages] == [
+        context.SECTION_HEADERS["history"], "[t] system: oi",
+        context.SECTION_HEADERS["memories"], "• gosto de café",
+        context.SECTION_HEADERS["tasks"], "• lavar louça"
+    ]
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.klaus.handlers import ai_assistant
+from src.klaus.handlers.ai_assistant import TIMEZONE, _dateparser_parse, _fast_parse_date, _parse_date
+
+
+NOW = TIMEZONE.localize(datetime(2025, 3, 10, 8, 15, 30))
+
+
+def _dateparser(date_text):
+    return _dateparser_parse(date_text, datetime.now(TIMEZONE).strftime("%d/%m/%Y"))
+
+
+"""
+Fast path
+"""
+@pytest.mark.parametrize("date_text, days", [("hoje", 0), ("amanhã", 1), ("ontem", -1)])
+def test_relative_day_keeps_the_current_time(date_text, days):
+    assert _fast_parse_date(date_text, NOW) == NOW + timedelta(days=days)
+
+
+def test_relative_day_with_time():
+    assert _fast_parse_date("amanhã às 14:00", NOW) == TIMEZONE.localize(datetime(2025, 3, 11, 14, 0))
+    assert _fast_parse_date("hoje às 9:05", NOW) == TIMEZONE.localize(datetime(2025, 3, 10, 9, 5))
+
+
+@pytest.mark.parametrize("date_text, expected", [
+    ("05/03/25", datetime(2025, 3, 5)),  # Day first, two-digit years land in 20xx
+    ("5/3/2025 às 9:30", datetime(2025, 3, 5, 9, 30)),
+    ("5/3/2025 9:30", datetime(2025, 3, 5, 9, 30)),
+    ("31/12/99", datetime(1999, 12, 31)),  # ... up to 68, then in 19xx
+    ("1/1/68", datetime(2068, 1, 1)),
+])
+def test_numeric_date(date_text, expected):
+    assert _fast_parse_date(date_text, NOW) == TIMEZONE.localize(expected)
+
+
+@pytest.mark.parametrize("date_text", ["hoje às 25:00", "amanhã às 10:60", "31/02/2025", "5/13/2025 às 10:00"])
+def test_invalid_dates_are_left_to_dateparser(date_text):
+    assert _fast_parse_date(date_text, NOW) is None
+
+
+@pytest.mark.parametrize("date_text", ["próxima sexta", "10 de março", "em 2 dias", "amanhã à 14:00", "hojeàs 10:00"])
+def test_other_phrases_are_left_to_dateparser(date_text):
+    assert _fast_parse_date(date_text, NOW) is None
+
+
+"""
+Same answers as dateparser
+"""
+@pytest.mark.parametrize("date_text", ["05/03/25", "5/3/2025 às 9:30", "5/3/2025 9:30", "31/12/99"])
+def test_numeric_dates_match_dateparser(date_text):
+    assert _fast_parse_date(date_text, NOW) == _dateparser(date_text)
+
+
+@pytest.mark.parametrize("date_text", ["amanhã às 14:00", "ontem às 23:59"])
+def test_relative_dates_match_dateparser(date_text):
+    now = datetime.now(TIMEZONE)
+    assert _fast_parse_date(date_text, now) == _dateparser(date_text)
+
+
+@pytest.mark.parametrize("date_text", ["hoje", "amanhã", "ontem"])
+def test_relative_days_match_dateparser(date_text):
+    now = datetime.now(TIMEZONE)
+    fast, slow = _fast_parse_date(date_text, now), _dateparser(date_text)
+    assert fast.date() == slow.date()
+    assert abs(fast - slow) < timedelta(minutes=1)
+
+
+@pytest.mark.parametrize("date_text", ["hoje às 25:00", "31/02/2025", "10 de março", "amanhã à 14:00"])
+def test_parse_date_falls_back_to_dateparser(monkeypatch, date_text):
+    calls = []
+
+    def dateparser_parse(text, today):
+        calls.append(text)
+        return _dateparser_parse(text, today)
+
+    monkeypatch.setattr(ai_assistant, "_dateparser_parse", dateparser_parse)
+    assert _parse_date(date_text) == _dateparser(date_text)  # Cached, so the same answer even for "hoje"
+    assert calls == [date_text]
@@ -0,0 +1,40 @@
+from src.klaus.fuzzy_index import FuzzyIndex, normalize_text
+
+
+def test_normalize_text_ignores_case_accents_and_spacing():
+    assert normalize_text("  Lição   de CASA ") == "licao de casa"
+    assert normalize_text("Requeijão") == "requeijao"
+
+
+def test_best_match_is_case_and_accent_insensitive():
+    index = FuzzyIndex([("1", "Montar o abajour"), ("2", "Lavar a louça")])
+    key, title, score = index.best("lavar a LOUCA")
+    assert key == "2"
+    assert title == "Lavar a louça"
+    assert score == 100
+
+
+def test_best_match_respects_threshold():
+    index = FuzzyIndex([("1", "Montar o abajour")])
+    assert index.best("comprar pão", threshold=80) is None
+    assert FuzzyIndex([]).best("qualquer coisa") is None
+
+
+def test_top_returns_candidates_best_first():
+    index = FuzzyIndex([("1", "ler o livro"), ("2", "ler o jornal"), ("3", "lavar o carro")])
+    candidates = index.top("ler o livro", limit=2)
+    assert [key for key, _, _ in candidates] == ["1", "2"]
+
+
+def test_best_many_matches_every_query_in_one_call():
+    index = FuzzyIndex([("a", "pão"), ("b", "requeijão"), ("c", "batata")])
+    matches = index.best_many(["requeijao", "batata", "melancia"], threshold=90)
+    assert matches[0][0] == "b"
+    assert matches[1][0] == "c"
+    assert matches[2] is None
+
+
+def test_best_many_distinct_matches_each_entry_once():
+    index = FuzzyIndex([("a", "pão"), ("b", "leite"), ("c", "pão")])
+    matches = index.best_many(["pão", "pao", "pão"], threshold=90, distinct=True)
+    assert [match[0] if match else None for match in matches] == ["a", "c", None]
@@ -0,0 +1,110 @@
+import asyncio
+
+from types import SimpleNamespace
+
+from src.klaus.externals import habitica_api
+
+
+def _task(task_id, completed=False):
+    return {"_id": task_id, "type": "todo", "text": task_id, "completed": completed}
+
+
+class InlineThread:
+    def __init__(self, target, args, daemon):
+        self.target, self.args = target, args
+
+    def start(self):
+        self.target(*self.args)
+
+
+def _setup(monkeypatch, fetch):
+    now = [1000.0]
+    fetches = []
+
+    def get_tasks(user_id, api_token, today_only=False):
+        fetches.append(user_id)
+        return fetch()
+
+    monkeypatch.setattr(habitica_api, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(habitica_api, "_get_tasks_from_habitica", get_tasks)
+    monkeypatch.setattr(habitica_api.threading, "Thread", InlineThread)
+    monkeypatch.setattr(habitica_api, "TASKS_CACHE_TTL_SECONDS", 60)
+    monkeypatch.setattr(habitica_api, "TASKS_CACHE_STALE_SECONDS", 600)
+    habitica_api._task_snapshots.clear()
+    habitica_api._task_writes.clear()
+    return now, fetches
+
+
+def _ids(snapshot):
+    return [task["_id"] for task in snapshot["tasks"]]
+
+
+def test_fresh_snapshot_is_served_from_cache(monkeypatch):
+    now, fetches = _setup(monkeypatch, lambda: [_task("a")])
+    assert _ids(habitica_api._get_task_snapshot("u", "token")) == ["a"]
+    now[0] += 30
+    assert _ids(habitica_api._get_task_snapshot("u", "token")) == ["a"]
+    assert len(fetches) == 1
+
+
+def test_stale_snapshot_is_served_while_it_refreshes(monkeypatch):
+    tasks = [[_task("a")]]
+    now, fetches = _setup(monkeypatch, lambda: tasks[0])
+    habitica_api._get_task_snapshot("u", "token")
+
+    tasks[0] = [_task("a"), _task("b")]
+    now[0] += 120
+    assert _ids(habitica_api._get_task_snapshot("u", "token")) == ["a"]  # Stale copy, refreshed behind it
+    assert _ids(habitica_api._get_task_snapshot("u", "token")) == ["a", "b"]
+    assert len(fetches) == 2
+
+
+def test_expired_snapshot_is_fetched_again(monkeypatch):
+    tasks = [[_task("a")]]
+    now, fetches = _setup(monkeypatch, lambda: tasks[0])
+    habitica_api._get_task_snapshot("u", "token")
+
+    tasks[0] = [_task("b")]
+    now[0] += 601
+    assert _ids(habitica_api._get_task_snapshot("u", "token")) == ["b"]
+    assert len(fetches) == 2
+
+
+def test_refresh_started_before_a_write_does_not_undo_its_patch(monkeypatch):
+    def fetch_racing_with_a_completion():
+        # Habitica answers with the list as it was, while complete_task patches the cache
+        habitica_api._patch_snapshots("u", lambda tasks: [t for t in tasks if t["_id"] != "a"])
+        return [_task("a"), _task("b")]
+
+    now, fetches = _setup(monkeypatch, lambda: [_task("a"), _task("b")])
+    habitica_api._get_task_snapshot("u", "token")
+    monkeypatch.setattr(habitica_api, "_get_tasks_from_habitica", lambda *args, **kwargs: fetch_racing_with_a_completion())
+
+    now[0] += 120
+    habitica_api._get_task_snapshot("u", "token")
+    assert _ids(habitica_api._task_snapshots.get(("u", None))) == ["b"]
+
+
+def test_async_refresh_started_before_a_write_does_not_undo_its_patch(monkeypatch):
+    now, _ = _setup(monkeypatch, lambda: [_task("a")])
+    habitica_api._get_task_snapshot("u", "token")
+
+    async def fetch_racing_with_a_creation(user_id, api_token, today_only=False):
+        habitica_api._patch_snapshots("u", lambda tasks: tasks + [_task("new")])
+        return [_task("a")]
+
+    async def refresh():
+        await habitica_api._refresh_snapshot_async(("u", None), "token")
+
+    monkeypatch.setattr(habitica_api, "_get_tasks_from_habitica_async", fetch_racing_with_a_creation)
+    asyncio.run(refresh())
+    assert _ids(habitica_api._task_snapshots.get(("u", None))) == ["a", "new"]
+
+
+def test_patch_applied_after_a_refresh_is_not_doubled(monkeypatch):
+    now, _ = _setup(monkeypatch, lambda: [_task("a"), _task("new")])  # Fetched after the task was created
+    habitica_api._get_task_snapshot("u", "token")
+    response = SimpleNamespace(status_code=201, json=lambda: {"data": _task("new")})
+    monkeypatch.setattr(habitica_api.transport, "post", lambda url, **kwargs: response)
+    habitica_api.create_task_todo("u", "token", "new")
+    assert _ids(habitica_api._task_snapshots.get(("u", None))) == ["a", "new"]
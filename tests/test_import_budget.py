@@ -0,0 +1,8 @@
+import subprocess
+import sys
+
+
+def test_startup_does_not_import_heavy_dependencies():
+    # Chroma, Gemini, googleapiclient, dateparser and rapidfuzz are loaded on first use only
+    result = subprocess.run([sys.executable, "scripts/import_report.py", "--top", "0"], capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
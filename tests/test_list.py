@@ -0,0 +1,162 @@
+import copy
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from src.klaus.data import list as list_data
+
+
+def _doc(item_id, text):
+    return SimpleNamespace(id=item_id, reference=item_id, to_dict=lambda: {"text": text})
+
+
+def test_remove_items_reports_every_requested_item(monkeypatch):
+    docs = [_doc("1", "pão"), _doc("2", "leite"), _doc("3", "pão")]
+    deleted = []
+    monkeypatch.setattr(list_data, "LIST_STORAGE_BACKEND", list_data.LAYOUT_SUBCOLLECTION)
+    monkeypatch.setattr(list_data, "_get_items_ref", lambda chat_id, list_name: SimpleNamespace(stream=lambda: iter(docs)))
+    monkeypatch.setattr(list_data, "_commit_in_batches", lambda writes: deleted.extend(ref for ref, _ in writes))
+
+    removed = list_data.remove_items_from_list("42", "compras", ["pão", "pão", "café"])
+    assert removed == ["pão", "pão", None]
+    assert sorted(deleted) == ["1", "3"]
+
+
+class FakeSnapshot:
+    def __init__(self, ref, data):
+        self.id, self.reference, self._data = ref.id, ref, data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeRef:
+    # Just enough of a DocumentReference / CollectionReference over a dict of paths
+    def __init__(self, store, path):
+        self.store, self.path, self.id = store, path, path.rsplit("/", 1)[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRef) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self, self.store.get(self.path))
+
+    def collection(self, name):
+        return FakeRef(self.store, f"{self.path}/{name}")
+
+    def document(self, item_id=None):
+        return FakeRef(self.store, f"{self.path}/{item_id or len(self.store)}")
+
+    def stream(self, transaction=None):
+        prefix = self.path + "/"
+        return iter([FakeSnapshot(FakeRef(self.store, path), data) for path, data in sorted(self.store.items()) if path.startswith(prefix) and "/" not in path[len(prefix):]])
+
+
+class FakeTransaction:
+    def __init__(self, store):
+        self.store = store
+
+    def set(self, ref, data, merge=False):
+        current = dict(self.store.get(ref.path) or {}) if merge else {}
+        for key, value in data.items():
+            if value is list_data.firestore.DELETE_FIELD:
+                current.pop(key, None)
+            elif merge is True and isinstance(value, dict):
+                current[key] = {**current.get(key, {}), **value}
+            else:
+                current[key] = value
+        self.store[ref.path] = current
+
+    def update(self, ref, fields):
+        current = self.store[ref.path]
+        for field_path, value in fields.items():
+            field, key = field_path.split(".", 1)
+            assert value is list_data.firestore.DELETE_FIELD
+            current[field].pop(key.strip("`"), None)
+
+    def delete(self, ref):
+        self.store.pop(ref.path, None)
+
+
+def _document_backend(monkeypatch, store):
+    # Runs the transactional helpers' bodies against the in-memory store
+    transaction = FakeTransaction(store)
+    monkeypatch.setattr(list_data, "LIST_STORAGE_BACKEND", list_data.LAYOUT_DOCUMENT)
+    monkeypatch.setattr(list_data, "_get_list_ref", lambda chat_id, list_name: FakeRef(store, f"users/{chat_id}/lists/{list_name.lower()}"))
+    monkeypatch.setattr(list_data, "get_firestore_client", lambda: SimpleNamespace(transaction=lambda: transaction))
+    for name in ("_add_to_document", "_remove_from_document", "_write_to_subcollection", "_pack_into_document", "_unpack_into_subcollection"):
+        monkeypatch.setattr(list_data, name, getattr(list_data, name).to_wrap)
+    list_data._list_cache.clear()
+
+
+def test_migration_moves_items_between_layouts(monkeypatch):
+    store = {"users/42/lists/compras/items/a": {"text": "leite", "createdAt": 1}, "users/42/lists/compras/items/b": {"text": "pão", "createdAt": 2}}
+    _document_backend(monkeypatch, store)
+
+    assert list_data.migrate_list("42", "compras", list_data.LAYOUT_DOCUMENT) == list_data.LAYOUT_DOCUMENT
+    assert list(store) == ["users/42/lists/compras"]
+    assert store["users/42/lists/compras"]["items"]["b"] == {"text": "pão", "createdAt": 2}
+
+    assert list_data.migrate_list("42", "compras", list_data.LAYOUT_SUBCOLLECTION) == list_data.LAYOUT_SUBCOLLECTION
+    assert store["users/42/lists/compras"] == {"layout": list_data.LAYOUT_SUBCOLLECTION}
+    assert store["users/42/lists/compras/items/a"] == {"text": "leite", "createdAt": 1}
+
+
+def test_migration_leaves_large_lists_in_the_subcollection(monkeypatch):
+    store = {f"users/42/lists/compras/items/{i}": {"text": f"item {i}"} for i in range(3)}
+    _document_backend(monkeypatch, store)
+    monkeypatch.setattr(list_data, "LIST_DOCUMENT_MAX_ITEMS", 2)
+
+    assert list_data.migrate_list("42", "compras") == list_data.LAYOUT_SUBCOLLECTION
+    assert store["users/42/lists/compras"] == {"layout": list_data.LAYOUT_SUBCOLLECTION}
+    assert len(store) == 4
+
+
+def test_document_layout_adds_and_removes_items(monkeypatch):
+    store = {"users/42/lists/compras/items/a": {"text": "leite", "createdAt": datetime(2024, 1, 1, tzinfo=timezone.utc)}}
+    _document_backend(monkeypatch, store)
+
+    list_data.add_items_to_list("42", "compras", ["pão", "café"])  # First write converts the list
+    texts = [item["text"] for item in list_data.get_list("42", "compras")]
+    assert texts[0] == "leite" and sorted(texts[1:]) == ["café", "pão"]
+    assert list(store) == ["users/42/lists/compras"]
+
+    assert list_data.remove_items_from_list("42", "compras", ["pao", "chá"]) == ["pão", None]
+    assert [item["text"] for item in list_data.get_list("42", "compras")] == ["leite", "café"]
+
+
+def test_document_layout_moves_a_full_list_to_the_subcollection(monkeypatch):
+    store = {"users/42/lists/compras": {"layout": list_data.LAYOUT_DOCUMENT, "items": {"a": {"text": "leite", "createdAt": 1}}}}
+    _document_backend(monkeypatch, store)
+    monkeypatch.setattr(list_data, "LIST_DOCUMENT_MAX_ITEMS", 1)
+
+    list_data.add_items_to_list("42", "compras", ["pão"])
+    assert store["users/42/lists/compras"] == {"layout": list_data.LAYOUT_SUBCOLLECTION}
+    assert sorted(data["text"] for path, data in store.items() if "/items/" in path) == ["leite", "pão"]
+
+
+def test_subcollection_write_after_a_concurrent_packing_goes_to_the_document(monkeypatch):
+    store = {"users/42/lists/compras/items/a": {"text": "leite", "createdAt": 1}}
+    _document_backend(monkeypatch, store)
+    checks = []
+
+    def layout_checked_before_packing(chat_id, list_name):
+        # The layout is read while the list is still a subcollection; another instance packs it right after
+        checks.append(list_name)
+        if len(checks) == 1:
+            list_data.migrate_list(chat_id, list_name, list_data.LAYOUT_DOCUMENT)
+            return False
+        return True
+
+    monkeypatch.setattr(list_data, "_uses_document_layout", layout_checked_before_packing)
+    list_data.add_items_to_list("42", "compras", ["pão"])
+
+    assert list(store) == ["users/42/lists/compras"]
+    assert sorted(item["text"] for item in store["users/42/lists/compras"]["items"].values()) == ["leite", "pão"]
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+from src.klaus.data import list as list_data
+
+
+def test_get_list_is_cached_and_invalidated_by_writes(monkeypatch):
+    reads = []
+    stored = [{"id": "1", "text": "leite"}]
+
+    def read_list(chat_id, list_name):
+        reads.append(list_name)
+        return [dict(item) for item in stored]
+
+    def commit(writes):
+        stored.extend({"id": ref.id, "text": data["text"]} for ref, data in writes)
+
+    class ItemsRef:
+        def document(self):
+            return SimpleNamespace(id=str(len(stored) + 1))
+
+    monkeypatch.setattr(list_data, "_read_list", read_list)
+    monkeypatch.setattr(list_data, "_commit_in_batches", commit)
+    monkeypatch.setattr(list_data, "_get_items_ref", lambda chat_id, list_name: ItemsRef())
+    monkeypatch.setattr(list_data, "LIST_CACHE_LISTENERS", False)
+    monkeypatch.setattr(list_data, "LIST_STORAGE_BACKEND", list_data.LAYOUT_SUBCOLLECTION)
+    list_data._list_cache.clear()
+
+    first = list_data.get_list("42", "Compras")
+    first.append({"id": "x", "text": "mutated by caller"})
+    assert list_data.get_list("42", "compras") == [{"id": "1", "text": "leite"}]
+    assert reads == ["Compras"]
+
+    list_data.add_items_to_list("42", "compras", ["pão"])
+    assert [item["text"] for item in list_data.get_list("42", "compras")] == ["leite", "pão"]
+    assert len(reads) == 2
+
+
+def test_read_overtaken_by_a_write_is_not_cached(monkeypatch):
+    stored = [{"id": "1", "text": "leite"}]
+
+    def read_list(chat_id, list_name):
+        items = [dict(item) for item in stored]
+        if len(stored) == 1:
+            stored.append({"id": "2", "text": "pão"})  # Written by this process while the read was in flight
+            list_data.invalidate_list_cache(chat_id, list_name)
+        return items
+
+    monkeypatch.setattr(list_data, "_read_list", read_list)
+    monkeypatch.setattr(list_data, "LIST_CACHE_LISTENERS", False)
+    list_data._list_cache.clear()
+
+    assert [item["text"] for item in list_data.get_list("42", "compras")] == ["leite"]
+    assert [item["text"] for item in list_data.get_list("42", "compras")] == ["leite", "pão"]
+
+
+def test_writes_keep_the_listener_and_read_directly_until_it_catches_up(monkeypatch):
+    snapshots = []
+    unsubscribed = []
+    reads = []
+
+    class ItemsRef:
+        def on_snapshot(self, callback):
+            snapshots.append(callback)
+            callback([SimpleNamespace(id="1", to_dict=lambda: {"text": "leite"})], [], None)
+            return SimpleNamespace(unsubscribe=lambda: unsubscribed.append(True))
+
+    def read_list(chat_id, list_name):
+        reads.append(list_name)
+        return [{"id": "1", "text": "leite"}, {"id": "2", "text": "pão"}]
+
+    monkeypatch.setattr(list_data, "_get_items_ref", lambda chat_id, list_name: ItemsRef())
+    monkeypatch.setattr(list_data, "_read_list", read_list)
+    monkeypatch.setattr(list_data, "LIST_CACHE_LISTENERS", True)
+    monkeypatch.setattr(list_data, "LIST_STORAGE_BACKEND", list_data.LAYOUT_SUBCOLLECTION)
+    list_data._list_cache.clear()
+
+    assert [item["text"] for item in list_data.get_list("42", "compras")] == ["leite"]
+    list_data.invalidate_list_cache("42", "compras")
+    assert [item["text"] for item in list_data.get_list("42", "compras")] == ["leite", "pão"]
+    assert not unsubscribed and reads == ["compras"]
+
+    snapshots[0]([SimpleNamespace(id=i, to_dict=lambda t=t: {"text": t}) for i, t in (("1", "leite"), ("2", "pão"))], [], None)
+    assert [item["text"] for item in list_data.get_list("42", "compras")] == ["leite", "pão"]
+    assert len(snapshots) == 1 and reads == ["compras"]
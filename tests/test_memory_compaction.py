@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+from src.klaus.data import memory
+from src.klaus.data import memory_compaction
+from src.klaus.data.memory_compaction import plan_compaction
+from src.klaus.data.vector_store import VectorStore
+
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+
+def _record(record_id, timestamp="2025-06-01T10:00:00"):
+    return {"id": record_id, "chat_id": "42", "text": record_id, "timestamp": timestamp}
+
+
+def test_near_duplicates_are_merged_on_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_DEDUP_THRESHOLD", 0.95)
+    store = VectorStore(str(tmp_path))
+    store.add(ids=["old"], embeddings=[[1, 0, 0]], documents=["obrigado"], metadatas=[{"timestamp": "2025-05-01T10:00:00"}])
+
+    kept = memory._merge_duplicates(store, [
+        (_record("a"), [0.99, 0.01, 0]),   # repeats "old"
+        (_record("b"), [0, 1, 0]),         # new
+        (_record("c"), [0, 0.99, 0.01]),   # repeats "b", earlier in the same batch
+        (_record("old"), [1, 0, 0])        # replay of a stored memory
+    ])
+
+    assert [record["id"] for record, _ in kept] == ["b"]
+    assert kept[0][0]["occurrences"] == 2
+    assert store.get(ids=["old"])["metadatas"][0]["occurrences"] == 2
+    assert store.count() == 1
+
+
+def test_plan_compaction_merges_and_caps_old_memories():
+    old = (NOW - timedelta(days=60)).isoformat()
+    older = (NOW - timedelta(days=90)).isoformat()
+    recent = (NOW - timedelta(days=1)).isoformat()
+    ids = ["recent", "old-dup", "old-a", "old-b"]
+    embeddings = [[1, 0, 0], [0.98, 0.02, 0], [0, 1, 0], [0, 0, 1]]
+    metadatas = [{"timestamp": recent}, {"timestamp": old, "occurrences": 3}, {"timestamp": old}, {"timestamp": older}]
+
+    updates, deleted = plan_compaction(ids, embeddings, metadatas, NOW, retention_days=30, threshold=0.9, max_memories=2)
+
+    assert updates["recent"]["occurrences"] == 4
+    assert updates["recent"]["last_seen"] == recent
+    assert deleted == ["old-dup", "old-b"]
+
+
+def test_plan_compaction_keeps_recent_memories():
+    recent = (NOW - timedelta(days=1)).isoformat()
+    updates, deleted = plan_compaction(["a", "b"], [[1, 0], [1, 0]], [{"timestamp": recent}] * 2, NOW, retention_days=30, max_memories=1)
+    assert (updates, deleted) == ({}, [])
+
+
+def test_replayed_batch_does_not_count_merges_twice(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_DEDUP_THRESHOLD", 0.95)
+    store = VectorStore(str(tmp_path))
+    store.add(ids=["old"], embeddings=[[1, 0, 0]], documents=["obrigado"], metadatas=[{"timestamp": "2025-05-01T10:00:00"}])
+    batch = [(_record("a"), [0.99, 0.01, 0]), (_record("b"), [0, 1, 0]), (_record("c"), [0, 0.99, 0.01])]
+
+    kept = memory._merge_duplicates(store, [(dict(record), embedding) for record, embedding in batch])
+    store.upsert(ids=[record["id"] for record, _ in kept], embeddings=[e for _, e in kept],
+                 metadatas=[{key: record[key] for key in ("occurrences", "merged_ids")} for record, _ in kept])
+    assert memory._merge_duplicates(store, [(dict(record), embedding) for record, embedding in batch]) == []
+
+    assert store.get(ids=["old"])["metadatas"][0]["occurrences"] == 2
+    assert store.get(ids=["b"])["metadatas"][0]["occurrences"] == 2
+
+
+def test_compaction_next_to_a_running_app_keeps_its_writes(tmp_path, monkeypatch):
+    app_store, job_store = VectorStore(str(tmp_path)), VectorStore(str(tmp_path))
+    monkeypatch.setattr(memory_compaction, "get_memories_collection", lambda chat_id: job_store)
+    app_store.add(ids=["x", "y"], embeddings=[[1, 0], [0.999, 0.04]], metadatas=[{"timestamp": "2024-01-01T00:00:00-03:00"}, {"timestamp": "2024-01-02T00:00:00-03:00"}])
+
+    assert memory_compaction.compact_user("42", retention_days=30, threshold=0.9, max_memories=0)[1] == 1
+    app_store.add(ids=["z"], embeddings=[[0, 1]])  # Still on the generation it loaded before the compaction
+
+    assert sorted(VectorStore(str(tmp_path)).get()["ids"]) == ["y", "z"]  # x merged into the more recent y
@@ -0,0 +1,71 @@
+from src.klaus.handlers import summary
+
+
+def _message(n):
+    return {"role": "user", "text": f"mensagem {n}", "timestamp": f"2025-06-01T10:{n:02d}:00"}
+
+
+def test_summary_is_updated_every_n_messages(monkeypatch):
+    updates = []
+
+    class InlineExecutor:
+        def submit(self, fn, *args):
+            fn(*args)
+
+    monkeypatch.setattr(summary, "SUMMARY_ENABLED", True)
+    monkeypatch.setattr(summary, "SUMMARY_EVERY_MESSAGES", 3)
+    monkeypatch.setattr(summary, "_summary_executor", InlineExecutor())
+    monkeypatch.setattr(summary, "update_summary", lambda chat_id: updates.append(chat_id) or {"text": "resumo"})
+    summary._pending.clear()
+
+    for _ in range(7):
+        summary.note_message("42")
+    assert updates == ["42", "42"]
+    assert summary._pending["42"] == 1
+
+
+def test_update_without_enough_messages_keeps_the_count(monkeypatch):
+    stored = []
+
+    class InlineExecutor:
+        def submit(self, fn, *args):
+            fn(*args)
+
+    def update_summary(chat_id):
+        # Firestore only has what was stored; the summary waits until it holds SUMMARY_EVERY_MESSAGES
+        return {"text": "resumo"} if len(stored) >= 3 else None
+
+    monkeypatch.setattr(summary, "SUMMARY_ENABLED", True)
+    monkeypatch.setattr(summary, "SUMMARY_EVERY_MESSAGES", 3)
+    monkeypatch.setattr(summary, "_summary_executor", InlineExecutor())
+    monkeypatch.setattr(summary, "update_summary", update_summary)
+    summary._pending.clear()
+
+    stored.extend([1, 2])
+    summary.note_saved_messages([{"chat_id": "42"}, {"chat_id": "42"}, {"chat_id": "42"}])
+    assert summary._pending["42"] == 3  # Nothing folded in, the count stands
+    stored.append(3)
+    summary.note_message("42")
+    assert summary._pending["42"] == 0
+
+
+def test_update_folds_new_messages_into_previous_summary(monkeypatch):
+    saved = {}
+    messages = [_message(n) for n in range(1, 4)]
+    monkeypatch.setattr(summary, "SUMMARY_EVERY_MESSAGES", 3)
+    monkeypatch.setattr(summary, "get_summary", lambda chat_id: {"text": "antes", "covered_until": "2025-06-01T10:00:00"})
+    monkeypatch.setattr(summary, "get_unsummarized_messages", lambda chat_id, covered_until, limit: messages if covered_until == "2025-06-01T10:00:00" else [])
+    monkeypatch.setattr(summary, "summarize_conversation", lambda previous, new: f"{previous} + {len(new)}")
+    monkeypatch.setattr(summary, "save_summary", lambda chat_id, text, covered_until: saved.update(text=text, covered_until=covered_until) or saved)
+
+    assert summary.update_summary("42") == {"text": "antes + 3", "covered_until": "2025-06-01T10:03:00"}
+
+
+def test_recent_history_keeps_uncovered_and_last_turns(monkeypatch):
+    monkeypatch.setattr(summary, "SUMMARY_RECENT_MESSAGES", 2)
+    history = [_message(n) for n in range(10, 0, -1)]  # newest first
+
+    kept = summary.recent_history(history, {"text": "resumo", "covered_until": "2025-06-01T10:06:00"})
+    assert [msg["text"] for msg in kept] == ["mensagem 10", "mensagem 9", "mensagem 8", "mensagem 7"]
+    assert summary.recent_history(history[:3], None) == history[:3]
+    assert len(summary.recent_history(history, {"text": "resumo", "covered_until": "2025-06-01T10:20:00"})) == 2
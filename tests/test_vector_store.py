@@ -0,0 +1,128 @@
+import numpy as np
+
+from src.klaus.data.vector_store import VectorStore
+
+
+def test_query_returns_nearest_documents_first(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add(
+        ids=["a", "b", "c"],
+        embeddings=[[1, 0, 0], [0, 1, 0], [0.9, 0.1, 0]],
+        documents=["leite", "reunião", "pão"],
+        metadatas=[{"n": 1}, {"n": 2}, {"n": 3}]
+    )
+
+    result = store.query(query_embeddings=[[2, 0, 0]], n_results=2)
+    assert result["ids"] == [["a", "c"]]
+    assert result["documents"] == [["leite", "pão"]]
+    assert np.isclose(result["distances"][0][0], 0)
+    assert store.query(query_embeddings=[[0, 1, 0]], n_results=10)["ids"][0][0] == "b"
+
+
+def test_upsert_delete_and_reopen(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add(ids=["a", "b"], embeddings=[[1, 0], [0, 1]], documents=["um", "dois"])
+    store.add(ids=["a"], embeddings=[[0, 1]], documents=["ignored"])
+    store.upsert(ids=["a"], embeddings=[[-1, 0]], documents=["um de novo"])
+    store.delete(ids=["b"])
+    store.add(ids=["c"], embeddings=[[1, 1]], documents=["três"])
+
+    reopened = VectorStore(str(tmp_path))
+    assert reopened.count() == 2
+    assert reopened.query(query_embeddings=[[-1, 0]], n_results=1)["documents"] == [["um de novo"]]
+    assert sorted(reopened.get()["documents"]) == ["três", "um de novo"]
+
+
+def test_compact_keeps_live_rows_only(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add(ids=["a", "b", "c"], embeddings=[[1, 0], [0, 1], [1, 1]], documents=["a", "b", "c"])
+    store.upsert(ids=["a"], embeddings=[[1, 0.1]], documents=["a2"])
+    store.delete(ids=["c"])
+
+    assert store.compact() == 2
+    assert store.query(query_embeddings=[[1, 0]], n_results=3)["documents"] == [["a2", "b"]]
+    assert VectorStore(str(tmp_path)).get()["documents"] == ["b", "a2"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["lock", "meta-1.jsonl", "vectors-1.f32"]
+
+
+def _nearest(store, embedding):
+    result = store.query(query_embeddings=[embedding], n_results=1)
+    return result["ids"][0][0], result["distances"][0][0]
+
+
+def test_two_instances_appending_to_one_store(tmp_path):
+    first, second = VectorStore(str(tmp_path)), VectorStore(str(tmp_path))  # Separate locks, like two processes
+    first.add(ids=["x", "y"], embeddings=[[1, 0, 0], [0, 1, 0]])
+    second.add(ids=["w"], embeddings=[[0, 0, 1]])
+    first.add(ids=["z"], embeddings=[[1, 1, 0]])
+
+    for store in (first, second, VectorStore(str(tmp_path))):
+        assert sorted(store.get()["ids"]) == ["w", "x", "y", "z"]
+        assert _nearest(store, [1, 1, 0])[0] == "z"
+        assert _nearest(store, [0, 0, 1])[0] == "w"
+
+
+def test_append_after_another_instance_compacted(tmp_path):
+    first, second = VectorStore(str(tmp_path)), VectorStore(str(tmp_path))
+    first.add(ids=["x", "y"], embeddings=[[1, 0], [0, 1]])
+    second.delete(ids=["y"])
+    second.compact()
+    first.add(ids=["z"], embeddings=[[1, 1]])
+
+    reopened = VectorStore(str(tmp_path))
+    assert sorted(reopened.get()["ids"]) == ["x", "z"]
+    assert _nearest(reopened, [1, 1])[0] == "z"
+
+
+def test_vectors_written_without_their_first_header_are_dropped(tmp_path):
+    (tmp_path / "vectors-0.f32").write_bytes(np.array([[0, 1]], dtype=np.float32).tobytes())  # Crash before the log
+    store = VectorStore(str(tmp_path))
+    store.add(ids=["a"], embeddings=[[1, 0]])
+
+    item_id, distance = _nearest(VectorStore(str(tmp_path)), [1, 0])
+    assert item_id == "a" and np.isclose(distance, 0)
+
+
+def test_metadata_past_the_end_of_the_vectors_is_dropped(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add(ids=["a", "b"], embeddings=[[1, 0], [0, 1]])
+    with open(tmp_path / "vectors-0.f32", "r+b") as vectors:
+        vectors.truncate(2 * 4)  # b's vector never reached the disk
+
+    reopened = VectorStore(str(tmp_path))
+    assert reopened.get()["ids"] == ["a"]
+    reopened.add(ids=["c"], embeddings=[[1, 1]])
+    for store in (reopened, VectorStore(str(tmp_path))):
+        assert sorted(store.get()["ids"]) == ["a", "c"]
+        assert _nearest(store, [1, 1])[0] == "c"
+
+
+def test_readers_leave_a_torn_tail_for_the_next_writer(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add(ids=["a", "b"], embeddings=[[1, 0], [0, 1]])
+    with open(tmp_path / "meta-0.jsonl", "ab") as meta:
+        meta.write(b'{"op": "add", "id": "c", "ro')  # A writer killed mid-record...
+    with open(tmp_path / "vectors-0.f32", "ab") as vectors:
+        vectors.write(b"\0\0\0")  # ... and mid-row
+    files = {p.name: p.read_bytes() for p in tmp_path.iterdir()}
+
+    reader = VectorStore(str(tmp_path))
+    assert reader.count() == 2
+    assert _nearest(reader, [0, 1])[0] == "b"
+    assert {p.name: p.read_bytes() for p in tmp_path.iterdir()} == files
+
+    reader.add(ids=["c"], embeddings=[[1, 1]])
+    for store in (reader, store, VectorStore(str(tmp_path))):
+        assert sorted(store.get()["ids"]) == ["a", "b", "c"]
+        assert _nearest(store, [1, 1])[0] == "c"
+
+
+def test_close_releases_the_lock_file(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add(ids=["a"], embeddings=[[1, 0]])
+    lock_file = store._lock_file
+    store.close()
+    assert lock_file.closed and store._lock_file is None
+
+    store.add(ids=["b"], embeddings=[[0, 1]])  # Still usable: the lock file is reopened
+    assert sorted(store.get()["ids"]) == ["a", "b"]
@@ -0,0 +1,60 @@
+import fcntl
+import json
+import os
+
+from src.klaus.data.write_behind import WriteBehindQueue
+
+
+def test_write_behind_flushes_in_batches_on_close(tmp_path):
+    batches = []
+    writer = WriteBehindQueue(batches.append, batch_size=10, flush_interval=0.05, spill_path=str(tmp_path / "spill.jsonl"))
+    for i in range(3):
+        writer.submit({"id": str(i), "text": f"message {i}"})
+    assert (tmp_path / f"spill.{os.getpid()}.jsonl").exists()
+    writer.close()
+
+    flushed = [record["id"] for batch in batches for record in batch]
+    assert flushed == ["0", "1", "2"]
+    assert not list(tmp_path.glob("spill.*.jsonl"))  # Nothing outstanding, nothing left behind
+
+
+def test_write_behind_replays_unacknowledged_records(tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+
+    def failing_flush(batch):
+        raise RuntimeError("firestore is down")
+
+    writer = WriteBehindQueue(failing_flush, flush_interval=0.05, spill_path=spill_path)
+    writer.submit({"id": "lost", "text": "não pode sumir"})
+    writer.close()
+
+    batches = []
+    restarted = WriteBehindQueue(batches.append, flush_interval=0.05, spill_path=spill_path)
+    restarted.submit({"id": "new", "text": "nova"})
+    restarted.close()
+
+    flushed = [record["id"] for batch in batches for record in batch]
+    assert flushed == ["lost", "new"]
+
+
+def test_write_behind_adopts_only_files_of_stopped_processes(tmp_path):
+    def spill(name, record_id):
+        path = tmp_path / name
+        path.write_text(json.dumps({"op": "put", "record": {"id": record_id}}) + "\n")
+        return path
+
+    stopped = spill("spill.11.jsonl", "orphan")
+    legacy = spill("spill.jsonl", "shared")
+    running = spill("spill.12.jsonl", "live")
+    with open(running) as held:
+        fcntl.flock(held, fcntl.LOCK_EX)  # Another worker still owns this one
+
+        batches = []
+        writer = WriteBehindQueue(batches.append, flush_interval=0.05, spill_path=str(tmp_path / "spill.jsonl"))
+        writer.submit({"id": "new"})
+        writer.close()
+
+    flushed = sorted(record["id"] for batch in batches for record in batch)
+    assert flushed == ["new", "orphan", "shared"]
+    assert not stopped.exists() and not legacy.exists()
+    assert "live" in running.read_text()